@@ -0,0 +1,445 @@
+from app.cache import TTLCache
+from app.metrics import register_cache, registry
+from app.schedule_table import MISSING_MINUTE, encode_minutes
+from app.training import DELAYED_AFTER_MINUTES
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import threading
+import tempfile
+import fcntl
+import shutil
+import json
+import io
+import os
+
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.dirname(__file__), "delay_archive")
+
+REQUIRED_COLUMNS = ("source", "destination", "scheduled_departure")
+# One .npy file per column in every partition
+PART_COLUMNS = {
+    "source": np.int32,
+    "destination": np.int32,
+    "departure": np.uint16,
+    "delay_minutes": np.float32,
+    "delayed": np.uint8
+}
+# Summed per group in every rollup; "measured" runs are those with a known delay in minutes
+STATS = ("runs", "delayed", "measured", "delay_minutes")
+REPORTS = ("station_hour", "corridors", "weekday")
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+ARCHIVED_ROWS = registry.counter(
+    "analytics_archived_rows_total", "Historical runs appended to the delay archive"
+)
+
+def _group(keys, stats):
+    """Sum `stats` rows that share a key; returns (sorted unique keys, summed stats)"""
+    uniques, inverse = np.unique(keys, return_inverse=True)
+    summed = np.column_stack([
+        np.bincount(inverse, weights=stats[:, i], minlength=len(uniques)) for i in range(stats.shape[1])
+    ]) if len(uniques) else np.zeros((0, stats.shape[1]))
+    return uniques, summed
+
+def _corridor_keys(source, destination):
+    return (source.astype(np.int64) << 32) | destination.astype(np.int64)
+
+class Rollup:
+    """
+    Pre-aggregated group-bys of archived runs, as sorted int64 keys plus a
+    (groups, len(STATS)) array per report:
+
+    - station_hour: source station code * 24 + departure hour
+    - corridors: source code << 32 | destination code
+    - weekday: 0 (Monday) .. 6
+
+    Rollups of disjoint sets of runs merge by summing, which is what keeps
+    appends and date-range queries cheap.
+    """
+
+    def __init__(self, groups):
+        self.groups = groups
+
+    @classmethod
+    def from_runs(cls, columns, weekday):
+        delay = columns["delay_minutes"].astype(float)
+        measured = ~np.isnan(delay)
+        stats = np.column_stack([
+            np.ones(len(delay)), columns["delayed"], measured, np.where(measured, delay, 0.0)
+        ])
+        hour = columns["departure"].astype(np.int64) // 60
+        return cls({
+            "station_hour": _group(columns["source"].astype(np.int64) * 24 + hour, stats),
+            "corridors": _group(_corridor_keys(columns["source"], columns["destination"]), stats),
+            "weekday": _group(np.full(len(delay), weekday, dtype=np.int64), stats)
+        })
+
+    @classmethod
+    def merge(cls, rollups):
+        rollups = list(rollups)
+        if not rollups:
+            return cls({report: (np.zeros(0, dtype=np.int64), np.zeros((0, len(STATS)))) for report in REPORTS})
+        return cls({
+            report: _group(
+                np.concatenate([r.groups[report][0] for r in rollups]),
+                np.concatenate([r.groups[report][1] for r in rollups])
+            )
+            for report in REPORTS
+        })
+
+    def save(self, path):
+        arrays = {}
+        for report, (keys, stats) in self.groups.items():
+            arrays[f"{report}_keys"] = keys
+            arrays[f"{report}_stats"] = stats
+        fd, tmp_path = tempfile.mkstemp(prefix=".rollup-", suffix=".npz", dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls({report: (arrays[f"{report}_keys"], arrays[f"{report}_stats"]) for report in REPORTS})
+
+def _rates(stats):
+    """(delay_rate, avg_delay_minutes) per group; the average is over runs with a known delay"""
+    runs, delayed, measured, minutes = stats.T
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = np.where(runs > 0, delayed / runs, 0.0)
+        average = np.where(measured > 0, minutes / measured, np.nan)
+    return rate, average
+
+def _worst_first(rate, average, runs, min_runs, limit):
+    """Row order: highest delay rate, then longest average delay, then most runs"""
+    keep = np.flatnonzero(runs >= min_runs)
+    order = np.lexsort((-runs[keep], -np.nan_to_num(average[keep], nan=-1.0), -rate[keep]))
+    return keep[order[:limit]]
+
+def _minutes(values):
+    return [None if np.isnan(v) else round(float(v), 1) for v in values]
+
+class DelayArchive:
+    """
+    Append-only archive of historical train runs, partitioned by service day.
+
+    <root>/stations.json                 station vocabulary; append-only, so codes stay valid
+    <root>/days/YYYY-MM-DD/part-NNNNNN/  one directory of .npy columns per append
+    <root>/rollups/YYYY-MM-DD.NNNNNN.npz that day's Rollup over its first NNNNNN parts
+    <root>/manifest.json                 {"version", "days": {day: {"parts", "runs"}}}
+
+    An append writes its parts, folds each part's rollup into its day's
+    rollup (other days are untouched) and then replaces the manifest,
+    which is what readers go by. Queries merge day rollups for the date
+    range and never read the raw parts; merged ranges are cached per
+    manifest version. One writer at a time across processes (a lock file
+    in the root), any number of readers.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.environ.get("DELAY_ARCHIVE_DIR", DEFAULT_ARCHIVE_DIR)
+        self._write_lock = threading.Lock()
+        # day -> (parts, Rollup) of its latest rollup, and (version, start, end) -> merged Rollup
+        self._day_rollups = {}
+        self._ranges = TTLCache(maxsize=64, ttl=3600.0)
+        self._manifest = None
+        self._manifest_stamp = None
+        self._stations = None
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def _rollup_path(self, day, parts):
+        return self._path("rollups", f"{day}.{parts:06d}.npz")
+
+    def manifest(self):
+        """Current manifest, re-read only when the file changes"""
+        try:
+            stat = os.stat(self._path("manifest.json"))
+        except FileNotFoundError:
+            return {"version": 0, "days": {}}
+        # Every write is an os.replace, so a new inode marks a change even within one mtime tick
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp != self._manifest_stamp:
+            with open(self._path("manifest.json")) as f:
+                manifest = json.load(f)
+            with open(self._path("stations.json")) as f:
+                self._stations = json.load(f)
+            self._manifest, self._manifest_stamp = manifest, stamp
+        return self._manifest
+
+    def stations(self):
+        self.manifest()
+        return self._stations or []
+
+    @contextmanager
+    def _exclusive(self):
+        """Writer lock within this process and, via a lock file in the root, across processes"""
+        with self._write_lock:
+            os.makedirs(self.root, exist_ok=True)
+            with open(self._path(".lock"), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _write_json(self, name, value):
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{name}-", dir=self.root)
+        with os.fdopen(fd, "w") as f:
+            json.dump(value, f)
+        os.replace(tmp_path, self._path(name))
+
+    def _encode(self, frame, date):
+        """Valid rows of `frame` as (day labels, part columns); also returns the new vocabulary"""
+        n = len(frame)
+        dates = pd.to_datetime(frame["date"] if "date" in frame else pd.Series([date] * n), errors="coerce")
+        departure = encode_minutes(frame["scheduled_departure"])
+        valid = (~dates.isna().to_numpy()) & (departure != MISSING_MINUTE)
+        for column in ("source", "destination"):
+            valid &= frame[column].notna().to_numpy()
+        frame, dates, departure = frame[valid], dates[valid], departure[valid]
+
+        vocabulary = pd.Index(self.stations())
+        endpoints = [frame[c].astype(str) for c in ("source", "destination")]
+        seen = pd.unique(pd.concat(endpoints, ignore_index=True))
+        vocabulary = vocabulary.append(pd.Index(seen[~pd.Index(seen).isin(vocabulary)]))
+
+        if "delay_minutes" in frame:
+            delay = pd.to_numeric(frame["delay_minutes"], errors="coerce").to_numpy(dtype=float)
+        else:
+            delay = np.full(len(frame), np.nan)
+        status_delayed = (frame["status"] == "Delayed").to_numpy() if "status" in frame else np.zeros(len(frame), bool)
+        delayed = np.where(np.isnan(delay), status_delayed, delay > DELAYED_AFTER_MINUTES)
+
+        day_codes, days = pd.factorize(dates.dt.normalize())
+        days = [day.strftime("%Y-%m-%d") for day in days]
+        columns = {
+            "source": vocabulary.get_indexer(endpoints[0].to_numpy()),
+            "destination": vocabulary.get_indexer(endpoints[1].to_numpy()),
+            "departure": departure,
+            "delay_minutes": delay,
+            "delayed": delayed
+        }
+        return day_codes, days, columns, list(vocabulary), int(n - valid.sum())
+
+    def _write_part(self, day, columns):
+        day_dir = self._path("days", day)
+        os.makedirs(day_dir, exist_ok=True)
+        existing = sorted(p for p in os.listdir(day_dir) if p.startswith("part-"))
+        number = int(existing[-1][len("part-"):]) + 1 if existing else 1
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=day_dir)
+        try:
+            for name, dtype in PART_COLUMNS.items():
+                np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(columns[name], dtype=dtype))
+            os.rename(staging, os.path.join(day_dir, f"part-{number:06d}"))
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return number
+
+    def append(self, frame, date=None):
+        """
+        Archive historical runs. Rows need source, destination and an HH:MM
+        scheduled_departure, plus a `date` column unless `date` is given;
+        delay_minutes and/or status say whether the run was delayed. Rows
+        missing any of these are counted as invalid and skipped.
+        """
+        missing = [c for c in REQUIRED_COLUMNS if c not in frame]
+        if "date" not in frame and date is None:
+            missing.append("date")
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+        with self._exclusive():
+            os.makedirs(self._path("rollups"), exist_ok=True)
+            day_codes, days, columns, vocabulary, invalid = self._encode(frame, date)
+            manifest = self.manifest()
+            entries = dict(manifest["days"])
+            for i, day in enumerate(days):
+                rows = np.flatnonzero(day_codes == i)
+                part = {name: values[rows] for name, values in columns.items()}
+                parts = self._write_part(day, part)
+                rollup = Rollup.from_runs(part, pd.Timestamp(day).weekday())
+                if day in entries:
+                    rollup = Rollup.merge([self._day_rollup(day, entries[day]["parts"]), rollup])
+                rollup.save(self._rollup_path(day, parts))
+                self._day_rollups[day] = (parts, rollup)
+                entries[day] = {"parts": parts, "runs": int(rollup.groups["weekday"][1][:, 0].sum())}
+
+            # The vocabulary only grows, so it is safe to publish before the manifest
+            self._write_json("stations.json", vocabulary)
+            self._write_json("manifest.json", {"version": manifest["version"] + 1, "days": entries})
+            # Readers of the previous manifest may still load the rollup before this one
+            for day in days:
+                if entries[day]["parts"] > 2:
+                    try:
+                        os.remove(self._rollup_path(day, entries[day]["parts"] - 2))
+                    except FileNotFoundError:
+                        pass
+        return {
+            "rows_read": int(len(frame)),
+            "rows_archived": int(len(day_codes)),
+            "rows_invalid": invalid,
+            "days": sorted(days),
+            "version": manifest["version"] + 1
+        }
+
+    def append_csv(self, data, date=None):
+        """append() for raw CSV bytes"""
+        return self.append(pd.read_csv(io.BytesIO(data)), date)
+
+    def _day_rollup(self, day, parts):
+        """A day's rollup over its first `parts` parts; only the latest one per day stays cached"""
+        cached = self._day_rollups.get(day)
+        if cached is not None and cached[0] == parts:
+            return cached[1]
+        rollup = Rollup.load(self._rollup_path(day, parts))
+        # A reader of an older manifest must not push out the newer rollup
+        if cached is None or cached[0] < parts:
+            self._day_rollups[day] = (parts, rollup)
+        return rollup
+
+    def _days(self, start=None, end=None):
+        """Archived days within [start, end] (YYYY-MM-DD, inclusive), oldest first"""
+        start = pd.Timestamp(start).strftime("%Y-%m-%d") if start else None
+        end = pd.Timestamp(end).strftime("%Y-%m-%d") if end else None
+        return [
+            day for day in sorted(self.manifest()["days"])
+            if (start is None or day >= start) and (end is None or day <= end)
+        ]
+
+    def rollup(self, start=None, end=None):
+        """Merged Rollup of the archived days in [start, end]; cached until the next append"""
+        manifest = self.manifest()
+        days = self._days(start, end)
+        key = (manifest["version"], days[0] if days else None, days[-1] if days else None)
+        return self._ranges.get_or_compute(key, lambda: Rollup.merge(
+            self._day_rollup(day, manifest["days"][day]["parts"]) for day in days
+        )), days
+
+    def read_part(self, day, part):
+        """Raw columns of one partition, memory-mapped"""
+        path = self._path("days", day, f"part-{part:06d}")
+        return {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in PART_COLUMNS}
+
+    def rebuild_rollups(self):
+        """
+        Recompute every day's rollup from its raw parts (after a rollup
+        format change); other running workers pick them up on restart
+        """
+        with self._exclusive():
+            manifest = self.manifest()
+            for day, entry in manifest["days"].items():
+                weekday = pd.Timestamp(day).weekday()
+                rollup = Rollup.merge(
+                    Rollup.from_runs(self.read_part(day, part), weekday) for part in range(1, entry["parts"] + 1)
+                )
+                rollup.save(self._rollup_path(day, entry["parts"]))
+                self._day_rollups[day] = (entry["parts"], rollup)
+            self._write_json("manifest.json", {**manifest, "version": manifest["version"] + 1})
+
+    def _range(self, days):
+        return {"start": days[0] if days else None, "end": days[-1] if days else None, "days": len(days)}
+
+    def summary(self):
+        rollup, days = self.rollup()
+        runs, delayed = rollup.groups["weekday"][1][:, :2].sum(axis=0).tolist() if days else (0, 0)
+        return {
+            **self._range(days),
+            "version": self.manifest()["version"],
+            "runs": int(runs),
+            "on_time_pct": round(100.0 * (1 - delayed / runs), 1) if runs else None,
+            "stations": len(self.stations()),
+            "reports": list(REPORTS)
+        }
+
+    def station_hour(self, start=None, end=None, stations=None, min_runs=1, limit=100):
+        """Delay rate by departure station and hour, worst first"""
+        rollup, days = self.rollup(start, end)
+        keys, stats = rollup.groups["station_hour"]
+        station, hour = keys // 24, keys % 24
+        if stations:
+            codes = pd.Index(self.stations()).get_indexer(list(stations))
+            keep = np.isin(station, codes[codes >= 0])
+            station, hour, stats = station[keep], hour[keep], stats[keep]
+        rate, average = _rates(stats)
+        rows = _worst_first(rate, average, stats[:, 0], min_runs, limit)
+        names = np.asarray(self.stations(), dtype=object)
+        return {**self._range(days), "rows": [
+            {"station": s, "hour": h, "runs": r, "delayed": d, "delay_rate": round(p, 3), "avg_delay_minutes": a}
+            for s, h, r, d, p, a in zip(
+                names[station[rows]].tolist(), hour[rows].tolist(), stats[rows, 0].astype(int).tolist(),
+                stats[rows, 1].astype(int).tolist(), rate[rows].tolist(), _minutes(average[rows])
+            )
+        ]}
+
+    def corridors(self, start=None, end=None, stations=None, min_runs=1, limit=10):
+        """Worst source -> destination corridors by delay rate, then average delay"""
+        rollup, days = self.rollup(start, end)
+        keys, stats = rollup.groups["corridors"]
+        source, destination = keys >> 32, keys & 0xFFFFFFFF
+        if stations:
+            codes = pd.Index(self.stations()).get_indexer(list(stations))
+            codes = codes[codes >= 0]
+            keep = np.isin(source, codes) | np.isin(destination, codes)
+            source, destination, stats = source[keep], destination[keep], stats[keep]
+        rate, average = _rates(stats)
+        rows = _worst_first(rate, average, stats[:, 0], min_runs, limit)
+        names = np.asarray(self.stations(), dtype=object)
+        return {**self._range(days), "rows": [
+            {"source": s, "destination": t, "runs": r, "delayed": d, "delay_rate": round(p, 3), "avg_delay_minutes": a}
+            for s, t, r, d, p, a in zip(
+                names[source[rows]].tolist(), names[destination[rows]].tolist(),
+                stats[rows, 0].astype(int).tolist(), stats[rows, 1].astype(int).tolist(),
+                rate[rows].tolist(), _minutes(average[rows])
+            )
+        ]}
+
+    def weekday(self, start=None, end=None, stations=None, min_runs=1, limit=None):
+        """On-time percentage by weekday, Monday first (station filters do not apply)"""
+        rollup, days = self.rollup(start, end)
+        keys, stats = rollup.groups["weekday"]
+        rate, average = _rates(stats)
+        return {**self._range(days), "rows": [
+            {"weekday": WEEKDAYS[k], "runs": r, "on_time_pct": round(100.0 * (1 - p), 1), "avg_delay_minutes": a}
+            for k, r, p, a in zip(keys.tolist(), stats[:, 0].astype(int).tolist(), rate.tolist(), _minutes(average))
+            if r >= min_runs
+        ]}
+
+    def report(self, name, **query):
+        if name not in REPORTS:
+            raise KeyError(name)
+        return getattr(self, name)(**query)
+
+_delay_archive = None
+_delay_archive_lock = threading.Lock()
+
+def get_delay_archive():
+    global _delay_archive
+    if _delay_archive is None:
+        with _delay_archive_lock:
+            if _delay_archive is None:
+                _delay_archive = DelayArchive()
+                register_cache("analytics", _delay_archive._ranges)
+    return _delay_archive
+
+def archive_csv(data, date=None):
+    """Append raw CSV bytes to this process's delay archive; picklable for the process pool"""
+    return get_delay_archive().append_csv(data, date)
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("archive", "rebuild"):
+        print("usage: python -m app.analytics archive HISTORY.csv|.parquet [YYYY-MM-DD]")
+        print("       python -m app.analytics rebuild")
+        sys.exit(1)
+    archive = get_delay_archive()
+    if sys.argv[1] == "rebuild":
+        archive.rebuild_rollups()
+        print(f"Rebuilt rollups for {len(archive.manifest()['days'])} days")
+    else:
+        path = sys.argv[2]
+        frame = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
+        print(archive.append(frame, sys.argv[3] if len(sys.argv) > 3 else None))
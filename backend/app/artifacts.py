@@ -0,0 +1,110 @@
+from app.compiled_forest import CompiledForest
+from datetime import datetime
+import joblib
+import json
+import os
+import shutil
+import tempfile
+
+DEFAULT_ARTIFACT_DIR = os.path.join(os.path.dirname(__file__), "model_store")
+
+class ModelArtifactStore:
+    """
+    Versioned on-disk store for trained delay models.
+
+    Each version is a directory v000001/, v000002/, ... holding the model
+    and label encoders (joblib, uncompressed so NumPy arrays can be
+    memory-mapped), the flattened CompiledForest arrays when given, and
+    metadata.json. A LATEST file names the current version. Versions are
+    written to a temp directory and renamed into place, and LATEST is
+    replaced atomically, so readers never see a partial artifact.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.environ.get("MODEL_ARTIFACT_DIR", DEFAULT_ARTIFACT_DIR)
+
+    def _version_dir(self, version):
+        return os.path.join(self.root, f"v{version:06d}")
+
+    def _latest_path(self):
+        return os.path.join(self.root, "LATEST")
+
+    def versions(self):
+        """All published versions, oldest first"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            int(name[1:]) for name in os.listdir(self.root)
+            if name.startswith("v") and name[1:].isdigit()
+        )
+
+    def latest_version(self):
+        """Version named by LATEST, or None if nothing is published"""
+        try:
+            with open(self._latest_path()) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def latest_mtime(self):
+        try:
+            return os.path.getmtime(self._latest_path())
+        except FileNotFoundError:
+            return None
+
+    def save(self, model, label_encoders, metadata=None, publish=True, compiled=None):
+        """Write a new version; optionally point LATEST at it. Returns the version."""
+        os.makedirs(self.root, exist_ok=True)
+        versions = self.versions()
+        version = versions[-1] + 1 if versions else 1
+
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=self.root)
+        try:
+            joblib.dump(model, os.path.join(staging, "model.joblib"))
+            joblib.dump(label_encoders, os.path.join(staging, "label_encoders.joblib"))
+            if compiled is not None:
+                compiled.save(os.path.join(staging, "compiled"))
+            with open(os.path.join(staging, "metadata.json"), "w") as f:
+                json.dump({
+                    "version": version,
+                    "created_at": datetime.now().isoformat(timespec="seconds"),
+                    **(metadata or {})
+                }, f, indent=2)
+            os.rename(staging, self._version_dir(version))
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        if publish:
+            self.publish(version)
+        return version
+
+    def publish(self, version):
+        """Atomically point LATEST at an existing version"""
+        if not os.path.isdir(self._version_dir(version)):
+            raise FileNotFoundError(f"Model version {version} not found")
+        fd, tmp_path = tempfile.mkstemp(prefix=".latest-", dir=self.root)
+        with os.fdopen(fd, "w") as f:
+            f.write(str(version))
+        os.replace(tmp_path, self._latest_path())
+
+    def load(self, version=None, mmap=True):
+        """Load (model, label_encoders, metadata) for a version (default: LATEST)"""
+        version = version if version is not None else self.latest_version()
+        if version is None:
+            raise FileNotFoundError("No published model version")
+        path = self._version_dir(version)
+        mmap_mode = "r" if mmap else None
+        model = joblib.load(os.path.join(path, "model.joblib"), mmap_mode=mmap_mode)
+        label_encoders = joblib.load(os.path.join(path, "label_encoders.joblib"))
+        with open(os.path.join(path, "metadata.json")) as f:
+            metadata = json.load(f)
+        return model, label_encoders, metadata
+
+    def load_compiled(self, version=None, mmap=True):
+        """Memory-map a version's CompiledForest, or None if it has none"""
+        version = version if version is not None else self.latest_version()
+        path = os.path.join(self._version_dir(version), "compiled")
+        if not os.path.isdir(path):
+            return None
+        return CompiledForest.load(path, mmap=mmap)
@@ -0,0 +1,455 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlparse
+import logging
+import json
+import socket
+import threading
+import time
+import uuid
+import os
+
+logger = logging.getLogger(__name__)
+
+# "local" keeps each cache in the worker; "redis" shares it through CACHE_URL
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "local")
+CACHE_URL = os.environ.get("CACHE_URL", "redis://127.0.0.1:6379/0")
+CACHE_POOL_SIZE = int(os.environ.get("CACHE_POOL_SIZE", "16"))
+CACHE_KEY_PREFIX = os.environ.get("CACHE_KEY_PREFIX", "stc")
+CACHE_TIMEOUT_SECONDS = 0.5
+# After a failed call the shared backend is skipped (all misses) this long
+CACHE_RETRY_SECONDS = 5.0
+# A worker computing a shared key holds a lock this long; others wait for its value
+FLIGHT_LOCK_MS = 10000
+FLIGHT_POLL_SECONDS = 0.02
+
+_MISSING = object()
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one: the first caller
+    computes, the rest wait for and share its result (or its exception).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "result": None, "error": None}
+            else:
+                self.shared += 1
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+        try:
+            call["result"] = fn()
+            return call["result"]
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+
+    Tracks hits, misses, expirations and evictions for hit-rate reporting.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self._flights = SingleFlight()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def _lookup(self, key):
+        """Live value for `key` or _MISSING, dropping it if expired; no hit/miss counted. Hold self._lock"""
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_many(self, keys):
+        """Values for `keys` in order, None where missing"""
+        return [self.get(key) for key in keys]
+
+    def set_many(self, items):
+        for key, value in items:
+            self.set(key, value)
+
+    def get_or_compute(self, key, compute):
+        """Cached value, or compute() it once however many callers miss together"""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        def load():
+            # Another caller may have filled it since the miss above, which is already counted
+            with self._lock:
+                value = self._lookup(key)
+            if value is _MISSING:
+                value = compute()
+                self.set(key, value)
+            return value
+        return self._flights.do(key, load)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Counters and hit rate since start"""
+        lookups = self.hits + self.misses
+        return {
+            "backend": "local",
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "single_flight_shared": self._flights.shared
+        }
+
+class CacheUnavailable(Exception):
+    """Raised when the shared cache cannot be reached or answers with an error"""
+
+def _encode_command(args):
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+class _Connection:
+    """One RESP (Redis protocol) socket connection"""
+
+    def __init__(self, host, port, db=0, timeout=CACHE_TIMEOUT_SECONDS):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+        if db:
+            self.send([("SELECT", db)])
+            self.read()
+
+    def send(self, commands):
+        """Write several commands in one go; replies are read back in order"""
+        self.sock.sendall(b"".join(_encode_command(args) for args in commands))
+
+    def read(self):
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise CacheUnavailable("Connection closed")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            # Returned, not raised, so the rest of a pipeline is still read
+            return CacheUnavailable(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            size = int(payload)
+            if size < 0:
+                return None
+            data = self.reader.read(size + 2)
+            return data[:-2]
+        if kind == b"*":
+            size = int(payload)
+            return None if size < 0 else [self.read() for _ in range(size)]
+        raise CacheUnavailable(f"Unexpected reply {line!r}")
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+class ConnectionPool:
+    """
+    Reuses up to `max_connections` connections to one server. Callers wait
+    up to `timeout` seconds for a free one. A forked worker starts with an
+    empty pool rather than sharing its parent's sockets.
+    """
+
+    def __init__(self, url=CACHE_URL, max_connections=CACHE_POOL_SIZE, timeout=CACHE_TIMEOUT_SECONDS):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.created = 0
+
+    @contextmanager
+    def connection(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                self._idle, self._pid = [], os.getpid()
+                self._slots = threading.BoundedSemaphore(self.max_connections)
+        slots = self._slots
+        if not slots.acquire(timeout=self.timeout):
+            raise CacheUnavailable("Connection pool exhausted")
+        conn = None
+        try:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                try:
+                    conn = _Connection(self.host, self.port, self.db, self.timeout)
+                except OSError as e:
+                    raise CacheUnavailable(str(e))
+                self.created += 1
+            yield conn
+            with self._lock:
+                self._idle.append(conn)
+            conn = None
+        except OSError as e:
+            raise CacheUnavailable(str(e))
+        finally:
+            # A connection that failed mid-reply may hold unread data; drop it
+            if conn is not None:
+                conn.close()
+            slots.release()
+
+class RespClient:
+    """Minimal pooled client for the Redis commands the cache layer needs"""
+
+    def __init__(self, pool=None):
+        self.pool = pool or ConnectionPool()
+
+    def pipeline(self, commands):
+        """Send all commands in one write and read the replies, in order"""
+        if not commands:
+            return []
+        with self.pool.connection() as conn:
+            conn.send(commands)
+            replies = [conn.read() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, CacheUnavailable):
+                raise reply
+        return replies
+
+    def execute(self, *args):
+        return self.pipeline([args])[0]
+
+    def ping(self):
+        return self.execute("PING") == "PONG"
+
+    def get(self, key):
+        return self.execute("GET", key)
+
+    def mget(self, keys):
+        return self.execute("MGET", *keys) if keys else []
+
+    def set(self, key, value, px=None, nx=False):
+        args = ["SET", key, value]
+        if px is not None:
+            args += ["PX", int(px)]
+        if nx:
+            args.append("NX")
+        return self.execute(*args) == "OK"
+
+    def delete(self, *keys):
+        return self.execute("DEL", *keys) if keys else 0
+
+    def scan_iter(self, match=None, count=1000):
+        cursor = "0"
+        while True:
+            args = ["SCAN", cursor, "COUNT", count] + (["MATCH", match] if match else [])
+            cursor, keys = self.execute(*args)
+            cursor = cursor.decode()
+            yield from keys
+            if cursor == "0":
+                return
+
+def _dumps(value):
+    return json.dumps(value, separators=(",", ":")).encode()
+
+def _loads(raw):
+    return json.loads(raw)
+
+class SharedCache:
+    """
+    Cache held in a Redis-protocol server, shared by every worker and
+    replica. Same interface and counters as TTLCache.
+
+    Keys are namespaced by `prefix` and values stored as JSON (never
+    pickle, so whoever can write to the server cannot run code in the
+    workers; tuples come back as lists); entries expire
+    after `ttl` seconds on the server. get_many is one MGET round trip and
+    set_many one pipelined write. get_or_compute is single-flight within
+    the worker and across workers (a short NX lock key), so a burst of
+    misses on one key computes it once. When the server is unreachable,
+    lookups are misses and writes are dropped for CACHE_RETRY_SECONDS.
+    """
+
+    def __init__(self, client, prefix, ttl=60.0, maxsize=None):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # Expiry and eviction happen on the server
+        self.expirations = 0
+        self.evictions = 0
+        self.errors = 0
+        self._down_until = 0.0
+        self._flights = SingleFlight()
+
+    def _key(self, key):
+        return f"{self.prefix}:{key!r}"
+
+    def _call(self, fn, *args, default=None):
+        if time.monotonic() < self._down_until:
+            return default
+        try:
+            return fn(*args)
+        except CacheUnavailable as e:
+            self.errors += 1
+            if self._down_until == 0.0:
+                logger.warning(f"Shared cache {self.prefix} unavailable: {str(e)}")
+            self._down_until = time.monotonic() + CACHE_RETRY_SECONDS
+            return default
+
+    def _count(self, values):
+        found = sum(value is not None for value in values)
+        self.hits += found
+        self.misses += len(values) - found
+
+    def get(self, key, default=None):
+        raw = self._call(self.client.get, self._key(key))
+        self._count([raw])
+        return default if raw is None else _loads(raw)
+
+    def get_many(self, keys):
+        raws = self._call(self.client.mget, [self._key(key) for key in keys], default=[None] * len(keys))
+        self._count(raws)
+        return [None if raw is None else _loads(raw) for raw in raws]
+
+    def set(self, key, value):
+        self._call(self.client.set, self._key(key), _dumps(value), self.ttl * 1000)
+
+    def set_many(self, items):
+        commands = [("SET", self._key(key), _dumps(value), "PX", int(self.ttl * 1000))
+                    for key, value in items]
+        self._call(self.client.pipeline, commands)
+
+    def get_or_compute(self, key, compute):
+        """Cached value, or compute() it once across concurrent callers and workers"""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        return self._flights.do(key, lambda: self._load(key, compute))
+
+    def _load(self, key, compute):
+        lock_key = self._key(key) + ":lock"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + FLIGHT_LOCK_MS / 1000
+        while not self._call(self.client.set, lock_key, token, FLIGHT_LOCK_MS, True, default=True):
+            # Another worker is computing it: wait for its value, up to the lock's lifetime
+            time.sleep(FLIGHT_POLL_SECONDS)
+            raw = self._call(self.client.get, self._key(key))
+            if raw is not None:
+                return _loads(raw)
+            if time.monotonic() >= deadline:
+                break
+        try:
+            value = compute()
+            self.set(key, value)
+            return value
+        finally:
+            self._call(self.client.delete, lock_key)
+
+    def clear(self):
+        """Delete every key under this cache's prefix"""
+        def delete_all():
+            batch = []
+            for key in self.client.scan_iter(match=f"{self.prefix}:*"):
+                batch.append(key)
+                if len(batch) >= 1000:
+                    self.client.delete(*batch)
+                    batch = []
+            self.client.delete(*batch)
+        self._call(delete_all)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": "redis",
+            "prefix": self.prefix,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "single_flight_shared": self._flights.shared,
+            "pool_connections": self.client.pool.created
+        }
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_cache_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = RespClient(ConnectionPool(CACHE_URL))
+    return _client
+
+def make_cache(name, maxsize=10000, ttl=60.0, backend=None):
+    """A cache from the configured backend: in-process TTLCache or SharedCache"""
+    if (backend or CACHE_BACKEND) == "redis":
+        return SharedCache(get_cache_client(), f"{CACHE_KEY_PREFIX}:{name}", ttl=ttl, maxsize=maxsize)
+    return TTLCache(maxsize=maxsize, ttl=ttl)
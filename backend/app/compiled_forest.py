@@ -0,0 +1,133 @@
+import numpy as np
+import os
+
+ARRAY_NAMES = ("feature", "threshold", "left", "right", "leaf_value", "roots")
+
+def _normalizes_leaf_values():
+    """
+    Whether DecisionTreeClassifier.predict_proba divides tree_.value by its
+    row sum: before scikit-learn 1.4 it holds weighted counts, from 1.4 on it
+    holds the class fractions themselves and they are returned as they are
+    """
+    # Only called with a fitted forest, so this does not add sklearn to app start-up
+    import sklearn
+    major, minor = (int(part) for part in sklearn.__version__.split(".")[:2])
+    return (major, minor) < (1, 4)
+
+class CompiledForest:
+    """
+    Flattened tree ensemble evaluated with plain NumPy.
+
+    All trees of a fitted RandomForestClassifier are packed into shared
+    node arrays (feature, threshold, left/right child) addressed by global
+    node id, with `roots` giving each tree's root. Leaves point to
+    themselves, so a (tree, row) pair is done once a step leaves it in place.
+    `leaf_value` holds each node's class probabilities normalized the way
+    sklearn's trees do, and the per-tree results are summed in tree order
+    before dividing by the tree count, so outputs are bit-for-bit equal to
+    RandomForestClassifier.predict_proba.
+    """
+
+    def __init__(self, feature, threshold, left, right, leaf_value, roots, max_depth, classes):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.leaf_value = leaf_value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.classes_ = np.asarray(classes)
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        """Export a fitted RandomForestClassifier (single output)"""
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        normalize = _normalizes_leaf_values()
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            node_ids = np.arange(n_nodes, dtype=np.int64)
+            is_leaf = tree.children_left == -1
+
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int64))
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold).astype(np.float64))
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+
+            # Same normalization as DecisionTreeClassifier.predict_proba
+            proba = tree.value[:, 0, :].astype(np.float64)
+            if normalize:
+                normalizer = proba.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                proba = proba / normalizer
+            values.append(proba)
+
+            roots.append(offset)
+            offset += n_nodes
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            np.concatenate(features), np.concatenate(thresholds),
+            np.concatenate(lefts), np.concatenate(rights),
+            np.concatenate(values), np.asarray(roots, dtype=np.int64),
+            max_depth, forest.classes_
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def apply(self, X):
+        """Leaf node id reached in every tree: shape (n_trees, n_rows)"""
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        n_rows = len(X)
+        node = np.repeat(self.roots, n_rows)
+        row = np.tile(np.arange(n_rows), self.n_trees)
+        X_flat = X.ravel()
+        n_features = X.shape[1]
+
+        # Only (tree, row) pairs still at an internal node take another step
+        active = np.arange(len(node))
+        for _ in range(self.max_depth):
+            current = node[active]
+            go_left = X_flat[row[active] * n_features + self.feature[current]] <= self.threshold[current]
+            nxt = np.where(go_left, self.left[current], self.right[current])
+            node[active] = nxt
+            active = active[nxt != current]
+            if len(active) == 0:
+                break
+        return node.reshape(self.n_trees, n_rows)
+
+    def predict_proba(self, X):
+        """Class probabilities, shape (n_rows, n_classes)"""
+        leaves = self.apply(X)
+        # cumsum adds strictly in tree order, matching sklearn's accumulation
+        per_tree = self.leaf_value[leaves]
+        total = np.cumsum(per_tree, axis=0)[-1]
+        return total / self.n_trees
+
+    def save(self, path):
+        """Write the arrays as .npy files so they can be memory-mapped"""
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        np.save(os.path.join(path, "classes.npy"), self.classes_)
+        np.save(os.path.join(path, "max_depth.npy"), np.asarray(self.max_depth))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        mmap_mode = "r" if mmap else None
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in ARRAY_NAMES
+        }
+        return cls(
+            max_depth=np.load(os.path.join(path, "max_depth.npy")),
+            classes=np.load(os.path.join(path, "classes.npy"), allow_pickle=True),
+            **arrays
+        )
@@ -0,0 +1,127 @@
+from app.metrics import record_search
+import numpy as np
+import pandas as pd
+
+MINUTES_PER_DAY = 24 * 60
+
+class ConnectionIndex:
+    """
+    Timetable connections (one per scheduled train) for departure lookups
+    and Connection Scan journeys.
+
+    The daily schedule is laid out for two consecutive days so searches
+    that start late in the evening see the next morning's trains. Two
+    orderings are kept:
+    - by (station, departure minute), so the departures from one station in
+      a time window are a contiguous slice found by binary search;
+    - by departure minute, the order the Connection Scan Algorithm walks.
+    """
+
+    def __init__(self, stations, source, destination, departure_minutes, arrival_minutes):
+        # Station ids are the schedule's codes, which match RailNetwork ids
+        self.stations = pd.Index(stations)
+        self.station_index = {station: i for i, station in enumerate(stations)}
+
+        valid = (departure_minutes >= 0) & (arrival_minutes >= 0)
+        rows = np.nonzero(valid)[0]
+        dep = departure_minutes[rows].astype(np.int64)
+        arr = arrival_minutes[rows].astype(np.int64)
+        # Arrivals earlier than departure run past midnight
+        arr = np.where(arr < dep, arr + MINUTES_PER_DAY, arr)
+        src = np.asarray(source)[rows]
+        dst = np.asarray(destination)[rows]
+
+        self.row = np.concatenate([rows, rows]).astype(np.int32)
+        self.dep = np.concatenate([dep, dep + MINUTES_PER_DAY]).astype(np.int32)
+        self.arr = np.concatenate([arr, arr + MINUTES_PER_DAY]).astype(np.int32)
+        self.src = np.concatenate([src, src]).astype(np.int32)
+        self.dst = np.concatenate([dst, dst]).astype(np.int32)
+
+        # (station, departure) ordering for window lookups
+        self._station_keys = self.src.astype(np.int64) * (2 * MINUTES_PER_DAY) + self.dep
+        self._by_station = np.argsort(self._station_keys, kind="stable")
+        self._station_keys = self._station_keys[self._by_station]
+
+        # Departure ordering for connection scans
+        self._by_departure = np.argsort(self.dep, kind="stable")
+        self._dep_sorted = self.dep[self._by_departure]
+        self._scan = None
+
+    def _scan_lists(self):
+        """Departure-ordered columns as Python lists, built on the first scan"""
+        if self._scan is None:
+            self._scan = (
+                self.src[self._by_departure].tolist(), self.dst[self._by_departure].tolist(),
+                self._dep_sorted.tolist(), self.arr[self._by_departure].tolist(),
+                self._by_departure.tolist()
+            )
+        return self._scan
+
+    def departures(self, station, start, end):
+        """Connection ids leaving `station` with start <= departure <= end (minutes), by departure"""
+        code = self.station_index.get(station)
+        if code is None:
+            return np.zeros(0, dtype=np.int64)
+        base = code * (2 * MINUTES_PER_DAY)
+        lo = np.searchsorted(self._station_keys, base + start, side="left")
+        hi = np.searchsorted(self._station_keys, base + end, side="right")
+        return self._by_station[lo:hi]
+
+    def departures_along(self, path, start, end):
+        """
+        Connections leaving a station of `path` within the window and
+        arriving at a later station of the same path, ordered by arrival.
+        """
+        position = {self.station_index[s]: i for i, s in enumerate(path) if s in self.station_index}
+        found = []
+        for i, station in enumerate(path[:-1]):
+            for c in self.departures(station, start, end):
+                later = position.get(int(self.dst[c]))
+                if later is not None and later > i:
+                    found.append(int(c))
+        return sorted(found, key=lambda c: (self.arr[c], self.dep[c]))
+
+    def earliest_arrival(self, source, target, depart_after, min_transfer=5, horizon=MINUTES_PER_DAY):
+        """
+        Connection Scan Algorithm: the earliest-arriving journey from source
+        to target leaving at or after `depart_after` (minutes since midnight).
+        Returns the list of connection ids (legs), or [] if none within horizon.
+        """
+        s = self.station_index.get(source)
+        t = self.station_index.get(target)
+        if s is None or t is None or s == t:
+            return []
+
+        src, dst, dep, arr, ids = self._scan_lists()
+        earliest = {s: depart_after}
+        arrived_by = {}
+        start = int(np.searchsorted(self._dep_sorted, depart_after, side="left"))
+        limit = depart_after + horizon
+        scanned = 0
+        for k in range(start, len(dep)):
+            if dep[k] > limit or dep[k] >= earliest.get(t, float("inf")):
+                break
+            scanned += 1
+            u = src[k]
+            ready = earliest.get(u)
+            if ready is None:
+                continue
+            # Changing trains needs min_transfer minutes; the first leg does not
+            if dep[k] < ready + (min_transfer if u in arrived_by else 0):
+                continue
+            v = dst[k]
+            if arr[k] < earliest.get(v, float("inf")):
+                earliest[v] = arr[k]
+                arrived_by[v] = k
+        record_search("csa", scanned)
+
+        if t not in arrived_by:
+            return []
+        legs = []
+        station = t
+        while station != s:
+            k = arrived_by[station]
+            legs.append(ids[k])
+            station = src[k]
+        legs.reverse()
+        return legs
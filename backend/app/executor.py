@@ -0,0 +1,130 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from app.metrics import registry
+import asyncio
+import multiprocessing
+import threading
+import os
+
+class ExecutorSaturated(Exception):
+    """Raised when a pool's running + queued work is at capacity"""
+
+def _warm_worker():
+    """Process-pool initializer: load the model and route graph once per worker"""
+    from app.models import get_delay_predictor, get_rerouting_engine
+
+    get_delay_predictor()._current_state()
+    get_rerouting_engine().route_table.warm_if_small()
+
+class WorkPool:
+    """
+    Bounded executor for running blocking work off the event loop.
+
+    At most `max_workers + queue_size` jobs may be running or waiting;
+    further submissions raise ExecutorSaturated immediately instead of
+    queueing without limit. A slot is freed when the job actually finishes,
+    so timed-out work that is still running keeps counting against capacity.
+    """
+
+    def __init__(self, name, kind="thread", max_workers=4, queue_size=64, timeout=10.0):
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_workers + queue_size)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == "process":
+                        # spawn: forking a threaded server process is unsafe
+                        self._executor = ProcessPoolExecutor(
+                            max_workers=self.max_workers,
+                            mp_context=multiprocessing.get_context("spawn"),
+                            initializer=_warm_worker
+                        )
+                    else:
+                        self._executor = ThreadPoolExecutor(
+                            max_workers=self.max_workers, thread_name_prefix=f"{self.name}-"
+                        )
+        return self._executor
+
+    def _release(self, _future):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    async def run(self, fn, *args, timeout=None, **kwargs):
+        """Run fn(*args, **kwargs) in the pool; raises ExecutorSaturated or asyncio.TimeoutError"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ExecutorSaturated(f"{self.name} pool is saturated")
+        with self._lock:
+            self.in_flight += 1
+        try:
+            future = self._get_executor().submit(partial(fn, *args, **kwargs))
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            # Drops the job if it has not started yet
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+REQUEST_TIMEOUT_SECONDS = float(os.environ.get("REQUEST_TIMEOUT_SECONDS", "10"))
+
+# Short work (single predictions, reroutes when no process pool is configured)
+light_pool = WorkPool(
+    "light", "thread",
+    max_workers=_env_int("EXECUTOR_THREAD_WORKERS", 4),
+    queue_size=_env_int("EXECUTOR_THREAD_QUEUE", 64),
+    timeout=REQUEST_TIMEOUT_SECONDS
+)
+
+# Heavy work (batch scoring, k-shortest paths); 0 workers routes it to the thread pool
+_process_workers = _env_int("EXECUTOR_PROCESS_WORKERS", 0)
+heavy_pool = WorkPool(
+    "heavy", "process",
+    max_workers=_process_workers,
+    queue_size=_env_int("EXECUTOR_PROCESS_QUEUE", 16),
+    timeout=REQUEST_TIMEOUT_SECONDS
+) if _process_workers > 0 else light_pool
+
+def get_light_pool():
+    return light_pool
+
+def get_heavy_pool():
+    return heavy_pool
+
+def shutdown_pools():
+    light_pool.shutdown()
+    heavy_pool.shutdown()
+
+for _field in ("in_flight", "rejected", "timeouts"):
+    registry.register_collector(
+        f"executor_{_field}", "gauge" if _field == "in_flight" else "counter",
+        f"Executor pool {_field.replace('_', ' ')}", ("pool",),
+        lambda field=_field: {(pool.name,): getattr(pool, field) for pool in {light_pool, heavy_pool}}
+    )
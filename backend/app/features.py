@@ -0,0 +1,183 @@
+import numpy as np
+import zlib
+
+WEATHER_MAP = {"clear": 0, "cloudy": 1, "rain": 2, "storm": 3, "fog": 2}
+
+# Columns of models trained before station features existed
+BASE_FEATURES = ["hour", "day_of_week", "weather_encoded", "station_encoded"]
+STATION_FEATURES = ["station_degree", "station_centrality", "station_delay_rate"]
+FEATURES = BASE_FEATURES + STATION_FEATURES
+
+DEFAULT_HOUR = 12
+DEFAULT_DAY_OF_WEEK = 1
+# Stations used without a fitted encoder are hashed into this many buckets
+STATION_BUCKETS = 10
+# BFS sources for the centrality estimate (every station on smaller graphs)
+CENTRALITY_PIVOTS = 64
+# Pseudo-observations pulling a rarely seen station's delay rate towards the overall rate
+DELAY_RATE_PRIOR = 20.0
+
+# Every "HH:MM" and "H:MM" of the day -> hour, so parsing is a table lookup
+_HOURS = {f"{h:02d}:{m:02d}": h for h in range(24) for m in range(60)}
+_HOURS.update({f"{h}:{m:02d}": h for h in range(10) for m in range(60)})
+
+def stable_station_bucket(station, buckets=STATION_BUCKETS):
+    """Hash a station name to a bucket, identical across processes and restarts"""
+    return zlib.crc32(station.encode("utf-8")) % buckets
+
+def _by_unique(values, encode):
+    """Apply `encode` (uniques -> array) once per distinct value and spread it back over the rows"""
+    values = np.asarray(values, dtype=object).astype(str)
+    if values.ndim == 0:
+        values = values.reshape(1)
+    if len(values) == 1:
+        return np.asarray(encode(values))
+    uniques, inverse = np.unique(values, return_inverse=True)
+    return np.asarray(encode(uniques))[inverse.reshape(-1)]
+
+def _broadcast(value, n):
+    """Scalar or per-row input as an object array of n rows"""
+    array = np.empty(n, dtype=object)
+    array[:] = value if np.ndim(value) else [value] * n
+    return array
+
+def parse_hours(times):
+    """Vectorized "HH:MM" -> hour of day, DEFAULT_HOUR where unparseable"""
+    def encode(uniques):
+        hours = np.array([_HOURS.get(t, -1) for t in uniques])
+        odd = hours < 0
+        if odd.any():
+            # Anything off the table ("7:5", stray whitespace) goes through the schedule parser
+            from app.schedule_table import parse_minutes
+
+            minutes = parse_minutes(uniques[odd])
+            hours[odd] = np.where(minutes >= 0, minutes // 60, DEFAULT_HOUR)
+        return hours
+    return _by_unique(times, encode)
+
+def encode_weather(weather):
+    """Vectorized weather names (case-insensitive) -> WEATHER_MAP codes; unknown or missing is clear"""
+    return _by_unique(weather, lambda uniques: [WEATHER_MAP.get(w, 0) for w in np.char.lower(uniques)])
+
+def encode_days(day_of_week):
+    """Day-of-week column with DEFAULT_DAY_OF_WEEK where missing"""
+    days = np.asarray(day_of_week, dtype=float).reshape(-1)
+    return np.where(np.isnan(days), DEFAULT_DAY_OF_WEEK, days)
+
+def _harmonic_centrality(network, pivots=CENTRALITY_PIVOTS, seed=0):
+    """
+    Mean of 1 / hops from a sample of source stations, each BFS expanded a
+    whole frontier at a time over the CSR arrays; exact when the graph has
+    no more than `pivots` stations
+    """
+    n = len(network)
+    if n == 0:
+        return np.zeros(0)
+    sources = np.arange(n) if n <= pivots else np.random.default_rng(seed).choice(n, pivots, replace=False)
+    offsets, targets = network.offsets, network.targets.astype(np.int64)
+    degree = np.diff(offsets)
+    total = np.zeros(n)
+    for source in sources:
+        seen = np.zeros(n, dtype=bool)
+        seen[source] = True
+        frontier = np.array([source])
+        hops = 0
+        while len(frontier):
+            hops += 1
+            counts = degree[frontier]
+            starts = np.repeat(offsets[frontier] - np.cumsum(counts) + counts, counts)
+            neighbors = np.unique(targets[starts + np.arange(counts.sum())])
+            frontier = neighbors[~seen[neighbors]]
+            seen[frontier] = True
+            total[frontier] += 1.0 / hops
+    return total / max(len(sources) - (n <= pivots), 1)
+
+class StationFeatures:
+    """
+    Per-station feature table, computed once: degree and centrality from
+    the route graph, and the historical delay rate (smoothed towards the
+    overall rate by DELAY_RATE_PRIOR pseudo-observations). Row `len(stations)`
+    holds the values used for stations the table does not know.
+    """
+
+    def __init__(self, stations, table):
+        self.stations = list(stations)
+        self.index = {station: i for i, station in enumerate(self.stations)}
+        self.table = np.asarray(table, dtype=float)
+
+    @classmethod
+    def build(cls, network, history_stations=(), history_delayed=()):
+        """From a RailNetwork plus past runs' source stations and 0/1 delayed labels"""
+        stations = list(network.stations)
+        index = {station: i for i, station in enumerate(stations)}
+        delayed = np.asarray(history_delayed, dtype=float).reshape(-1)
+        overall = float(delayed.mean()) if len(delayed) else 0.0
+
+        codes = _by_unique(history_stations, lambda uniques: [index.get(s, len(stations)) for s in uniques]) \
+            if len(delayed) else np.zeros(0, dtype=np.int64)
+        runs = np.bincount(codes, minlength=len(stations) + 1)[:len(stations)]
+        late = np.bincount(codes, weights=delayed, minlength=len(stations) + 1)[:len(stations)]
+        delay_rate = (late + DELAY_RATE_PRIOR * overall) / (runs + DELAY_RATE_PRIOR)
+
+        table = np.zeros((len(stations) + 1, len(STATION_FEATURES)))
+        table[:-1, 0] = np.diff(network.offsets)
+        table[:-1, 1] = _harmonic_centrality(network)
+        table[:-1, 2] = delay_rate
+        table[-1, 2] = overall
+        return cls(stations, table)
+
+    def lookup(self, stations):
+        """(n, len(STATION_FEATURES)) rows for an array of station names"""
+        unknown = len(self.stations)
+        rows = _by_unique(stations, lambda uniques: [self.index.get(s, unknown) for s in uniques])
+        return self.table[rows]
+
+class FeaturePipeline:
+    """
+    Raw inputs -> feature matrix for one model, vectorized over rows.
+
+    `columns` are the model's feature names (from its metadata; models
+    trained before station features use BASE_FEATURES). Stations are
+    label-encoded with `station_codes` when the model has an encoder and
+    hashed otherwise; station feature columns come from `station_features`
+    (zeros if the model was saved without them). Inputs may be scalars or
+    equal-length arrays, and every step works once per distinct value.
+    """
+
+    def __init__(self, station_codes=None, station_features=None, columns=BASE_FEATURES):
+        self.station_codes = station_codes
+        self.station_features = station_features
+        self.columns = list(columns)
+
+    def encode_stations(self, stations):
+        codes = self.station_codes
+        if codes is None:
+            return _by_unique(stations, lambda uniques: [stable_station_bucket(s) for s in uniques])
+        return _by_unique(stations, lambda uniques: [codes.get(s, len(codes)) for s in uniques])
+
+    def assemble(self, hour, day_of_week, weather_encoded, station):
+        """Matrix from already-parsed hour/day/weather columns and raw station names"""
+        hour = np.asarray(hour, dtype=float).reshape(-1)
+        n = len(hour)
+        columns = {
+            "hour": hour,
+            "day_of_week": np.broadcast_to(encode_days(day_of_week), n),
+            "weather_encoded": np.broadcast_to(np.asarray(weather_encoded, dtype=float).reshape(-1), n)
+        }
+        station = _broadcast(station, n)
+        if "station_encoded" in self.columns:
+            columns["station_encoded"] = self.encode_stations(station)
+        if any(name in self.columns for name in STATION_FEATURES):
+            values = (self.station_features.lookup(station) if self.station_features is not None
+                      else np.zeros((n, len(STATION_FEATURES))))
+            columns.update(zip(STATION_FEATURES, values.T))
+        return np.column_stack([columns[name] for name in self.columns]).astype(float)
+
+    def transform(self, current_time, station, weather="clear", day_of_week=DEFAULT_DAY_OF_WEEK):
+        """Matrix from raw "HH:MM" times, station names, weather names and days of week"""
+        hour = parse_hours(current_time)
+        n = len(hour)
+        return self.assemble(hour, _broadcast(day_of_week, n), encode_weather(_broadcast(weather, n)), station)
+
+    def column(self, X, name):
+        return X[:, self.columns.index(name)]
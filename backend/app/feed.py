@@ -0,0 +1,248 @@
+from app.schedule import get_schedule_store
+from app.metrics import registry
+import numpy as np
+import pandas as pd
+import asyncio
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 1000
+WATCH_INTERVAL_SECONDS = 1.0
+
+# Queued in place of events a subscriber could not keep up with
+RESYNC = {"type": "resync"}
+
+def _first_positions(keys):
+    """Index over unique keys -> row of their first occurrence"""
+    first = ~pd.Index(keys).duplicated()
+    return pd.Index(keys[first]), np.nonzero(first)[0]
+
+class TrainBoard:
+    """
+    Live status of every scheduled train, aligned with one schedule snapshot.
+
+    Rows follow the snapshot's rows; status/platform start from the
+    schedule and delay_minutes from its `delay_minutes` column (0 if
+    absent). Dispatcher updates change the board only, not the timetable,
+    and survive reloads unless that train's timetable entry changed.
+    """
+
+    def __init__(self, snapshot):
+        table = snapshot.table
+        self.snapshot = snapshot
+        self.keys = snapshot.keys()
+        self.index, self.rows = _first_positions(self.keys)
+        delay = table.extra.get("delay_minutes")
+        # What the timetable says; live values start here and diverge on updates
+        self.scheduled = (
+            np.asarray(table.statuses, dtype=object)[table.status],
+            table.platform.astype(np.int32),
+            pd.to_numeric(pd.Series(delay), errors="coerce").fillna(0).to_numpy(dtype=np.int32)
+            if delay is not None else np.zeros(len(table), dtype=np.int32)
+        )
+        self.status, self.platform, self.delay_minutes = (column.copy() for column in self.scheduled)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def positions(self, train_id, departure=None):
+        """Rows of a train, optionally only the run leaving at `departure` (minutes)"""
+        rows = self.snapshot.train_index.get_indexer_for([train_id])
+        rows = rows[rows >= 0]
+        if departure is not None:
+            rows = rows[self.snapshot.table.departure_minutes()[rows] == departure]
+        return rows
+
+    def records(self, rows=None):
+        """Feed entries (schedule identity plus live fields) for the given rows"""
+        table = self.snapshot.table
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows, dtype=np.int64)
+        columns = {
+            "key": [f"{k:016x}" for k in self.keys[rows].tolist()],
+            "train_id": table.column("train_id", rows).tolist(),
+            "train_name": table.column("train_name", rows).tolist(),
+            "source": table.column("source", rows).tolist(),
+            "destination": table.column("destination", rows).tolist(),
+            "scheduled_departure": table.column("scheduled_departure", rows).tolist(),
+            "platform": self.platform[rows].tolist(),
+            "status": self.status[rows].tolist(),
+            "delay_minutes": self.delay_minutes[rows].tolist()
+        }
+        names = list(columns)
+        return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+    def carry_over(self, old):
+        """Keep live values of trains whose timetable entry did not change"""
+        matched = old.index.get_indexer(self.keys)
+        found = np.nonzero(matched >= 0)[0]
+        previous = old.rows[matched[found]]
+        same = np.ones(len(found), dtype=bool)
+        for new_column, old_column in zip(self.scheduled, old.scheduled):
+            same &= new_column[found] == old_column[previous]
+        found, previous = found[same], previous[same]
+        self.status[found] = old.status[previous]
+        self.platform[found] = old.platform[previous]
+        self.delay_minutes[found] = old.delay_minutes[previous]
+
+    def diff(self, old):
+        """(changed rows of self, added rows of self, removed keys of old) between two boards"""
+        matched = old.index.get_indexer(self.keys)
+        found = np.nonzero(matched >= 0)[0]
+        previous = old.rows[matched[found]]
+        changed = found[
+            (self.status[found] != old.status[previous])
+            | (self.platform[found] != old.platform[previous])
+            | (self.delay_minutes[found] != old.delay_minutes[previous])
+        ]
+        added = np.nonzero(matched < 0)[0]
+        removed = old.keys[~np.isin(old.keys, self.keys)]
+        return changed, added, removed
+
+class _Subscriber:
+    """One stream consumer: a bounded queue fed from any thread via its event loop"""
+
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        # Set by unsubscribe; a subscribe that runs after it (e.g. a timed-out call) is a no-op
+        self.closed = False
+
+    def push(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow to keep up: drop the backlog and send a fresh snapshot
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+class TrainFeed:
+    """
+    In-process pub/sub of live train status.
+
+    Subscribers get one snapshot and then delta events. Deltas come from
+    schedule reloads (diffed against the previous board) and from
+    dispatcher updates. Every event carries a sequence number; a snapshot
+    covers all events up to its own `seq`.
+    """
+
+    def __init__(self, store=None, queue_size=SUBSCRIBER_QUEUE_SIZE, watch_interval=WATCH_INTERVAL_SECONDS):
+        self.store = store or get_schedule_store()
+        self.queue_size = queue_size
+        self.watch_interval = watch_interval
+        self.seq = 0
+        self._lock = threading.RLock()
+        self._subscribers = set()
+        self._board = TrainBoard(self.store.refresh())
+        self.store.add_listener(self._on_schedule_swap)
+        self._watcher = None
+        self._wake = threading.Event()
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def _publish(self, event):
+        """Stamp and fan out an event; caller holds the lock"""
+        self.seq += 1
+        event["seq"] = self.seq
+        for subscriber in list(self._subscribers):
+            subscriber.push(event)
+
+    def snapshot(self):
+        with self._lock:
+            return {"type": "snapshot", "seq": self.seq, "trains": self._board.records()}
+
+    def new_subscriber(self, loop):
+        """A subscriber delivering on `loop`; pass it to subscribe(), and always to unsubscribe()"""
+        return _Subscriber(loop, self.queue_size)
+
+    def subscribe(self, subscriber):
+        """Register a subscriber; returns a snapshot with no gap before its events (None if already unsubscribed)"""
+        with self._lock:
+            if subscriber.closed:
+                return None
+            self._subscribers.add(subscriber)
+            snapshot = self.snapshot()
+            self._ensure_watcher()
+        return snapshot
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscriber.closed = True
+            self._subscribers.discard(subscriber)
+
+    def _ensure_watcher(self):
+        """Start the watcher unless one is running; caller holds the lock"""
+        # Schedule changes only surface when the store is refreshed; poll while anyone listens
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name="train-feed-watch", daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        while True:
+            # Decided under the lock, so a subscribe either sees this watcher running or starts a new one
+            with self._lock:
+                if not self._subscribers:
+                    self._watcher = None
+                    return
+            try:
+                self.store.refresh()
+            except Exception as e:
+                logger.error(f"Schedule refresh failed: {str(e)}")
+            self._wake.wait(self.watch_interval)
+
+    def _on_schedule_swap(self, old, new):
+        board = TrainBoard(new)
+        with self._lock:
+            previous = self._board
+            board.carry_over(previous)
+            changed, added, removed = board.diff(previous)
+            self._board = board
+            if len(changed) or len(added) or len(removed):
+                self._publish({
+                    "type": "delta",
+                    "changes": board.records(changed),
+                    "added": board.records(added),
+                    "removed": [f"{k:016x}" for k in removed.tolist()]
+                })
+
+    def update(self, train_id, departure=None, **fields):
+        """
+        Set live fields (status, delay_minutes, platform) of a train and
+        publish the change. Returns the updated entries; empty if unknown.
+        """
+        with self._lock:
+            board = self._board
+            rows = board.positions(train_id, departure)
+            if len(rows) == 0:
+                return []
+            if fields.get("status") is not None:
+                board.status[rows] = fields["status"]
+            if fields.get("delay_minutes") is not None:
+                board.delay_minutes[rows] = fields["delay_minutes"]
+            if fields.get("platform") is not None:
+                board.platform[rows] = fields["platform"]
+            changes = board.records(rows)
+            self._publish({"type": "delta", "changes": changes, "added": [], "removed": []})
+            return changes
+
+_train_feed = None
+_train_feed_lock = threading.Lock()
+
+def get_train_feed():
+    global _train_feed
+    if _train_feed is None:
+        with _train_feed_lock:
+            if _train_feed is None:
+                _train_feed = TrainFeed()
+                registry.register_collector(
+                    "train_feed_subscribers", "gauge", "Open live train feed streams", (),
+                    lambda: {(): _train_feed.subscriber_count}
+                )
+    return _train_feed
@@ -0,0 +1,187 @@
+from collections import OrderedDict
+from app.schedule import parse_minutes, train_keys
+import numpy as np
+import pandas as pd
+import threading
+import time
+import uuid
+import io
+
+REQUIRED_COLUMNS = ("train_id", "source", "destination", "scheduled_departure", "scheduled_arrival")
+SCHEDULE_COLUMNS = ("train_id", "train_name", "source", "destination",
+                    "scheduled_departure", "scheduled_arrival", "platform", "status")
+UPLOAD_CHUNK_ROWS = 50000
+MAX_TRACKED_UPLOADS = 100
+
+# "HH:MM" label of every minute of the day
+MINUTE_LABELS = np.array([f"{m // 60:02d}:{m % 60:02d}" for m in range(24 * 60)], dtype=object)
+
+class ScheduleIngest:
+    """
+    Incremental parser for a schedule CSV arriving as a byte stream.
+
+    `feed` splits incoming bytes into lines and hands back batches of
+    `chunk_rows` complete lines; `parse_batch` validates one batch and keeps
+    only new trains. Rows need every required column, and valid HH:MM times.
+    Duplicates are keyed by (train_id, departure minute), first occurrence
+    wins, across the whole upload. Only the accepted rows are retained, so
+    memory tracks the size of the cleaned schedule, not of the upload.
+
+    Records may not span lines (no newlines inside quoted fields).
+    """
+
+    def __init__(self, upload_id=None, total_bytes=None, chunk_rows=UPLOAD_CHUNK_ROWS):
+        self.upload_id = upload_id or uuid.uuid4().hex
+        self.total_bytes = total_bytes
+        self.chunk_rows = chunk_rows
+        self.state = "receiving"
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self.bytes_received = 0
+        self.rows_read = 0
+        self.rows_accepted = 0
+        self.rows_invalid = 0
+        self.rows_duplicate = 0
+        self._header = None
+        self._columns = None
+        self._partial = b""
+        self._lines = []
+        self._seen = set()
+        self._accepted = []
+
+    def feed(self, data):
+        """Add raw bytes; returns the line batches that are ready to parse"""
+        self.bytes_received += len(data)
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        return self._collect(lines)
+
+    def finish(self):
+        """Flush the trailing line; returns the final batches to parse"""
+        lines = [self._partial] if self._partial else []
+        self._partial = b""
+        batches = self._collect(lines)
+        if self._header is None:
+            raise ValueError("Upload is empty")
+        if self._lines:
+            batches.append(self._lines)
+            self._lines = []
+        return batches
+
+    def _collect(self, lines):
+        if self._header is None and lines:
+            self._set_header(lines[0])
+            lines = lines[1:]
+        self._lines.extend(line for line in lines if line.strip())
+        batches = []
+        while len(self._lines) >= self.chunk_rows:
+            batches.append(self._lines[:self.chunk_rows])
+            self._lines = self._lines[self.chunk_rows:]
+        return batches
+
+    def _set_header(self, line):
+        columns = [c.strip() for c in line.decode("utf-8-sig").strip().split(",")]
+        missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+        if missing:
+            raise ValueError(f"Missing required columns: {', '.join(missing)}")
+        self._header = line.rstrip(b"\r")
+        self._columns = columns
+
+    def parse_batch(self, lines):
+        """Validate and deduplicate one batch of data lines"""
+        self.state = "processing"
+        chunk = pd.read_csv(
+            io.BytesIO(b"\n".join([self._header] + lines)), dtype=str,
+            keep_default_na=False, on_bad_lines="skip", encoding="utf-8-sig",
+            skipinitialspace=True
+        )
+        chunk.columns = self._columns
+        self.rows_read += len(lines)
+        # Lines with the wrong field count were skipped by the parser
+        self.rows_invalid += len(lines) - len(chunk)
+
+        chunk = chunk.fillna("")
+        departure = parse_minutes(chunk["scheduled_departure"])
+        arrival = parse_minutes(chunk["scheduled_arrival"])
+        valid = ((chunk[list(REQUIRED_COLUMNS)] != "").all(axis=1).to_numpy()
+                 & (departure >= 0) & (arrival >= 0))
+        self.rows_invalid += int((~valid).sum())
+        chunk, departure, arrival = chunk[valid], departure[valid], arrival[valid]
+
+        keys = train_keys(chunk["train_id"], departure)
+        fresh = np.zeros(len(keys), dtype=bool)
+        fresh[np.unique(keys, return_index=True)[1]] = True
+        fresh &= np.fromiter((key not in self._seen for key in keys.tolist()), dtype=bool, count=len(keys))
+        self.rows_duplicate += int(len(keys) - fresh.sum())
+        self._seen.update(keys[fresh].tolist())
+        if not fresh.any():
+            return
+
+        chunk = chunk[fresh]
+        # Normalize times so "7:05" and "07:05" store the same way
+        rows = pd.DataFrame({
+            "train_id": chunk["train_id"].to_numpy(),
+            "train_name": chunk["train_name"].to_numpy() if "train_name" in chunk else chunk["train_id"].to_numpy(),
+            "source": chunk["source"].to_numpy(),
+            "destination": chunk["destination"].to_numpy(),
+            "scheduled_departure": MINUTE_LABELS[departure[fresh]],
+            "scheduled_arrival": MINUTE_LABELS[arrival[fresh]],
+            "platform": (pd.to_numeric(chunk["platform"], errors="coerce").fillna(0).astype(int).to_numpy()
+                         if "platform" in chunk else 0),
+            "status": (chunk["status"].replace("", "On Time").to_numpy()
+                       if "status" in chunk else "On Time")
+        }, columns=list(SCHEDULE_COLUMNS))
+        self._accepted.append(rows)
+        self.rows_accepted += len(rows)
+
+    def result(self):
+        """All accepted rows as one frame in SCHEDULE_COLUMNS order"""
+        if not self._accepted:
+            return pd.DataFrame(columns=list(SCHEDULE_COLUMNS))
+        frame = pd.concat(self._accepted, ignore_index=True)
+        self._accepted = [frame]
+        return frame
+
+    def fail(self, error):
+        self.state = "failed"
+        self.error = str(error)
+        self.finished_at = time.time()
+
+    def complete(self):
+        self.state = "completed"
+        self.finished_at = time.time()
+
+    def progress(self):
+        percent = None
+        if self.total_bytes:
+            percent = round(min(100.0, 100.0 * self.bytes_received / self.total_bytes), 1)
+        return {
+            "upload_id": self.upload_id,
+            "state": self.state,
+            "error": self.error,
+            "bytes_received": self.bytes_received,
+            "total_bytes": self.total_bytes,
+            "percent": percent,
+            "rows_read": self.rows_read,
+            "rows_accepted": self.rows_accepted,
+            "rows_invalid": self.rows_invalid,
+            "rows_duplicate": self.rows_duplicate,
+            "elapsed_seconds": round((self.finished_at or time.time()) - self.started_at, 3)
+        }
+
+# Recent uploads by id, for progress polling
+_uploads = OrderedDict()
+_uploads_lock = threading.Lock()
+
+def start_upload(upload_id=None, total_bytes=None):
+    ingest = ScheduleIngest(upload_id, total_bytes)
+    with _uploads_lock:
+        _uploads[ingest.upload_id] = ingest
+        while len(_uploads) > MAX_TRACKED_UPLOADS:
+            _uploads.popitem(last=False)
+    return ingest
+
+def get_upload(upload_id):
+    with _uploads_lock:
+        return _uploads.get(upload_id)
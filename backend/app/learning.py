@@ -0,0 +1,303 @@
+from app.cache import make_cache
+from app.features import encode_weather, parse_hours
+from app.metrics import register_cache, registry
+from app.models import get_delay_predictor
+from app.services import prediction_cache
+from app.training import DELAYED_AFTER_MINUTES
+from datetime import datetime
+import numpy as np
+import threading
+import logging
+import copy
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SIZE = 20000
+REFIT_MIN_OBSERVATIONS = 500
+REFIT_MIN_INTERVAL_SECONDS = 60.0
+HOLDOUT_FRACTION = 0.2
+MIN_HOLDOUT_ROWS = 50
+TREES_PER_REFIT = 25
+MAX_TREES = 150
+# Brier score the candidate must gain on the hold-out before it replaces the live model
+MIN_IMPROVEMENT = 0.002
+SERVED_PREDICTION_TTL_SECONDS = 24 * 3600.0
+# Window columns kept per observation besides the station: hour, day_of_week, weather_encoded
+WINDOW_COLUMNS = 3
+
+OBSERVATIONS = registry.counter(
+    "observations_total", "Observed delay outcomes received", labels=("matched",)
+)
+REFITS = registry.counter(
+    "online_refits_total", "Online delay model refits", labels=("outcome",)
+)
+
+# Inputs and probability of recently served predictions, by prediction_id
+served_predictions = make_cache("served_predictions", maxsize=100000, ttl=SERVED_PREDICTION_TTL_SECONDS)
+register_cache("served_predictions", served_predictions)
+
+def remember_prediction(inputs, delay_probability):
+    """Keep a served prediction so a later observation can refer to it; returns its id"""
+    prediction_id = uuid.uuid4().hex
+    served_predictions.set(prediction_id, (inputs, float(delay_probability)))
+    return prediction_id
+
+def remember_predictions(inputs, delay_probabilities):
+    """Keep a batch of served predictions in one cache write; returns their ids in order"""
+    prediction_ids = [uuid.uuid4().hex for _ in inputs]
+    served_predictions.set_many(
+        (prediction_id, (row, float(p))) for prediction_id, row, p in zip(prediction_ids, inputs, delay_probabilities)
+    )
+    return prediction_ids
+
+def brier_score(probabilities, outcomes):
+    return float(np.mean((np.asarray(probabilities, dtype=float) - outcomes) ** 2))
+
+class ObservationWindow:
+    """
+    Ring buffer of the most recent labelled observations.
+
+    Keeps the numeric features (hour, day_of_week, weather) and the raw
+    station name; stations are encoded at refit time by the live model's
+    feature pipeline. `served` is the probability that was served
+    for the observation, NaN when it came without a prediction_id.
+    """
+
+    def __init__(self, capacity=WINDOW_SIZE):
+        self.capacity = capacity
+        self.numeric = np.zeros((capacity, WINDOW_COLUMNS))
+        self.station = np.empty(capacity, dtype=object)
+        self.delayed = np.zeros(capacity, dtype=np.int8)
+        self.served = np.full(capacity, np.nan)
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def extend(self, numeric, station, delayed, served):
+        n = len(delayed)
+        keep = slice(max(0, n - self.capacity), n)
+        with self._lock:
+            positions = (self.total + np.arange(keep.start, n)) % self.capacity
+            self.numeric[positions] = np.asarray(numeric)[keep]
+            self.station[positions] = np.asarray(station, dtype=object)[keep]
+            self.delayed[positions] = np.asarray(delayed)[keep]
+            self.served[positions] = np.asarray(served, dtype=float)[keep]
+            self.total += n
+
+    def arrays(self):
+        """(numeric, station, delayed, served) copies, oldest observation first"""
+        with self._lock:
+            n = len(self)
+            order = (self.total - n + np.arange(n)) % self.capacity
+            return self.numeric[order], self.station[order], self.delayed[order], self.served[order]
+
+class OnlineTrainer:
+    """
+    Keeps the delay model current from observed outcomes.
+
+    Observations go into a sliding window; once `min_new` have arrived a
+    background thread refits (at most every `min_interval` seconds). A refit
+    warm-starts from the live forest: it grows `trees_per_refit` trees on
+    the window minus its most recent `holdout_fraction`, then drops the
+    oldest trees beyond `max_trees`, so old conditions age out without a
+    full retrain. The candidate is published only if its Brier score on the
+    hold-out beats the live model's by `min_improvement`. Serving never
+    waits on a refit; it just sees the new version once published.
+    """
+
+    def __init__(self, predictor=None, window=None, min_new=REFIT_MIN_OBSERVATIONS,
+                 min_interval=REFIT_MIN_INTERVAL_SECONDS, holdout_fraction=HOLDOUT_FRACTION,
+                 trees_per_refit=TREES_PER_REFIT, max_trees=MAX_TREES, min_improvement=MIN_IMPROVEMENT):
+        self.predictor = predictor or get_delay_predictor()
+        self.window = window or ObservationWindow()
+        self.min_new = min_new
+        self.min_interval = min_interval
+        self.holdout_fraction = holdout_fraction
+        self.trees_per_refit = trees_per_refit
+        self.max_trees = max_trees
+        self.min_improvement = min_improvement
+        self.pending = 0
+        self.refits = 0
+        self.swaps = 0
+        self.last_refit = None
+        self._last_refit_at = None
+        self._lock = threading.Lock()
+        self._refit_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._worker = None
+
+    def record(self, numeric, station, delayed, served):
+        """Add labelled observations; wakes the worker once enough are pending"""
+        self.window.extend(numeric, station, delayed, served)
+        with self._lock:
+            self.pending += len(delayed)
+            ready = self.pending >= self.min_new
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="online-trainer", daemon=True)
+                self._worker.start()
+        if ready:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._last_refit_at is not None:
+                time.sleep(max(0.0, self._last_refit_at + self.min_interval - time.monotonic()))
+            try:
+                self.refit()
+            except Exception as e:
+                REFITS.inc(outcome="failed")
+                logger.error(f"Online refit failed: {str(e)}")
+
+    def _encode(self, state, numeric, station):
+        return state.pipeline.assemble(numeric[:, 0], numeric[:, 1], numeric[:, 2], station)
+
+    def _candidate(self, state, X, y):
+        """Warm-started copy of the live forest (fresh forest if there is none)"""
+        from sklearn.ensemble import RandomForestClassifier
+
+        live = state.model
+        if not (state.is_trained and isinstance(live, RandomForestClassifier)
+                and list(getattr(live, "classes_", [])) == [0, 1]):
+            return RandomForestClassifier(n_estimators=100, random_state=42).fit(X, y)
+        # Shallow copy with its own tree list; the live model is never touched
+        model = copy.copy(live)
+        model.estimators_ = list(live.estimators_)
+        model.set_params(warm_start=True, n_estimators=len(model.estimators_) + self.trees_per_refit,
+                         random_state=self.window.total)
+        model.fit(X, y)
+        del model.estimators_[:max(0, len(model.estimators_) - self.max_trees)]
+        model.set_params(warm_start=False, n_estimators=len(model.estimators_))
+        return model
+
+    def refit(self):
+        """Fit a candidate on the current window; publish it if it wins on the hold-out"""
+        with self._refit_lock:
+            with self._lock:
+                self.pending = 0
+            self._last_refit_at = time.monotonic()
+            numeric, station, y, _ = self.window.arrays()
+            n_holdout = int(len(y) * self.holdout_fraction)
+            result = {
+                "at": datetime.now().isoformat(timespec="seconds"),
+                "observations": int(len(y)),
+                "holdout_rows": n_holdout
+            }
+            train_y, holdout_y = y[:len(y) - n_holdout], y[len(y) - n_holdout:]
+            if n_holdout < MIN_HOLDOUT_ROWS or len(np.unique(train_y)) < 2:
+                result["outcome"] = "skipped"
+                return self._finish(result)
+
+            state = self.predictor._current_state()
+            X = self._encode(state, numeric, station)
+            train_X, holdout_X = X[:len(train_y)], X[len(train_y):]
+            candidate = self._candidate(state, train_X, train_y)
+
+            live_score = brier_score(self.predictor.predict_delay_probabilities(holdout_X, state), holdout_y)
+            candidate_score = brier_score(candidate.predict_proba(holdout_X)[:, 1], holdout_y)
+            result.update({
+                "live_brier": round(live_score, 5),
+                "candidate_brier": round(candidate_score, 5),
+                "outcome": "rejected"
+            })
+            if candidate_score <= live_score - self.min_improvement:
+                version = self.predictor.publish(candidate, state.label_encoders, {
+                    "source": "online",
+                    "parent_version": state.version,
+                    "rows": int(len(train_y)),
+                    "delay_rate": round(float(train_y.mean()), 4),
+                    "holdout_rows": n_holdout,
+                    "holdout_brier": round(candidate_score, 5),
+                    "previous_holdout_brier": round(live_score, 5),
+                    "trees": len(candidate.estimators_),
+                    "features": state.pipeline.columns
+                })
+                # Cached scores belong to the replaced model
+                prediction_cache.clear()
+                self.swaps += 1
+                result.update({"outcome": "swapped", "version": version})
+                logger.info(f"Online refit published delay model version {version} "
+                            f"(hold-out Brier {live_score:.4f} -> {candidate_score:.4f})")
+            return self._finish(result)
+
+    def _finish(self, result):
+        self.refits += 1
+        self.last_refit = result
+        REFITS.inc(outcome=result["outcome"])
+        return result
+
+    def status(self):
+        _, _, delayed, served = self.window.arrays()
+        has_served = ~np.isnan(served)
+        return {
+            "observations": self.window.total,
+            "window_size": len(self.window),
+            "pending": self.pending,
+            "served_brier": round(brier_score(served[has_served], delayed[has_served]), 5)
+            if has_served.any() else None,
+            "refits": self.refits,
+            "swaps": self.swaps,
+            "model_version": self.predictor.model_version,
+            "last_refit": self.last_refit
+        }
+
+_online_trainer = None
+_online_trainer_lock = threading.Lock()
+
+def get_online_trainer():
+    global _online_trainer
+    if _online_trainer is None:
+        with _online_trainer_lock:
+            if _online_trainer is None:
+                _online_trainer = OnlineTrainer()
+    return _online_trainer
+
+def record_observations(observations):
+    """
+    Add observed delays to the online training window.
+
+    Each observation has `actual_delay_minutes` and either the
+    `prediction_id` of a served prediction or that prediction's inputs
+    (current_time, station, weather, day_of_week). Returns how many were
+    accepted and how many could not be matched to any inputs.
+    """
+    times, day_of_week, weather, station, delayed, served = [], [], [], [], [], []
+    unmatched = 0
+    for observation in observations:
+        inputs, probability = None, np.nan
+        hit = served_predictions.get(observation["prediction_id"]) if observation.get("prediction_id") else None
+        if hit is not None:
+            inputs, probability = hit
+        elif observation.get("current_time") and observation.get("station"):
+            inputs = observation
+        if inputs is None:
+            unmatched += 1
+            continue
+        times.append(inputs["current_time"])
+        day_of_week.append(inputs.get("day_of_week"))
+        weather.append(inputs.get("weather"))
+        station.append(inputs["station"])
+        delayed.append(int(observation["actual_delay_minutes"] > DELAYED_AFTER_MINUTES))
+        served.append(probability)
+        OBSERVATIONS.inc(matched="prediction" if hit is not None else "inputs")
+    if unmatched:
+        OBSERVATIONS.inc(unmatched, matched="none")
+
+    trainer = get_online_trainer()
+    if delayed:
+        day_of_week = np.array(day_of_week, dtype=float)
+        numeric = np.column_stack([
+            parse_hours(times), np.where(np.isnan(day_of_week), 1, day_of_week), encode_weather(weather)
+        ])
+        trainer.record(numeric.astype(float), station, delayed, served)
+    return {
+        "accepted": len(delayed),
+        "unmatched": unmatched,
+        "pending": trainer.pending,
+        "window_size": len(trainer.window)
+    }
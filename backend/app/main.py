@@ -1,6 +1,11 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.executor import shutdown_pools
+from app.metrics import REQUEST_LATENCY, registry
 from app.routes import router
+from app.warmup import WARM_ON_STARTUP, readiness, start_warm_up
+import time
 import uvicorn
 
 app = FastAPI(
@@ -18,20 +23,62 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template, not raw path, to keep series bounded
+        route = request.scope.get("route")
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status
+        )
+
 # Include routes
 app.include_router(router)
 
+@app.on_event("startup")
+def warm_components():
+    if WARM_ON_STARTUP:
+        start_warm_up()
+
+@app.on_event("shutdown")
+def stop_executors():
+    shutdown_pools()
+
 @app.get("/")
 async def root():
     return {
         "message": "Smart Train Traffic Controller API",
         "status": "active",
-        "endpoints": ["/predict_delay", "/reroute", "/health"]
+        "endpoints": ["/predict_delay", "/predict_delay/batch", "/reroute", "/propagate", "/observations", "/health", "/ready", "/metrics"]
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text-format metrics"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "backend"}
 
+@app.get("/ready")
+async def readiness_check():
+    """503 until the routing graph, schedule and delay model are loaded"""
+    status = readiness()
+    if not status["ready"]:
+        # Also starts loading when warm-up on startup is turned off
+        start_warm_up()
+        return JSONResponse(status_code=503, content=status)
+    return status
+
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,162 @@
+from contextlib import contextmanager
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(label, "") for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(label, "") for label in self.labels), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in sorted(values):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(label, "") for label in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        # Series are updated in place, so copy the bucket counts too for a consistent scrape
+        with self._lock:
+            series = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items()]
+        for key, (counts, total, count) in sorted(series):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+class Registry:
+    """Holds metrics plus callbacks that report values owned elsewhere (e.g. caches)"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = {}
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, name, metric_type, help_text, labels, collect):
+        """`collect()` returns {label_values_tuple: value}, read at scrape time"""
+        if name not in self._collectors:
+            self._collectors[name] = (metric_type, help_text, tuple(labels), [])
+        self._collectors[name][3].append(collect)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, (metric_type, help_text, labels, collects) in self._collectors.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for collect in collects:
+                for key, value in sorted(collect().items()):
+                    lines.append(f"{name}{_format_labels(labels, key)} {value}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route",
+    labels=("method", "route", "status")
+)
+STAGE_LATENCY = registry.histogram(
+    "stage_duration_seconds", "Time spent in each processing stage",
+    labels=("operation", "stage"), buckets=STAGE_BUCKETS
+)
+ROUTE_SEARCHES = registry.counter(
+    "route_searches_total", "Graph searches run", labels=("algorithm",)
+)
+ROUTE_EXPANSIONS = registry.counter(
+    "route_search_expansions_total", "Nodes expanded by graph searches", labels=("algorithm",)
+)
+
+def stage_timer(operation, stage):
+    """Time a block as one stage of an operation"""
+    return STAGE_LATENCY.time(operation=operation, stage=stage)
+
+def record_search(algorithm, expansions):
+    ROUTE_SEARCHES.inc(algorithm=algorithm)
+    ROUTE_EXPANSIONS.inc(expansions, algorithm=algorithm)
+
+def register_cache(name, cache):
+    """Expose a cache's (TTLCache or SharedCache) counters on /metrics"""
+    for field in ("hits", "misses", "evictions", "expirations"):
+        registry.register_collector(
+            f"cache_{field}_total", "counter", f"Cache {field}", ("cache",),
+            lambda field=field: {(name,): getattr(cache, field)}
+        )
+    # A shared cache cannot count its own keys without scanning the server
+    if hasattr(cache, "__len__"):
+        registry.register_collector(
+            "cache_entries", "gauge", "Entries currently cached", ("cache",),
+            lambda: {(name,): len(cache)}
+        )
@@ -1,30 +1,169 @@
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import LabelEncoder
-import pandas as pd
 import numpy as np
+import logging
 import pickle
+import threading
+import time
 import os
+from app.artifacts import ModelArtifactStore
+from app.compiled_forest import CompiledForest
+from app.features import BASE_FEATURES, FEATURES, FeaturePipeline
+from app.network import RailNetwork, load_snapshot, symmetrize_adjacency
+from app.routing import RouteTable, astar, coordinate_routes, dijkstra, k_shortest_paths
+
+logger = logging.getLogger(__name__)
+
+# Above this many rows sklearn's tree-parallel predict_proba is faster
+COMPILED_MAX_ROWS = 256
+
+# Trains a line section takes during one coordinated rerouting plan
+DEFAULT_SEGMENT_CAPACITY = 3
+# Extra running time below this is summation noise, not a slower route
+REROUTE_TOLERANCE_MINUTES = 0.05
+
+class _ModelState:
+    """A consistent model/encoders/version set; swapped as one object"""
+    def __init__(self, model, label_encoders, is_trained, version=None, metadata=None,
+                 compiled=None):
+        self.model = model
+        self.label_encoders = label_encoders
+        self.is_trained = is_trained
+        self.version = version
+        self.metadata = metadata or {}
+        encoder = label_encoders.get("station")
+        self.station_codes = (
+            {station: i for i, station in enumerate(encoder.classes_)} if encoder is not None else None
+        )
+        # Artifacts from before station features carry no "features" list and no station table
+        columns = self.metadata.get("features") or (
+            FEATURES if "station_features" in label_encoders else BASE_FEATURES
+        )
+        self.pipeline = FeaturePipeline(self.station_codes, label_encoders.get("station_features"), columns)
+        # Flattened NumPy evaluator, skipping sklearn's per-call dispatch
+        if compiled is None and is_trained and hasattr(model, "estimators_"):
+            compiled = CompiledForest.from_sklearn(model)
+        self.compiled = compiled
+    
+    def predict_proba(self, X):
+        if self.compiled is not None and len(X) <= COMPILED_MAX_ROWS:
+            return self.compiled.predict_proba(X)
+        return self.model.predict_proba(X)
 
 class DelayPredictor:
-    def __init__(self):
-        self.model = RandomForestClassifier(n_estimators=100, random_state=42)
-        self.label_encoders = {}
-        self.is_trained = False
+    def __init__(self, artifact_store=None, reload_interval=30.0):
+        # No estimator until one is trained or loaded; sklearn is imported on first use
+        self._state = _ModelState(None, {}, False)
+        self.artifact_store = artifact_store
+        self.reload_interval = reload_interval
+        self._last_check = None
+        self._reload_lock = threading.Lock()
+    
+    @property
+    def model(self):
+        return self._state.model
+    
+    @property
+    def label_encoders(self):
+        return self._state.label_encoders
+    
+    @property
+    def is_trained(self):
+        return self._state.is_trained
+    
+    @property
+    def model_version(self):
+        return self._state.version
         
-    def train(self, X, y):
+    def train(self, X, y, label_encoders=None):
         """Train the delay prediction model"""
-        self.model.fit(X, y)
-        self.is_trained = True
+        from sklearn.base import clone
+        from sklearn.ensemble import RandomForestClassifier
+
+        model = clone(self.model) if self.model is not None else RandomForestClassifier(n_estimators=100, random_state=42)
+        model.fit(X, y)
+        encoders = label_encoders if label_encoders is not None else self.label_encoders
+        self._state = _ModelState(model, encoders, True)
+    
+    def reload(self):
+        """Swap in the latest published artifact if it is newer; True if swapped"""
+        if self.artifact_store is None:
+            return False
+        with self._reload_lock:
+            self._last_check = time.monotonic()
+            version = self.artifact_store.latest_version()
+            if version is None or version == self._state.version:
+                return False
+            try:
+                model, label_encoders, metadata = self.artifact_store.load(version)
+                compiled = self.artifact_store.load_compiled(version)
+            except Exception as e:
+                logger.error(f"Failed to load model version {version}: {str(e)}")
+                return False
+            # Single attribute assignment: requests see the old or the new model, never a mix
+            self._state = _ModelState(model, label_encoders, True, version, metadata, compiled)
+            logger.info(f"Loaded delay model version {version}")
+            return True
+    
+    def publish(self, model, label_encoders, metadata=None):
+        """
+        Save a model as a new artifact version and switch to it; other
+        processes pick it up on their next poll. Without an artifact store
+        the swap is in-memory only. Returns the version (None if unsaved).
+        """
+        if self.artifact_store is None:
+            self._state = _ModelState(model, label_encoders, True, None, metadata)
+            return None
+        compiled = CompiledForest.from_sklearn(model) if hasattr(model, "estimators_") else None
+        version = self.artifact_store.save(model, label_encoders, metadata, compiled=compiled)
+        self.reload()
+        return version
+
+    def _current_state(self):
+        """Active model state, lazily loading or polling for a new artifact"""
+        if self.artifact_store is not None and (
+            self._last_check is None or time.monotonic() - self._last_check >= self.reload_interval
+        ):
+            self.reload()
+        return self._state
+    
+    def encode_station(self, station):
+        """Station feature: label-encoded when the model has an encoder, else a stable hash"""
+        return int(self._current_state().pipeline.encode_stations(station)[0])
+    
+    def encode_features(self, current_time, station, weather="clear", day_of_week=1, state=None):
+        """Feature matrix for the active model (or `state`); arguments may be scalars or arrays"""
+        state = state or self._current_state()
+        return state.pipeline.transform(current_time, station, weather, day_of_week)
         
     def predict_delay_probability(self, features):
         """Predict delay probability"""
-        if not self.is_trained:
+        state = self._current_state()
+        if not state.is_trained:
             # Use rule-based system if not trained
             return self._rule_based_prediction(features)
         
-        prob = self.model.predict_proba([features])[0]
+        prob = state.predict_proba([features])[0]
         return prob[1] if len(prob) > 1 else prob[0]
     
+    def predict_delay_probabilities(self, feature_matrix, state=None):
+        """
+        Predict delay probabilities for a batch of feature rows; pass the
+        `state` the rows were encoded with so a concurrent model swap cannot
+        score them with a different feature layout
+        """
+        X = np.asarray(feature_matrix, dtype=float)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if len(X) == 0:
+            return np.zeros(0)
+        
+        state = state or self._current_state()
+        if not state.is_trained:
+            return self._rule_based_prediction_batch(X)
+        
+        # One predict_proba call for the whole batch
+        probs = state.predict_proba(X)
+        return probs[:, 1] if probs.shape[1] > 1 else probs[:, 0]
+    
     def _rule_based_prediction(self, features):
         """Rule-based delay prediction fallback"""
         # features: [hour, day_of_week, weather_encoded, station_encoded]
@@ -46,10 +185,46 @@ class DelayPredictor:
             base_prob += 0.30
         
         return min(base_prob, 0.95)
+    
+    def _rule_based_prediction_batch(self, X):
+        """Vectorized rule-based fallback, row-for-row equal to _rule_based_prediction"""
+        n_rows, n_cols = X.shape
+        hour = X[:, 0] if n_cols > 0 else np.full(n_rows, 12.0)
+        day = X[:, 1] if n_cols > 1 else np.full(n_rows, 1.0)
+        weather = X[:, 2] if n_cols > 2 else np.zeros(n_rows)
+        
+        base_prob = np.full(n_rows, 0.15)
+        peak = ((hour >= 7) & (hour <= 10)) | ((hour >= 17) & (hour <= 20))
+        base_prob += np.where(peak, 0.25, 0.0)
+        base_prob -= np.where(day >= 5, 0.05, 0.0)
+        base_prob += np.where(weather > 1, 0.30, 0.0)
+        
+        return np.minimum(base_prob, 0.95)
 
 class ReroutingEngine:
-    def __init__(self):
-        self.route_graph = self._build_route_network()
+    def __init__(self, network=None):
+        if network is None:
+            # Workers share one memory-mapped snapshot when one is configured
+            snapshot_path = os.environ.get("RAIL_NETWORK_SNAPSHOT")
+            if snapshot_path:
+                network = load_snapshot(snapshot_path)
+            else:
+                network = RailNetwork.from_adjacency(self._build_route_network())
+        self.load_network(network)
+    
+    def load_network(self, network):
+        """Swap in a RailNetwork; the route table searches its arrays in place"""
+        self.network = network
+        # Precomputed by startup warm-up (route_table.warm_if_small), not per construction
+        self.route_table = RouteTable.from_network(network)
+        self._route_graph = None
+
+    @property
+    def route_graph(self):
+        """{station: [neighbors]} dict of the network, built on first use"""
+        if self._route_graph is None:
+            self._route_graph = self.network.to_adjacency()
+        return self._route_graph
         
     def _build_route_network(self):
         """Build a simple railway network graph"""
@@ -66,41 +241,136 @@ class ReroutingEngine:
             "Jaipur": ["Delhi", "Jodhpur", "Udaipur"],
             "Lucknow": ["Delhi", "Kanpur", "Varanasi"]
         }
-        return network
+        # Every station gets its own entry and links run both ways
+        return symmetrize_adjacency(network)
     
     def find_alternative_route(self, start, destination, blocked_stations=[]):
-        """Find alternative routes using simple BFS"""
-        from collections import deque
+        """Find alternative routes from the precomputed shortest-path table"""
+        index = self.network.station_index
+        if start not in index or destination not in index:
+            return []
         
-        if start not in self.route_graph or destination not in self.route_graph:
+        return self.route_table.shortest_path(start, destination, blocked_stations)
+    
+    def _blocked_ids(self, blocked_stations):
+        index = self.network.station_index
+        return {index[s] for s in blocked_stations if s in index}
+    
+    def _describe_route(self, route):
+        """Station names, travel time and distance for a weighted route"""
+        return {
+            "path": [self.network.stations[i] for i in route.nodes],
+            "travel_time_minutes": round(float(route.cost), 1),
+            "distance_km": round(float(self.network.distance[route.edges].sum()), 1)
+        }
+    
+    def find_weighted_route(self, start, destination, blocked_stations=[], algorithm="astar"):
+        """Find the fastest route by running time using Dijkstra or A*"""
+        index = self.network.station_index
+        if start not in index or destination not in index:
+            return None
+        
+        search = astar if algorithm == "astar" else dijkstra
+        route = search(self.network, index[start], index[destination],
+                       self._blocked_ids(blocked_stations))
+        return self._describe_route(route) if route else None
+    
+    def find_ranked_routes(self, start, destination, k=3, blocked_stations=[]):
+        """Find up to k fastest alternative routes (Yen's algorithm)"""
+        index = self.network.station_index
+        if start not in index or destination not in index:
             return []
         
-        queue = deque([(start, [start])])
-        visited = set(blocked_stations)
+        routes = k_shortest_paths(self.network, index[start], index[destination], k,
+                                  self._blocked_ids(blocked_stations))
+        return [self._describe_route(route) for route in routes]
+    
+    def plan_reroutes(self, trains, blocked_stations=[], capacity=DEFAULT_SEGMENT_CAPACITY,
+                      capacity_overrides=None, time_budget=2.0):
+        """
+        Coordinated routes for many delayed trains competing for the same lines.
+        
+        `trains` are dicts with train_id, current_station, destination_station
+        and delay_minutes. Each line section takes `capacity` trains, or the
+        value given for its (station, station) pair in `capacity_overrides`.
+        Every train is scored by its delay plus the extra running time of its
+        route over the unblocked fastest one, plus any wait for capacity.
+        """
+        index = self.network.station_index
+        edge_capacity = np.full(self.network.edge_count, capacity, dtype=np.int64)
+        for (a, b), limit in (capacity_overrides or {}).items():
+            if a in index and b in index:
+                edges = self.network.find_edges(index[a], index[b]) + self.network.find_edges(index[b], index[a])
+                edge_capacity[edges] = limit
+        
+        routable = [i for i, t in enumerate(trains)
+                    if t["current_station"] in index and t["destination_station"] in index]
+        trips = [(index[trains[i]["current_station"]], index[trains[i]["destination_station"]],
+                  trains[i]["delay_minutes"]) for i in routable]
+        plan = coordinate_routes(self.network, trips, edge_capacity, self._blocked_ids(blocked_stations),
+                                 time_budget=time_budget)
         
-        while queue:
-            current, path = queue.popleft()
-            
-            if current == destination:
-                return path
-            
-            if current in visited:
+        planned = [None] * len(trains)
+        for k, i in enumerate(routable):
+            planned[i] = (plan["routes"][k], plan["baseline"][k], plan["baseline_paths"][k], plan["holds"][k])
+        cost = self.network.edge_cost().astype(np.float64)
+        results = []
+        for train, entry in zip(trains, planned):
+            route, baseline, baseline_path, hold = entry if entry else (None, None, None, 0.0)
+            delay = train["delay_minutes"]
+            if route is None:
+                results.append({
+                    "train_id": train["train_id"],
+                    "action": "HOLD - No route available",
+                    "path": [],
+                    "travel_time_minutes": None,
+                    "extra_minutes": None,
+                    "hold_minutes": 0,
+                    "total_delay_minutes": delay
+                })
                 continue
-            
-            visited.add(current)
-            
-            for neighbor in self.route_graph.get(current, []):
-                if neighbor not in visited:
-                    queue.append((neighbor, path + [neighbor]))
-        
-        return []
+            travel = float(cost[route.edges].sum())
+            extra = max(travel - baseline, 0.0) if baseline is not None else 0.0
+            rerouted = list(route.nodes) != list(baseline_path or route.nodes) or extra > REROUTE_TOLERANCE_MINUTES
+            results.append({
+                "train_id": train["train_id"],
+                "action": ("HOLD - Wait for line capacity" if hold > 0
+                           else "REROUTE - Take assigned path" if rerouted else "CONTINUE - Current route"),
+                "path": [self.network.stations[n] for n in route.nodes],
+                "travel_time_minutes": round(travel, 1),
+                "extra_minutes": round(extra, 1),
+                "hold_minutes": round(hold, 1),
+                "total_delay_minutes": round(delay + extra + hold, 1)
+            })
+        return {
+            "trains": results,
+            "objective": round(sum(r["total_delay_minutes"] for r in results), 1),
+            "iterations": plan["iterations"],
+            "converged": plan["converged"],
+            "overloaded_segments": plan["overloaded"]
+        }
+    
+    def set_congestion(self, source, target, penalty_minutes):
+        """Apply a live congestion penalty to a track section"""
+        self.network.set_congestion(source, target, penalty_minutes)
 
-# Global model instances
-delay_predictor = DelayPredictor()
-rerouting_engine = ReroutingEngine()
+# Global model instances, built on first use so importing the app stays cheap
+_delay_predictor = None
+_rerouting_engine = None
+_instances_lock = threading.Lock()
 
 def get_delay_predictor():
-    return delay_predictor
+    global _delay_predictor
+    if _delay_predictor is None:
+        with _instances_lock:
+            if _delay_predictor is None:
+                _delay_predictor = DelayPredictor(ModelArtifactStore())
+    return _delay_predictor
 
 def get_rerouting_engine():
-    return rerouting_engine
+    global _rerouting_engine
+    if _rerouting_engine is None:
+        with _instances_lock:
+            if _rerouting_engine is None:
+                _rerouting_engine = ReroutingEngine()
+    return _rerouting_engine
@@ -0,0 +1,349 @@
+import numpy as np
+import pandas as pd
+import json
+import zlib
+import os
+
+# Approximate (latitude, longitude) of the demo network's stations
+STATION_COORDINATES = {
+    "Mumbai": (19.0760, 72.8777),
+    "Pune": (18.5204, 73.8567),
+    "Surat": (21.1702, 72.8311),
+    "Vadodara": (22.3072, 73.1812),
+    "Solapur": (17.6599, 75.9064),
+    "Kolhapur": (16.7050, 74.2433),
+    "Delhi": (28.6139, 77.2090),
+    "Jaipur": (26.9124, 75.7873),
+    "Agra": (27.1767, 78.0081),
+    "Chandigarh": (30.7333, 76.7794),
+    "Lucknow": (26.8467, 80.9462),
+    "Bangalore": (12.9716, 77.5946),
+    "Chennai": (13.0827, 80.2707),
+    "Mysore": (12.2958, 76.6394),
+    "Hubli": (15.3647, 75.1240),
+    "Hyderabad": (17.3850, 78.4867),
+    "Coimbatore": (11.0168, 76.9558),
+    "Kolkata": (22.5726, 88.3639),
+    "Patna": (25.5941, 85.1376),
+    "Bhubaneswar": (20.2961, 85.8245),
+    "Guwahati": (26.1445, 91.7362),
+    "Vijayawada": (16.5062, 80.6480),
+    "Ahmedabad": (23.0225, 72.5714),
+    "Rajkot": (22.3039, 70.8022),
+    "Jodhpur": (26.2389, 73.0243),
+    "Udaipur": (24.5854, 73.7125),
+    "Kanpur": (26.4499, 80.3319),
+    "Varanasi": (25.3176, 82.9739),
+}
+
+SNAPSHOT_ARRAYS = ("offsets", "targets", "sources", "running_time", "distance", "lat", "lon")
+
+# Track length relative to great-circle distance, and typical average speed
+ROUTE_FACTOR = 1.25
+AVERAGE_SPEED_KMPM = 1.0  # 60 km/h
+
+def symmetrize_adjacency(graph):
+    """Give every station its own entry and add any missing reverse links"""
+    symmetric = {station: list(neighbors) for station, neighbors in graph.items()}
+    for station, neighbors in graph.items():
+        for neighbor in neighbors:
+            back = symmetric.setdefault(neighbor, [])
+            if station not in back:
+                back.append(station)
+    return symmetric
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; works on scalars or NumPy arrays"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 6371.0 * 2 * np.arcsin(np.sqrt(a))
+
+class RailNetwork:
+    """
+    Weighted railway graph in CSR form.
+
+    Edges of station i are offsets[i]:offsets[i + 1] in the edge arrays.
+    Each edge carries a running time (minutes), a distance (km) and a live
+    congestion penalty (minutes) that is added to the running time when
+    searching.
+    """
+
+    def __init__(self, stations, offsets, targets, running_time, distance, coordinates=None,
+                 lat=None, lon=None, sources=None):
+        # np.asarray keeps memory-mapped snapshot arrays as views, without copying
+        self.stations = list(stations)
+        self.station_index = {station: i for i, station in enumerate(self.stations)}
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.targets = np.asarray(targets, dtype=np.int32)
+        self.running_time = np.asarray(running_time, dtype=np.float32)
+        self.distance = np.asarray(distance, dtype=np.float32)
+        self.congestion = np.zeros(len(self.targets), dtype=np.float32)
+        if sources is None:
+            sources = np.repeat(
+                np.arange(len(self.stations), dtype=np.int32), np.diff(self.offsets)
+            )
+        self.sources = np.asarray(sources, dtype=np.int32)
+
+        # Station coordinates for the A* heuristic; NaN where unknown
+        if lat is not None and lon is not None:
+            self.lat = np.asarray(lat, dtype=np.float64)
+            self.lon = np.asarray(lon, dtype=np.float64)
+        else:
+            self.lat = np.full(len(self.stations), np.nan)
+            self.lon = np.full(len(self.stations), np.nan)
+            for station, (station_lat, station_lon) in (coordinates or {}).items():
+                if station in self.station_index:
+                    self.lat[self.station_index[station]] = station_lat
+                    self.lon[self.station_index[station]] = station_lon
+        self._max_speed = self._geometric_speed_bound()
+        self._search_lists = None
+        self._fingerprint = None
+
+    @classmethod
+    def from_arrays(cls, stations, src, dst, running_time, distance, lat=None, lon=None):
+        """Build from parallel edge arrays of integer station ids"""
+        src = np.asarray(src, dtype=np.int32)
+
+        # Stable sort keeps each station's neighbor order as given
+        order = np.argsort(src, kind="stable")
+        offsets = np.zeros(len(stations) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=len(stations)), out=offsets[1:])
+        return cls(
+            stations, offsets, np.asarray(dst, dtype=np.int32)[order],
+            np.asarray(running_time, dtype=np.float32)[order],
+            np.asarray(distance, dtype=np.float32)[order],
+            lat=lat, lon=lon, sources=src[order]
+        )
+
+    @classmethod
+    def from_edges(cls, stations, edges, coordinates=None):
+        """Build from (source, target, running_time, distance) tuples of station names"""
+        stations = list(stations)
+        index = {station: i for i, station in enumerate(stations)}
+        if edges:
+            src, dst, minutes, km = zip(*edges)
+        else:
+            src, dst, minutes, km = (), (), (), ()
+        coordinates = coordinates or {}
+        lat = np.array([coordinates.get(s, (np.nan, np.nan))[0] for s in stations], dtype=np.float64)
+        lon = np.array([coordinates.get(s, (np.nan, np.nan))[1] for s in stations], dtype=np.float64)
+        return cls.from_arrays(
+            stations, [index[s] for s in src], [index[d] for d in dst], minutes, km, lat, lon
+        )
+
+    @classmethod
+    def from_adjacency(cls, graph, coordinates=None):
+        """Build from a {station: [neighbors]} dict, estimating weights from coordinates"""
+        coordinates = coordinates if coordinates is not None else STATION_COORDINATES
+        stations = list(graph)
+        for neighbors in graph.values():
+            for neighbor in neighbors:
+                if neighbor not in graph and neighbor not in stations:
+                    stations.append(neighbor)
+
+        edges = []
+        for station, neighbors in graph.items():
+            for neighbor in neighbors:
+                if station in coordinates and neighbor in coordinates:
+                    km = float(haversine_km(*coordinates[station], *coordinates[neighbor])) * ROUTE_FACTOR
+                else:
+                    km = 100.0
+                edges.append((station, neighbor, km / AVERAGE_SPEED_KMPM, km))
+        return cls.from_edges(stations, edges, coordinates)
+
+    def _geometric_speed_bound(self):
+        """Max straight-line km per minute over all edges (keeps A* admissible)"""
+        if len(self.targets) == 0:
+            return None
+        km = haversine_km(
+            self.lat[self.sources], self.lon[self.sources],
+            self.lat[self.targets], self.lon[self.targets]
+        )
+        speed = km / np.maximum(self.running_time, 1e-6)
+        if np.isnan(speed).any():
+            return None
+        return float(speed.max()) if speed.max() > 0 else None
+
+    def __len__(self):
+        return len(self.stations)
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    def edge_cost(self):
+        """Effective edge weight: running time plus congestion penalty"""
+        return self.running_time + self.congestion
+
+    def search_arrays(self):
+        """
+        Memoryviews of the CSR arrays and edge costs for the search inner
+        loops: indexing yields Python numbers as fast as lists do, without
+        copying a memory-mapped snapshot into each worker
+        """
+        if self._search_lists is None:
+            self._search_lists = tuple(
+                memoryview(np.ascontiguousarray(array))
+                for array in (self.offsets, self.targets, self.edge_cost())
+            )
+        return self._search_lists
+
+    def find_edges(self, u, v):
+        """Edge ids from station id u to station id v"""
+        start, end = self.offsets[u], self.offsets[u + 1]
+        return (np.nonzero(self.targets[start:end] == v)[0] + start).tolist()
+
+    def set_congestion(self, source, target, minutes):
+        """Set the live penalty (minutes) on the source -> target edge(s)"""
+        u, v = self.station_index[source], self.station_index[target]
+        edges = self.find_edges(u, v)
+        if not edges:
+            raise KeyError(f"No edge {source} -> {target}")
+        self.congestion[edges] = minutes
+        self._search_lists = None
+        self._fingerprint = None
+
+    def clear_congestion(self):
+        self.congestion[:] = 0
+        self._search_lists = None
+        self._fingerprint = None
+
+    def fingerprint(self):
+        """Checksum of the topology and edge costs: equal across processes holding the same graph"""
+        if self._fingerprint is None:
+            crc = 0
+            for array in (self.offsets, self.targets, self.running_time, self.congestion):
+                crc = zlib.crc32(np.ascontiguousarray(array).data, crc)
+            self._fingerprint = f"{len(self.stations)}-{crc:08x}"
+        return self._fingerprint
+
+    def heuristic_to(self, target):
+        """Per-station lower bound on minutes to target, or None if unavailable"""
+        if self._max_speed is None:
+            return None
+        km = haversine_km(self.lat, self.lon, self.lat[target], self.lon[target])
+        return np.nan_to_num(km / self._max_speed, nan=0.0).tolist()
+
+    def to_adjacency(self):
+        """{station: [neighbors]} view of the graph for the BFS route table"""
+        stations = self.stations
+        targets = self.targets.tolist()
+        offsets = self.offsets.tolist()
+        return {
+            station: [stations[t] for t in targets[offsets[i]:offsets[i + 1]]]
+            for i, station in enumerate(stations)
+        }
+
+    def save_snapshot(self, path):
+        """Write the graph as .npy arrays plus a station list that workers can mmap"""
+        os.makedirs(path, exist_ok=True)
+        for name in SNAPSHOT_ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(path, "stations.json"), "w") as f:
+            json.dump(self.stations, f)
+
+def load_snapshot(path):
+    """Open a saved snapshot with memory-mapped arrays shared across processes"""
+    with open(os.path.join(path, "stations.json")) as f:
+        stations = json.load(f)
+    arrays = {
+        name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        for name in SNAPSHOT_ARRAYS
+    }
+    return RailNetwork(
+        stations, arrays["offsets"], arrays["targets"], arrays["running_time"],
+        arrays["distance"], lat=arrays["lat"], lon=arrays["lon"], sources=arrays["sources"]
+    )
+
+def _read_table(path):
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+def validate_edges(n_stations, src, dst):
+    """
+    Check an edge list for dangling endpoints, missing reverse links and
+    isolated stations. Returns a report dict; every list holds indices.
+    """
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    dangling = np.nonzero((src < 0) | (dst < 0))[0]
+
+    valid = (src >= 0) & (dst >= 0)
+    forward = src[valid] * n_stations + dst[valid]
+    reverse = dst[valid] * n_stations + src[valid]
+    asymmetric = np.nonzero(valid)[0][~np.isin(reverse, forward)]
+
+    degree = np.bincount(src[valid], minlength=n_stations) + np.bincount(dst[valid], minlength=n_stations)
+    isolated = np.nonzero(degree == 0)[0]
+
+    return {
+        "dangling_edges": dangling.tolist(),
+        "asymmetric_edges": asymmetric.tolist(),
+        "isolated_stations": isolated.tolist()
+    }
+
+def load_network_files(stations_path, edges_path, symmetrize=False, strict=True):
+    """
+    Build a RailNetwork from station and edge tables (CSV or Parquet).
+
+    Stations need a `station` column and may have `lat`/`lon`. Edges need
+    `source` and `target` and may have `running_time` (minutes) and
+    `distance` (km); missing weights are estimated from coordinates.
+    With symmetrize=True missing reverse edges are added; otherwise a
+    strict load rejects dangling or one-way edges with a ValueError.
+    """
+    stations_df = _read_table(stations_path)
+    edges_df = _read_table(edges_path)
+
+    stations = stations_df["station"].astype(str).tolist()
+    index = pd.Index(stations)
+    if not index.is_unique:
+        raise ValueError("Duplicate station names in station table")
+    src = index.get_indexer(edges_df["source"].astype(str))
+    dst = index.get_indexer(edges_df["target"].astype(str))
+
+    lat = stations_df["lat"].to_numpy(dtype=np.float64) if "lat" in stations_df else np.full(len(stations), np.nan)
+    lon = stations_df["lon"].to_numpy(dtype=np.float64) if "lon" in stations_df else np.full(len(stations), np.nan)
+
+    report = validate_edges(len(stations), src, dst)
+    if report["dangling_edges"]:
+        if strict:
+            raise ValueError(f"{len(report['dangling_edges'])} edges reference unknown stations")
+        keep = (src >= 0) & (dst >= 0)
+        edges_df, src, dst = edges_df[keep], src[keep], dst[keep]
+        report = validate_edges(len(stations), src, dst)
+
+    if "distance" in edges_df:
+        distance = edges_df["distance"].to_numpy(dtype=np.float64)
+    else:
+        distance = np.nan_to_num(haversine_km(lat[src], lon[src], lat[dst], lon[dst]) * ROUTE_FACTOR, nan=100.0)
+    if "running_time" in edges_df:
+        running_time = edges_df["running_time"].to_numpy(dtype=np.float64)
+    else:
+        running_time = distance / AVERAGE_SPEED_KMPM
+
+    if report["asymmetric_edges"]:
+        if symmetrize:
+            missing = np.asarray(report["asymmetric_edges"], dtype=np.int64)
+            # One reverse edge per missing pair, even if the one-way edge is repeated
+            _, first = np.unique(src[missing] * len(stations) + dst[missing], return_index=True)
+            missing = missing[np.sort(first)]
+            src, dst = np.concatenate([src, dst[missing]]), np.concatenate([dst, src[missing]])
+            distance = np.concatenate([distance, distance[missing]])
+            running_time = np.concatenate([running_time, running_time[missing]])
+        elif strict:
+            raise ValueError(f"{len(report['asymmetric_edges'])} edges have no reverse edge")
+
+    return RailNetwork.from_arrays(stations, src, dst, running_time, distance, lat, lon)
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 4:
+        print("usage: python -m app.network STATIONS EDGES SNAPSHOT_DIR")
+        sys.exit(1)
+    network = load_network_files(sys.argv[1], sys.argv[2], symmetrize=True)
+    network.save_snapshot(sys.argv[3])
+    print(f"Wrote {len(network)} stations / {network.edge_count} edges to {sys.argv[3]}")
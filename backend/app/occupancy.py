@@ -0,0 +1,500 @@
+from app.models import get_rerouting_engine
+from app.routing import dijkstra
+from app.schedule import get_schedule_store, train_keys
+from app.schedule_table import MINUTES_PER_DAY, minute_labels
+import numpy as np
+import threading
+
+# A train holds its platform this long before departure, and the platform
+# needs this long after departure before the next train may use it
+PLATFORM_DWELL_MINUTES = 10
+PLATFORM_CLEARANCE_MINUTES = 2
+# Minimum gap between following trains on a segment, at entry and at exit
+SEGMENT_HEADWAY_MINUTES = 5
+# Platform numbers are packed under the station code in platform resource ids
+PLATFORM_SLOTS = 1 << 16
+SCAN_CHUNK_ROWS = 100000
+
+# Times are kept below this (arrivals past midnight plus the next-day copy)
+_TIME_SPAN = 4 * MINUTES_PER_DAY
+
+def _label(minute):
+    return minute_labels([int(minute) % MINUTES_PER_DAY])[0]
+
+class IntervalIndex:
+    """
+    Time intervals [start, end) held on integer resources.
+
+    Intervals are sorted by (resource, start), with a running max of `end`
+    left to right and a running min right to left within each resource.
+    Both are monotone, so "who overlaps [s, e)" and "who is within headway
+    of (entry, exit)" binary-search to the candidate range instead of
+    walking the resource's whole timeline. Each interval is repeated one
+    day later so runs past midnight clash with early-morning ones.
+    """
+
+    def __init__(self, resource, start, end, owner, direction=None):
+        resource = np.asarray(resource, dtype=np.int64)
+        start = np.asarray(start, dtype=np.int64)
+        end = np.asarray(end, dtype=np.int64)
+        owner = np.asarray(owner, dtype=np.int64)
+        direction = np.zeros(len(resource), dtype=np.int8) if direction is None else np.asarray(direction, dtype=np.int8)
+        self.raw = (resource, start, end, owner, direction)
+
+        resource, owner, direction = (np.concatenate([a, a]) for a in (resource, owner, direction))
+        start = np.concatenate([start, start + MINUTES_PER_DAY])
+        end = np.concatenate([end, end + MINUTES_PER_DAY])
+        shadow = np.repeat(np.array([False, True]), len(owner) // 2)
+
+        order = np.lexsort((start, resource))
+        self.resource, self.start, self.end = resource[order], start[order], end[order]
+        self.owner, self.direction, self.shadow = owner[order], direction[order], shadow[order]
+        base = self.resource * _TIME_SPAN
+        self._keys = base + self.start
+        # Offsetting by resource keeps the accumulations from crossing resources
+        self._max_end = np.maximum.accumulate(base + self.end) - base if len(base) else base
+        self._min_end = np.minimum.accumulate((base + self.end)[::-1])[::-1] - base if len(base) else base
+
+    def __len__(self):
+        return len(self.owner) // 2
+
+    def _first_at(self, resource, minute):
+        """Position of the first interval on `resource` starting at or after `minute`"""
+        return int(np.searchsorted(self._keys, resource * _TIME_SPAN + max(minute, 0), side="left"))
+
+    def overlapping(self, resource, start, end):
+        """Positions of intervals on `resource` overlapping [start, end)"""
+        lo, hi = self._first_at(resource, 0), self._first_at(resource, end)
+        first = lo + int(np.searchsorted(self._max_end[lo:hi], start, side="right"))
+        candidates = np.arange(first, hi)
+        return candidates[self.end[candidates] > start]
+
+    def within_headway(self, resource, entry, exit, headway):
+        """
+        Positions of intervals on `resource` whose entry or exit is less than
+        `headway` from (entry, exit), including ones overtaking or overtaken
+        """
+        lo, split, hi = (self._first_at(resource, m) for m in (0, entry + 1, _TIME_SPAN))
+        # Entered at or before `entry`: too close if entered or leaves within headway
+        close_entry = np.arange(self._first_at(resource, entry - headway + 1), split)
+        first = lo + int(np.searchsorted(self._max_end[lo:split], exit - headway, side="right"))
+        late_exit = np.arange(first, split)
+        late_exit = late_exit[self.end[late_exit] > exit - headway]
+        # Entered after `entry`: too close if entered or leaves within headway
+        close_after = np.arange(split, self._first_at(resource, entry + headway))
+        last = split + int(np.searchsorted(self._min_end[split:hi], exit + headway, side="left"))
+        early_exit = np.arange(split, last)
+        early_exit = early_exit[self.end[early_exit] < exit + headway]
+        return np.unique(np.concatenate([close_entry, late_exit, close_after, early_exit]))
+
+    def pairs(self, pad=0, chunk=SCAN_CHUNK_ROWS):
+        """
+        Yield (i, j) position arrays, i < j on the same resource with
+        start[j] < end[i] + pad, in chunks; shadow-only pairs are skipped.
+        """
+        n = len(self._keys)
+        for lo in range(0, n, chunk):
+            i = np.arange(lo, min(n, lo + chunk))
+            stop = np.searchsorted(self._keys, self.resource[i] * _TIME_SPAN + self.end[i] + pad, side="left")
+            counts = np.maximum(stop - i - 1, 0)
+            i = np.repeat(i, counts)
+            step = np.arange(len(i)) - np.repeat(np.cumsum(counts) - counts, counts)
+            j = i + 1 + step
+            keep = ~(self.shadow[i] & self.shadow[j])
+            yield i[keep], j[keep]
+
+def _combine(first, second):
+    """IntervalIndex over the raw intervals of two indexes"""
+    return IntervalIndex(*(np.concatenate([a, b]) for a, b in zip(first.raw, second.raw)))
+
+def _segment_ids(network, edges):
+    """Undirected segment resource id and direction (0/1) of graph edges"""
+    u = network.sources[edges].astype(np.int64)
+    v = network.targets[edges].astype(np.int64)
+    return np.minimum(u, v) * len(network) + np.maximum(u, v), (u > v).astype(np.int8)
+
+class _Reservations:
+    """
+    Accepted reroutes by id, the schedule runs they release and their
+    platform and segment intervals. Never mutated: reserve() builds a new
+    one and publishes it with a single assignment, so a reader that takes
+    it once sees reroutes, releases and indexes that agree.
+    """
+
+    def __init__(self, by_id, released_keys, released):
+        self.by_id = by_id
+        self.released_keys = released_keys
+        self.released = released
+        platform = [r["platform"] for r in by_id.values() if r["platform"] is not None]
+        self.platforms = IntervalIndex(*zip(*platform)) if platform else IntervalIndex([], [], [], [])
+        segments = [r["segments"] for r in by_id.values()]
+        self.segments = (
+            IntervalIndex(*(np.concatenate(parts) for parts in zip(*segments)))
+            if segments else IntervalIndex([], [], [], [], [])
+        )
+
+class OccupancyIndex:
+    """
+    Platform and track-segment occupancy of one schedule snapshot, plus
+    accepted reroutes.
+
+    - Platforms: a train holds its platform at its source station from
+      PLATFORM_DWELL_MINUTES before departure until
+      PLATFORM_CLEARANCE_MINUTES after; overlapping holders clash.
+    - Segments (graph edges, both directions): a scheduled run follows the
+      shortest path from its source to its destination, with the run time
+      spread over the edges by running time. Every segment is treated as
+      single line: opposing trains may not overlap, and following trains
+      must be SEGMENT_HEADWAY_MINUTES apart at entry and at exit (so no
+      overtaking).
+
+    Accepted reroutes are reservations (owners -1, -2, ...) and release the
+    run they replace. Both carry over when the schedule is reloaded.
+    """
+
+    def __init__(self, snapshot, network, previous=None):
+        self.snapshot = snapshot
+        self.network = network
+        table = snapshot.table
+        self.platforms = self._platform_intervals(table)
+        self.segments = self._segment_intervals(table, network)
+
+        by_id = dict(previous.reserved.by_id) if previous else {}
+        released_keys = previous.reserved.released_keys if previous else frozenset()
+        released = np.isin(snapshot.keys(), np.fromiter(released_keys, dtype=np.uint64))
+        self.reserved = _Reservations(by_id, released_keys, released)
+        self._next_reservation = previous._next_reservation if previous else 1
+
+    @staticmethod
+    def _platform_intervals(table):
+        dep = table.departure_minutes()
+        rows = np.nonzero((dep >= 0) & (table.platform > 0))[0]
+        start = (dep[rows] - PLATFORM_DWELL_MINUTES) % MINUTES_PER_DAY
+        return IntervalIndex(
+            table.source[rows].astype(np.int64) * PLATFORM_SLOTS + table.platform[rows],
+            start, start + PLATFORM_DWELL_MINUTES + PLATFORM_CLEARANCE_MINUTES, rows
+        )
+
+    @staticmethod
+    def _segment_intervals(table, network):
+        dep, arr = table.departure_minutes(), table.arrival_minutes()
+        n = table.n_graph_stations
+        rows = np.nonzero(
+            (dep >= 0) & (arr >= 0) & (table.source < n) & (table.destination < n)
+            & (table.source != table.destination)
+        )[0]
+        # Timetables repeat a few thousand station pairs; route each pair once
+        pairs, inverse = np.unique(
+            table.source[rows].astype(np.int64) * n + table.destination[rows], return_inverse=True
+        )
+        edges, lo_fraction, hi_fraction, lengths = [], [], [], []
+        for pair in pairs.tolist():
+            route = dijkstra(network, pair // n, pair % n)
+            pair_edges = np.asarray(route.edges if route else [], dtype=np.int64)
+            time = network.running_time[pair_edges].astype(np.float64)
+            cumulative = np.concatenate([[0.0], np.cumsum(time)]) / max(time.sum(), 1e-9)
+            edges.append(pair_edges)
+            lo_fraction.append(cumulative[:-1])
+            hi_fraction.append(cumulative[1:])
+            lengths.append(len(pair_edges))
+        if not lengths:
+            return IntervalIndex([], [], [], [], [])
+
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        counts = np.asarray(lengths)[inverse]
+        row_of = np.repeat(rows, counts)
+        position = np.repeat(offsets[:-1][inverse], counts) + (
+            np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        )
+        dep, arr = dep[row_of], arr[row_of]
+        duration = (arr - dep) % MINUTES_PER_DAY
+        entry = dep + np.rint(np.concatenate(lo_fraction)[position] * duration).astype(np.int64)
+        exit = dep + np.rint(np.concatenate(hi_fraction)[position] * duration).astype(np.int64)
+        segment, direction = _segment_ids(network, np.concatenate(edges)[position])
+        return IntervalIndex(segment, entry, np.maximum(exit, entry + 1), row_of, direction)
+
+    def _owner(self, reserved, owner, start=None):
+        """Conflict entry for an owner (schedule row or reservation id)"""
+        if owner >= 0:
+            table = self.snapshot.table
+            entry = {
+                "train_id": table.train_id[owner],
+                "scheduled_departure": table.column("scheduled_departure", [owner])[0]
+            }
+        else:
+            reservation = reserved.by_id[owner]
+            entry = {"train_id": reservation["train_id"], "reroute": True}
+        if start is not None:
+            entry["from"] = _label(start)
+        return entry
+
+    def _live(self, reserved, index, positions, train_id=None):
+        """Drop released runs and the train's own runs from query hits"""
+        owners = index.owner[positions]
+        keep = np.ones(len(positions), dtype=bool)
+        scheduled = owners >= 0
+        keep[scheduled] = ~reserved.released[owners[scheduled]]
+        if train_id is not None:
+            table = self.snapshot.table
+            keep[scheduled] &= table.train_id[owners[scheduled]] != train_id
+            keep[~scheduled] &= np.array(
+                [reserved.by_id[o]["train_id"] != train_id for o in owners[~scheduled].tolist()], dtype=bool
+            )
+        return positions[keep]
+
+    def _platform_holders(self, reserved, resource, start, end, train_id=None):
+        holders = []
+        for index in (self.platforms, reserved.platforms):
+            for minute in (start, start + MINUTES_PER_DAY):
+                hits = self._live(reserved, index, index.overlapping(resource, minute, end + minute - start), train_id)
+                holders.extend((int(index.owner[p]), int(index.start[p])) for p in hits)
+        return list(dict(holders).items())
+
+    def _segment_holders(self, reserved, segment, direction, entry, exit, train_id=None):
+        holders = []
+        for index in (self.segments, reserved.segments):
+            for shift in (0, MINUTES_PER_DAY):
+                opposing = index.overlapping(segment, entry + shift, exit + shift)
+                opposing = opposing[index.direction[opposing] != direction]
+                following = index.within_headway(segment, entry + shift, exit + shift, SEGMENT_HEADWAY_MINUTES)
+                following = following[index.direction[following] == direction]
+                for reason, hits in (("opposing", opposing), ("headway", following)):
+                    holders.extend(
+                        (int(index.owner[p]), (reason, int(index.start[p])))
+                        for p in self._live(reserved, index, hits, train_id)
+                    )
+        return list(dict(holders).items())
+
+    def platforms_at(self, station):
+        """Platform numbers the schedule uses at a station"""
+        rows = self.snapshot.indexes["source"].get(station, [])
+        return sorted(set(self.snapshot.table.platform[rows].tolist()) - {0})
+
+    def _path_intervals(self, path, depart):
+        """(segment, direction, entry, exit) per hop of a station-name path leaving at `depart`"""
+        index = self.network.station_index
+        cost = self.network.edge_cost()
+        hops, clock = [], depart
+        for a, b in zip(path, path[1:]):
+            edges = self.network.find_edges(index[a], index[b]) if a in index and b in index else []
+            if not edges:
+                continue
+            minutes = max(1, int(round(float(cost[edges[0]]))))
+            segment, direction = _segment_ids(self.network, np.array(edges[:1]))
+            hops.append((a, b, int(segment[0]), int(direction[0]), clock, clock + minutes))
+            clock += minutes
+        return hops, clock
+
+    def check_path(self, path, depart, train_id=None, platform=None):
+        """
+        Conflicts for a train running `path` (station names) from `depart`
+        (minutes since midnight). The train's own scheduled runs and earlier
+        reroutes are ignored. At the destination, `platform` is checked if
+        given, else the lowest free platform there is suggested.
+        """
+        reserved = self.reserved
+        depart = int(depart) % MINUTES_PER_DAY
+        hops, arrival = self._path_intervals(path, depart)
+        segments = []
+        for a, b, segment, direction, entry, exit in hops:
+            for owner, (reason, start) in self._segment_holders(reserved, segment, direction, entry, exit, train_id):
+                segments.append({
+                    "segment": f"{a} - {b}", "reason": reason,
+                    "entry": _label(entry), "exit": _label(exit),
+                    "train": self._owner(reserved, owner, start)
+                })
+
+        station = path[-1] if path else None
+        code = self.snapshot.table.station_index.get(station)
+        candidates = [platform] if platform is not None else self.platforms_at(station)
+        dwell = PLATFORM_DWELL_MINUTES + PLATFORM_CLEARANCE_MINUTES
+        assigned, occupied = None, []
+        for number in candidates:
+            holders = [] if code is None else self._platform_holders(
+                reserved, code * PLATFORM_SLOTS + number, arrival % MINUTES_PER_DAY, arrival % MINUTES_PER_DAY + dwell, train_id
+            )
+            if not holders:
+                assigned = number
+                break
+            if platform is not None:
+                occupied = [self._owner(reserved, owner, start) for owner, start in holders]
+        return {
+            "clear": not segments and (assigned is not None or not candidates),
+            "arrival_time": _label(arrival),
+            "segments": segments,
+            "platform": {"station": station, "platform": assigned, "occupied_by": occupied,
+                         "known_platforms": len(candidates)}
+        }
+
+    def _runs_in_progress(self, train_id, minute):
+        """Schedule rows of a train running at `minute`"""
+        table = self.snapshot.table
+        rows = self.snapshot.train_index.get_indexer_for([train_id])
+        rows = rows[rows >= 0]
+        dep, arr = table.departure_minutes()[rows], table.arrival_minutes()[rows]
+        running = (dep >= 0) & (arr >= 0) & (((minute - dep) % MINUTES_PER_DAY) < ((arr - dep) % MINUTES_PER_DAY))
+        return rows[running]
+
+    def reserve(self, train_id, path, depart, platform=None):
+        """
+        Record an accepted reroute: the train's run in progress is released
+        and the new path (and destination platform, if any) is held.
+        Replaces any earlier reroute of the same train. Returns its id.
+        """
+        reserved = self.reserved
+        depart = int(depart) % MINUTES_PER_DAY
+        hops, arrival = self._path_intervals(path, depart)
+        rows = self._runs_in_progress(train_id, depart)
+        table = self.snapshot.table
+        released_keys = reserved.released_keys | frozenset(
+            train_keys(table.train_id[rows], table.departure_minutes()[rows]).tolist()
+        )
+        released = reserved.released.copy()
+        released[rows] = True
+
+        by_id = {r: reservation for r, reservation in reserved.by_id.items() if reservation["train_id"] != train_id}
+        rid = -self._next_reservation
+        self._next_reservation += 1
+        code = table.station_index.get(path[-1]) if path else None
+        held_platform = None
+        if platform is not None and code is not None:
+            start = arrival % MINUTES_PER_DAY
+            held_platform = (code * PLATFORM_SLOTS + platform, start,
+                             start + PLATFORM_DWELL_MINUTES + PLATFORM_CLEARANCE_MINUTES, rid)
+        by_id[rid] = {
+            "train_id": train_id,
+            "path": list(path),
+            "departure": depart,
+            "platform": held_platform,
+            "segments": (
+                np.array([h[2] for h in hops], dtype=np.int64), np.array([h[4] for h in hops], dtype=np.int64),
+                np.array([h[5] for h in hops], dtype=np.int64), np.full(len(hops), rid, dtype=np.int64),
+                np.array([h[3] for h in hops], dtype=np.int8)
+            )
+        }
+        self.reserved = _Reservations(by_id, released_keys, released)
+        return rid
+
+    def _location(self, kind, resource):
+        stations = self.snapshot.table.stations if kind == "platform" else self.network.stations
+        if kind == "platform":
+            return f"{stations[resource // PLATFORM_SLOTS]} platform {resource % PLATFORM_SLOTS}"
+        n = len(self.network)
+        return f"{stations[resource // n]} - {stations[resource % n]}"
+
+    def _clash_pairs(self, index, kind, released):
+        """Unique clashing (resource, owner, owner, start, reason) rows of one index, in one pass"""
+        found = []
+        pad = SEGMENT_HEADWAY_MINUTES if kind == "segment" else 0
+        for i, j in index.pairs(pad):
+            if kind == "platform":
+                reason = np.full(len(i), "occupied", dtype=object)
+                keep = np.ones(len(i), dtype=bool)
+            else:
+                opposing = index.direction[i] != index.direction[j]
+                overlap = index.start[j] < index.end[i]
+                close = ((index.start[j] - index.start[i] < SEGMENT_HEADWAY_MINUTES)
+                         | (index.end[j] - index.end[i] < SEGMENT_HEADWAY_MINUTES))
+                keep = np.where(opposing, overlap, close)
+                reason = np.where(opposing, "opposing", "headway").astype(object)
+            a, b = index.owner[i], index.owner[j]
+            keep &= a != b
+            for owners in (a, b):
+                scheduled = owners >= 0
+                keep[scheduled] &= ~released[owners[scheduled]]
+            found.append((index.resource[i][keep], a[keep], b[keep], index.start[j][keep], reason[keep]))
+        if not found:
+            return []
+        resource, a, b, start, reason = (np.concatenate(parts) for parts in zip(*found))
+        first, second = np.minimum(a, b), np.maximum(a, b)
+        _, unique = np.unique(np.column_stack([resource, first, second]), axis=0, return_index=True)
+        unique = np.sort(unique)
+        return list(zip(resource[unique].tolist(), a[unique].tolist(), b[unique].tolist(),
+                        start[unique].tolist(), reason[unique].tolist()))
+
+    def scan(self, limit=None):
+        """
+        Every platform and segment clash in the day's timetable and accepted
+        reroutes, ordered by time; returns (total, clashes[:limit])
+        """
+        reserved = self.reserved
+        clashes = []
+        for kind, base, held in (("platform", self.platforms, reserved.platforms),
+                                 ("segment", self.segments, reserved.segments)):
+            index = _combine(base, held) if len(held) else base
+            for resource, a, b, start, reason in self._clash_pairs(index, kind, reserved.released):
+                clashes.append((start % MINUTES_PER_DAY, kind, resource, a, b, reason))
+        clashes.sort(key=lambda clash: clash[0])
+        shown = clashes if limit is None else clashes[:limit]
+        return len(clashes), [
+            {
+                "type": kind,
+                "location": self._location(kind, resource),
+                "reason": reason,
+                "at": _label(start),
+                "trains": [self._owner(reserved, a), self._owner(reserved, b)]
+            }
+            for start, kind, resource, a, b, reason in shown
+        ]
+
+class ReservationConflict(Exception):
+    """A reroute clashes with scheduled traffic or earlier reroutes; `check` holds the conflicts"""
+
+    def __init__(self, check):
+        super().__init__("Reroute conflicts with scheduled traffic")
+        self.check = check
+
+class OccupancyTracker:
+    """Keeps an OccupancyIndex for the live schedule, rebuilt (with reservations) on reload"""
+
+    def __init__(self, store=None, engine=None):
+        self.store = store or get_schedule_store()
+        self.engine = engine or get_rerouting_engine()
+        self._index = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        snapshot = self.store.refresh()
+        with self._lock:
+            return self._current(snapshot)
+
+    def _current(self, snapshot):
+        """The index for `snapshot`, rebuilt if needed; caller holds self._lock"""
+        if self._index is None or self._index.snapshot is not snapshot:
+            self._index = OccupancyIndex(snapshot, self.engine.network, self._index)
+        return self._index
+
+    def check_path(self, path, depart, train_id=None, platform=None):
+        return self.current().check_path(path, depart, train_id, platform)
+
+    def reserve(self, train_id, path, depart, platform=None, force=False):
+        """
+        Check a reroute and hold it in one step, so two clashing reroutes
+        cannot both pass the check. Raises ReservationConflict unless it is
+        clear or `force`; without a `platform`, the suggested free one is
+        held. Returns the reservation id, platform and check.
+        """
+        snapshot = self.store.refresh()
+        with self._lock:
+            index = self._current(snapshot)
+            check = index.check_path(path, depart, train_id, platform)
+            if not check["clear"] and not force:
+                raise ReservationConflict(check)
+            if platform is None:
+                platform = check["platform"]["platform"]
+            reservation_id = index.reserve(train_id, path, depart, platform)
+        return {"reservation_id": reservation_id, "platform": platform, "conflicts": check}
+
+    def scan(self, limit=None):
+        return self.current().scan(limit)
+
+_occupancy = None
+_occupancy_lock = threading.Lock()
+
+def get_occupancy_tracker():
+    global _occupancy
+    if _occupancy is None:
+        with _occupancy_lock:
+            if _occupancy is None:
+                _occupancy = OccupancyTracker()
+    return _occupancy
@@ -0,0 +1,374 @@
+from app.occupancy import (
+    PLATFORM_CLEARANCE_MINUTES, PLATFORM_DWELL_MINUTES, PLATFORM_SLOTS, SEGMENT_HEADWAY_MINUTES,
+    get_occupancy_tracker
+)
+from app.schedule_table import MINUTES_PER_DAY
+import numpy as np
+import threading
+import heapq
+
+# Passengers need this long to change trains; departures up to the window
+# after an arrival are its connections, and each waits at most the hold
+MIN_CONNECTION_MINUTES = 5
+CONNECTION_WINDOW_MINUTES = 30
+MAX_CONNECTION_HOLD_MINUTES = 15
+MAX_CONNECTIONS_PER_ARRIVAL = 10
+# Stock and crew of an arriving train work the first return departure
+# leaving at least TURNAROUND_MINUTES later, within the window
+TURNAROUND_MINUTES = 20
+TURNAROUND_WINDOW_MINUTES = 120
+MAX_PROPAGATED_DELAY_MINUTES = MINUTES_PER_DAY
+
+# Dependency kinds, by their code in DelayPropagator.kind
+DEPENDENCIES = ("platform", "segment", "connection", "turnaround")
+_CONNECTION = DEPENDENCIES.index("connection")
+_TIME_SPAN = 2 * MINUTES_PER_DAY
+
+def _expand(lo, counts):
+    """Concatenated ranges [lo[i], lo[i] + counts[i])"""
+    return np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+def _consecutive(resource, time, owner):
+    """(u, v) position pairs of each interval and the next one on its resource, by time"""
+    order = np.lexsort((owner, time, resource))
+    same = resource[order][1:] == resource[order][:-1]
+    return order[:-1][same], order[1:][same]
+
+def _platform_edges(table):
+    """Each train to the next train departing from the same platform"""
+    dep = table.departure_minutes()
+    rows = np.nonzero((dep >= 0) & (table.platform > 0))[0]
+    i, j = _consecutive(table.source[rows].astype(np.int64) * PLATFORM_SLOTS + table.platform[rows], dep[rows], rows)
+    u, v = rows[i], rows[j]
+    slack = (dep[v] - PLATFORM_DWELL_MINUTES) - (dep[u] + PLATFORM_CLEARANCE_MINUTES)
+    return u, v, slack
+
+def _segment_edges(segments):
+    """
+    Each train to the next one entering a segment it uses: a follower keeps
+    the headway at entry and exit, an opposing train enters once it leaves
+    """
+    resource, entry, exit, owner, direction = segments.raw
+    i, j = _consecutive(resource, entry, owner)
+    following = direction[i] == direction[j]
+    slack = np.where(
+        following,
+        np.minimum(entry[j] - entry[i], exit[j] - exit[i]) - SEGMENT_HEADWAY_MINUTES,
+        entry[j] - exit[i]
+    )
+    return owner[i], owner[j], slack
+
+def _arrival_edges(table):
+    """Connections and turnarounds from each arrival at a station to departures from it"""
+    dep, arr = table.departure_minutes(), table.arrival_minutes()
+    rows = np.nonzero((dep >= 0) & (arr >= 0))[0]
+    # Arrivals past midnight feed the next day's trains, which are not modelled
+    arrival = np.where(arr[rows] < dep[rows], arr[rows] + MINUTES_PER_DAY, arr[rows])
+    feeders = rows[arrival < MINUTES_PER_DAY]
+    arrival = arrival[arrival < MINUTES_PER_DAY].astype(np.int64)
+    source, destination = table.source.astype(np.int64), table.destination.astype(np.int64)
+
+    # Departures by (station, minute): connections are a contiguous slice
+    keys = source[rows] * _TIME_SPAN + dep[rows]
+    order = np.argsort(keys, kind="stable")
+    keys, departures = keys[order], rows[order]
+    base = destination[feeders] * _TIME_SPAN + arrival
+    lo = np.searchsorted(keys, base + MIN_CONNECTION_MINUTES, side="left")
+    hi = np.searchsorted(keys, base + CONNECTION_WINDOW_MINUTES, side="right")
+    counts = np.minimum(hi - lo, MAX_CONNECTIONS_PER_ARRIVAL)
+    u = np.repeat(feeders, counts)
+    v = departures[_expand(lo, counts)]
+    connection = (u, v, dep[v] - (np.repeat(arrival, counts) + MIN_CONNECTION_MINUTES))
+
+    # Departures by (source, destination, minute): the return working
+    n = len(table.stations)
+    keys = (source[rows] * n + destination[rows]) * _TIME_SPAN + dep[rows]
+    order = np.argsort(keys, kind="stable")
+    keys, departures = keys[order], rows[order]
+    wanted = (destination[feeders] * n + source[feeders]) * _TIME_SPAN + arrival + TURNAROUND_MINUTES
+    first = np.minimum(np.searchsorted(keys, wanted, side="left"), max(len(keys) - 1, 0))
+    found = np.zeros(len(feeders), dtype=bool)
+    if len(keys):
+        found = (keys[first] >= wanted) & (keys[first] <= wanted + TURNAROUND_WINDOW_MINUTES - TURNAROUND_MINUTES)
+    u, v = feeders[found], departures[first[found]]
+    turnaround = (u, v, dep[v] - (arrival[found] + TURNAROUND_MINUTES))
+    return connection, turnaround
+
+class DelayPropagator:
+    """
+    Knock-on delays across the day's timetable.
+
+    Every scheduled run is a node; an edge u -> v means v cannot leave
+    until u has released something v needs, and carries the scheduled
+    slack between the two:
+    - platform: v departs from the platform u leaves next;
+    - segment: v is the next train into a track segment u uses (headway,
+      or single-line clearance for an opposing train);
+    - connection: v departs from u's arrival station within
+      CONNECTION_WINDOW_MINUTES; v waits at most MAX_CONNECTION_HOLD_MINUTES;
+    - turnaround: v is the first return working u's stock and crew can take.
+
+    A train's delay is its own (primary) delay or the most any predecessor
+    pushes onto it, delay(u) - slack, whichever is larger; the published
+    timetable is taken as feasible, so negative slack counts as none.
+    Delays are pushed forward event by event in order of actual departure,
+    so each train is settled once in the usual case. State persists between
+    calls and `apply` only walks the trains a change can reach.
+    """
+
+    def __init__(self, snapshot, segments):
+        self.snapshot = snapshot
+        table = snapshot.table
+        self.n = len(table)
+        connection, turnaround = _arrival_edges(table)
+        parts = [_platform_edges(table), _segment_edges(segments), connection, turnaround]
+        u, v, slack = (np.concatenate([p[k] for p in parts]).astype(np.int64) for k in range(3))
+        kind = np.repeat(np.arange(len(parts), dtype=np.int8), [len(p[0]) for p in parts])
+
+        # One edge per (u, v, kind), keeping the tightest slack
+        keep = u != v
+        u, v, slack, kind = u[keep], v[keep], np.maximum(slack[keep], 0), kind[keep]
+        order = np.lexsort((slack, kind, v, u))
+        u, v, slack, kind = u[order], v[order], slack[order], kind[order]
+        first = np.ones(len(u), dtype=bool)
+        first[1:] = (u[1:] != u[:-1]) | (v[1:] != v[:-1]) | (kind[1:] != kind[:-1])
+        self.source, self.target, self.slack, self.kind = u[first], v[first], slack[first], kind[first]
+
+        # Edges are grouped by source; predecessors index into the same edges
+        self.successors = np.searchsorted(self.source, np.arange(self.n + 1))
+        self.by_target = np.argsort(self.target, kind="stable")
+        self.predecessors = np.searchsorted(self.target[self.by_target], np.arange(self.n + 1))
+        self._lists = (self.source.tolist(), self.target.tolist(), self.slack.tolist(), self.kind.tolist(),
+                       self.successors.tolist(), self.by_target.tolist(), self.predecessors.tolist())
+
+        self.departure = np.maximum(table.departure_minutes(), 0).tolist()
+        self.primary = [0] * self.n
+        self.delay = [0] * self.n
+        # Edge that set each train's delay, -1 for its own
+        self.cause = [-1] * self.n
+
+    @property
+    def edge_count(self):
+        return len(self.source)
+
+    def dependency_counts(self):
+        counts = np.bincount(self.kind, minlength=len(DEPENDENCIES))
+        return {name: int(n) for name, n in zip(DEPENDENCIES, counts)}
+
+    def _push(self, delay, e):
+        """Delay edge `e` passes on from a predecessor `delay` minutes late"""
+        _, _, slack, kind, _, _, _ = self._lists
+        pushed = delay - slack[e]
+        if kind[e] == _CONNECTION and pushed > MAX_CONNECTION_HOLD_MINUTES:
+            pushed = MAX_CONNECTION_HOLD_MINUTES
+        return min(pushed, MAX_PROPAGATED_DELAY_MINUTES)
+
+    def _cone(self, roots):
+        """Trains whose delay traces back, edge by edge, to one of `roots`"""
+        _, target, _, _, successors, _, _ = self._lists
+        cone, stack = set(roots), list(roots)
+        while stack:
+            u = stack.pop()
+            for e in range(successors[u], successors[u + 1]):
+                v = target[e]
+                if self.cause[v] == e and v not in cone:
+                    cone.add(v)
+                    stack.append(v)
+        return cone
+
+    def _run(self, seeds, changed):
+        source, target, _, _, successors, _, _ = self._lists
+        delay, cause, departure = self.delay, self.cause, self.departure
+        heap = [(departure[s] + delay[s], s) for s in set(seeds) if delay[s] > 0]
+        heapq.heapify(heap)
+        while heap:
+            at, u = heapq.heappop(heap)
+            if at != departure[u] + delay[u]:
+                continue
+            for e in range(successors[u], successors[u + 1]):
+                v = target[e]
+                pushed = self._push(delay[u], e)
+                if pushed > delay[v]:
+                    changed.setdefault(v, delay[v])
+                    delay[v] = pushed
+                    cause[v] = e
+                    heapq.heappush(heap, (departure[v] + pushed, v))
+
+    def apply(self, updates):
+        """
+        Set primary delays ({row: minutes}) and propagate them. Lowered
+        delays first reset the trains they had delayed. Returns
+        {row: previous delay} for every train whose delay changed.
+        """
+        source, _, _, _, _, by_target, predecessors = self._lists
+        delay, cause = self.delay, self.cause
+        changed, seeds = {}, []
+        lowered = [row for row, minutes in updates.items() if minutes < self.primary[row]]
+        for row, minutes in updates.items():
+            self.primary[row] = minutes
+        if lowered:
+            cone = self._cone(lowered)
+            for v in cone:
+                changed.setdefault(v, delay[v])
+                delay[v], cause[v] = self.primary[v], -1
+            # Re-derive each reset train from predecessors outside the cone
+            for v in cone:
+                for k in range(predecessors[v], predecessors[v + 1]):
+                    e = by_target[k]
+                    if source[e] not in cone:
+                        pushed = self._push(delay[source[e]], e)
+                        if pushed > delay[v]:
+                            delay[v], cause[v] = pushed, e
+            seeds.extend(cone)
+        for row, minutes in updates.items():
+            if minutes > delay[row]:
+                changed.setdefault(row, delay[row])
+                delay[row], cause[row] = minutes, -1
+                seeds.append(row)
+        self._run(seeds, changed)
+        return {row: before for row, before in changed.items() if delay[row] != before}
+
+    def state(self):
+        return list(self.primary), list(self.delay), list(self.cause)
+
+    def restore(self, state):
+        self.primary, self.delay, self.cause = (list(values) for values in state)
+
+    def primary_by_key(self):
+        """{train key: primary delay} of the trains given one, to carry over a reload"""
+        keys = self.snapshot.keys()
+        return {int(keys[row]): minutes for row, minutes in enumerate(self.primary) if minutes}
+
+    def entries(self, rows):
+        """Response entries for schedule rows"""
+        table = self.snapshot.table
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = {name: table.column(name, rows).tolist()
+                   for name in ("train_id", "scheduled_departure", "source", "destination")}
+        entries = []
+        for k, row in enumerate(rows.tolist()):
+            delay, primary, e = self.delay[row], self.primary[row], self.cause[row]
+            entry = {name: values[k] for name, values in columns.items()}
+            entry.update({
+                "delay_minutes": delay,
+                "primary_delay_minutes": primary,
+                "knock_on_minutes": max(delay - primary, 0),
+                "caused_by": None
+            })
+            if e >= 0:
+                u = int(self.source[e])
+                entry["caused_by"] = {
+                    "train_id": table.train_id[u],
+                    "scheduled_departure": table.column("scheduled_departure", [u])[0],
+                    "via": DEPENDENCIES[self.kind[e]]
+                }
+            entries.append(entry)
+        return entries
+
+    def summary(self):
+        delay, primary = np.asarray(self.delay), np.asarray(self.primary)
+        knock_on = np.maximum(delay - primary, 0)
+        return {
+            "trains": self.n,
+            "delayed_trains": int((delay > 0).sum()),
+            "knock_on_trains": int((knock_on > 0).sum()),
+            "total_delay_minutes": int(delay.sum()),
+            "total_knock_on_minutes": int(knock_on.sum())
+        }
+
+    def most_delayed(self, rows=None, limit=None):
+        """Rows (all, or those given) with any delay, most delayed first"""
+        rows = np.arange(self.n) if rows is None else np.asarray(rows, dtype=np.int64)
+        delay = np.asarray(self.delay, dtype=np.int64)[rows] if len(rows) else np.zeros(0, dtype=np.int64)
+        rows = rows[delay > 0][np.argsort(-delay[delay > 0], kind="stable")]
+        return rows if limit is None else rows[:limit]
+
+class PropagationTracker:
+    """
+    Keeps a DelayPropagator for the live schedule. On reload the graph is
+    rebuilt and primary delays carry over to the same runs.
+    """
+
+    def __init__(self, occupancy=None):
+        self.occupancy = occupancy or get_occupancy_tracker()
+        self._propagator = None
+        self._lock = threading.Lock()
+
+    def _current(self):
+        index = self.occupancy.current()
+        previous = self._propagator
+        if previous is None or previous.snapshot is not index.snapshot:
+            propagator = DelayPropagator(index.snapshot, index.segments)
+            if previous is not None:
+                carried = previous.primary_by_key()
+                keys = index.snapshot.keys().tolist()
+                propagator.apply({row: carried[key] for row, key in enumerate(keys) if key in carried})
+            self._propagator = propagator
+        return self._propagator
+
+    @staticmethod
+    def _rows(snapshot, train_id, departure=None):
+        rows = snapshot.train_index.get_indexer_for([train_id])
+        rows = rows[rows >= 0]
+        if departure is not None:
+            rows = rows[snapshot.table.departure_minutes()[rows] == departure]
+        return rows
+
+    def runs(self, train_id, departure=None):
+        """Schedule records of a train, optionally only the run leaving at `departure` (minutes)"""
+        with self._lock:
+            snapshot = self._current().snapshot
+        return snapshot.records(self._rows(snapshot, train_id, departure))
+
+    def propagate(self, delays, what_if=False, limit=None):
+        """
+        Set primary delays, given as (train_id, departure or None, minutes),
+        and return the trains whose delay changed, most delayed first, with
+        the fleet summary. Without a departure every run of the train is
+        set. With `what_if` the result is computed and then discarded.
+        """
+        with self._lock:
+            propagator = self._current()
+            updates, unknown = {}, []
+            for train_id, departure, minutes in delays:
+                rows = self._rows(propagator.snapshot, train_id, departure)
+                if len(rows) == 0:
+                    unknown.append(train_id)
+                updates.update((int(row), int(minutes)) for row in rows)
+            saved = propagator.state() if what_if else None
+            try:
+                changed = propagator.apply(updates)
+                rows = propagator.most_delayed(list(changed), limit)
+                # Trains brought back to no delay are listed after the delayed ones
+                cleared = [row for row in changed if propagator.delay[row] == 0]
+                shown = list(rows) + cleared
+                return {
+                    "unknown": unknown,
+                    "changed": len(changed),
+                    "trains": propagator.entries(shown if limit is None else shown[:limit]),
+                    "fleet": propagator.summary()
+                }
+            finally:
+                if saved is not None:
+                    propagator.restore(saved)
+
+    def snapshot(self, limit=None):
+        """Every delayed train (most delayed first) and the fleet summary"""
+        with self._lock:
+            propagator = self._current()
+            return {
+                "trains": propagator.entries(propagator.most_delayed(limit=limit)),
+                "fleet": propagator.summary(),
+                "dependencies": propagator.dependency_counts()
+            }
+
+_propagation = None
+_propagation_lock = threading.Lock()
+
+def get_propagation_tracker():
+    global _propagation
+    if _propagation is None:
+        with _propagation_lock:
+            if _propagation is None:
+                _propagation = PropagationTracker()
+    return _propagation
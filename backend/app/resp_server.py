@@ -0,0 +1,133 @@
+from fnmatch import fnmatchcase
+import socketserver
+import threading
+import time
+
+class _Store:
+    """Keys with optional expiry, as the stand-in's one database"""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry
+
+    def execute(self, args):
+        command = args[0].upper().decode()
+        args = args[1:]
+        with self.lock:
+            if command == "PING":
+                return "+PONG"
+            if command == "SELECT" or command == "CLIENT":
+                return "+OK"
+            if command == "GET":
+                entry = self._live(args[0])
+                return entry[0] if entry else None
+            if command == "MGET":
+                return [entry[0] if entry else None for entry in map(self._live, args)]
+            if command == "SET":
+                key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+                expires = None
+                if b"PX" in options:
+                    expires = time.monotonic() + int(args[2 + options.index(b"PX") + 1]) / 1000
+                elif b"EX" in options:
+                    expires = time.monotonic() + int(args[2 + options.index(b"EX") + 1])
+                if b"NX" in options and self._live(key) is not None:
+                    return None
+                self.data[key] = (value, expires)
+                return "+OK"
+            if command == "DEL":
+                return sum(self.data.pop(key, None) is not None for key in args)
+            if command == "EXISTS":
+                return sum(self._live(key) is not None for key in args)
+            if command == "INCR":
+                entry = self._live(args[0])
+                value = int(entry[0]) + 1 if entry else 1
+                self.data[args[0]] = (str(value).encode(), entry[1] if entry else None)
+                return value
+            if command == "DBSIZE":
+                return sum(self._live(key) is not None for key in list(self.data))
+            if command == "FLUSHDB" or command == "FLUSHALL":
+                self.data.clear()
+                return "+OK"
+            if command == "SCAN":
+                # Single pass: every matching key, cursor back to 0
+                options = [a.upper() for a in args[1:]]
+                pattern = args[1 + options.index(b"MATCH") + 1].decode() if b"MATCH" in options else "*"
+                keys = [k for k in list(self.data) if self._live(k) and fnmatchcase(k.decode(), pattern)]
+                return [b"0", keys]
+            return Exception(f"ERR unknown command '{command}'")
+
+def _encode(reply):
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, Exception):
+        return f"-{reply}\r\n".encode()
+    if isinstance(reply, str):
+        return f"{reply}\r\n".encode()
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, bytes):
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    return b"*%d\r\n" % len(reply) + b"".join(_encode(item) for item in reply)
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            size = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def handle(self):
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            self.wfile.write(_encode(self.server.store.execute(args)))
+            self.wfile.flush()
+
+class RespServer(socketserver.ThreadingTCPServer):
+    """
+    Local stand-in for the shared cache: speaks enough of the Redis
+    protocol (GET/SET with PX/EX/NX, MGET, DEL, EXISTS, INCR, SCAN, DBSIZE,
+    FLUSHDB, PING) for development and for exercising SharedCache without
+    a Redis server. Port 0 picks a free port.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), _Handler)
+        self.store = _Store()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        """Serve on a daemon thread; returns self"""
+        threading.Thread(target=self.serve_forever, name="resp-server", daemon=True).start()
+        return self
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local Redis-protocol stand-in for CACHE_BACKEND=redis")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    server = RespServer(args.host, args.port)
+    print(f"Serving {server.url}")
+    server.serve_forever()
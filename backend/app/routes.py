@@ -1,7 +1,25 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
 from typing import List, Optional
-from app.services import predict_train_delay, suggest_reroute
+from app.schedule import parse_minutes
+from app.models import DEFAULT_SEGMENT_CAPACITY, get_delay_predictor
+from app.services import (
+    check_reroute_conflicts, plan_batch_reroute, prediction_cache, predict_train_delay,
+    predict_train_delays_batch, propagate_delays, route_cache, suggest_reroute
+)
+from app.schedule import StaleCursor, get_schedule_store
+from app.ingest import get_upload, start_upload
+from app.feed import RESYNC, get_train_feed
+from app.learning import get_online_trainer, record_observations, remember_prediction, remember_predictions
+from app.occupancy import ReservationConflict, get_occupancy_tracker
+from app.propagation import get_propagation_tracker
+from app.analytics import ARCHIVED_ROWS, REPORTS, archive_csv, get_delay_archive
+from app.executor import REQUEST_TIMEOUT_SECONDS, ExecutorSaturated, get_heavy_pool, get_light_pool
+import asyncio
+import base64
+from datetime import datetime
+import json
 from app.utils import log_request
 import logging
 
@@ -21,6 +39,30 @@ class DelayPredictionResponse(BaseModel):
     predicted_delay_minutes: int
     risk_level: str
     factors: List[str]
+    prediction_id: Optional[str] = None
+
+class DelayPredictionBatchRequest(BaseModel):
+    requests: List[DelayPredictionRequest]
+
+class DelayPredictionBatchResponse(BaseModel):
+    predictions: List[DelayPredictionResponse]
+
+class Observation(BaseModel):
+    actual_delay_minutes: int = Field(..., ge=0)
+    prediction_id: Optional[str] = None
+    current_time: Optional[str] = None
+    station: Optional[str] = None
+    weather_condition: Optional[str] = "clear"
+    day_of_week: Optional[int] = 1
+
+class ObservationBatch(BaseModel):
+    observations: List[Observation]
+
+class TrainStatusUpdate(BaseModel):
+    status: Optional[str] = None
+    delay_minutes: Optional[int] = Field(None, ge=0)
+    platform: Optional[int] = Field(None, ge=0)
+    scheduled_departure: Optional[str] = None
 
 class RerouteRequest(BaseModel):
     delayed_train_id: str
@@ -34,8 +76,63 @@ class RerouteResponse(BaseModel):
     recommended_action: str
     alternative_trains: List[dict]
     reroute_path: List[str]
+    alternative_routes: List[dict] = []
     estimated_recovery_time: int
     confidence_score: float
+    conflicts: dict = {}
+
+MAX_PLAN_BUDGET_SECONDS = 30.0
+
+class BatchRerouteTrain(BaseModel):
+    train_id: str
+    current_station: str
+    destination_station: str
+    delay_minutes: int = Field(0, ge=0)
+
+class SegmentCapacity(BaseModel):
+    source: str
+    target: str
+    capacity: int = Field(..., ge=1)
+
+class BatchRerouteRequest(BaseModel):
+    trains: List[BatchRerouteTrain] = Field(..., min_length=1)
+    blocked_stations: List[str] = []
+    segment_capacity: int = Field(DEFAULT_SEGMENT_CAPACITY, ge=1)
+    capacity_overrides: List[SegmentCapacity] = []
+    time_budget_seconds: float = Field(2.0, gt=0, le=MAX_PLAN_BUDGET_SECONDS)
+
+class RerouteAcceptRequest(BaseModel):
+    delayed_train_id: str
+    reroute_path: List[str] = Field(..., min_length=2)
+    departure_time: Optional[str] = None
+    platform: Optional[int] = Field(None, ge=1)
+    force: bool = False
+
+class PropagationDelay(BaseModel):
+    train_id: str
+    scheduled_departure: Optional[str] = None
+    delay_minutes: Optional[int] = Field(None, ge=0)
+    weather_condition: Optional[str] = "clear"
+    day_of_week: Optional[int] = 1
+
+class PropagationRequest(BaseModel):
+    delays: List[PropagationDelay] = Field(..., min_length=1)
+    what_if: bool = False
+    limit: int = Field(100, ge=1, le=10000)
+
+async def _offload(pool, fn, **kwargs):
+    """Run blocking work in an executor pool, mapping saturation to 429 and timeouts to 504"""
+    try:
+        return await pool.run(fn, **kwargs)
+    except ExecutorSaturated:
+        raise HTTPException(status_code=429, detail="Server busy, retry later", headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Request timed out")
+
+def _predict_and_remember(train_id, **inputs):
+    """Predict one delay and keep it for later observations, on a pool thread"""
+    result = predict_train_delay(train_id=train_id, **inputs)
+    return {**result, "prediction_id": remember_prediction(inputs, result["delay_probability"])}
 
 @router.post("/predict_delay", response_model=DelayPredictionResponse)
 async def predict_delay(request: DelayPredictionRequest):
@@ -43,46 +140,577 @@ async def predict_delay(request: DelayPredictionRequest):
     Predict train delay probability based on current conditions
     """
     try:
-        log_request("predict_delay", request.dict())
-        result = predict_train_delay(
-            train_id=request.train_id,
-            current_time=request.current_time,
-            station=request.station,
-            weather=request.weather_condition,
-            day_of_week=request.day_of_week
-        )
-        return result
+        log_request("predict_delay", request)
+        inputs = {
+            "current_time": request.current_time,
+            "station": request.station,
+            "weather": request.weather_condition,
+            "day_of_week": request.day_of_week
+        }
+        return await _offload(get_light_pool(), _predict_and_remember, train_id=request.train_id, **inputs)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in predict_delay: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/predict_delay/batch", response_model=DelayPredictionBatchResponse)
+async def predict_delay_batch(request: DelayPredictionBatchRequest):
+    """
+    Predict delays for many trains in one call, preserving request order
+    """
+    try:
+        log_request("predict_delay/batch", {"count": len(request.requests)})
+        rows = [
+            {
+                "train_id": row.train_id,
+                "current_time": row.current_time,
+                "station": row.station,
+                "weather": row.weather_condition,
+                "day_of_week": row.day_of_week
+            }
+            for row in request.requests
+        ]
+        predictions = await _offload(get_heavy_pool(), predict_train_delays_batch, rows=rows)
+        # The heavy pool may be a process pool, so the ids are stored from this process, in one write
+        prediction_ids = await _offload(
+            get_light_pool(), remember_predictions,
+            inputs=rows, delay_probabilities=[prediction["delay_probability"] for prediction in predictions]
+        )
+        return {"predictions": [
+            {**prediction, "prediction_id": prediction_id}
+            for prediction, prediction_id in zip(predictions, prediction_ids)
+        ]}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in predict_delay_batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/reroute", response_model=RerouteResponse)
 async def reroute_train(request: RerouteRequest):
     """
     Suggest optimal rerouting for delayed trains
     """
     try:
-        log_request("reroute", request.dict())
-        result = suggest_reroute(
+        log_request("reroute", request)
+        result = await _offload(
+            get_heavy_pool(), suggest_reroute,
             delayed_train_id=request.delayed_train_id,
             current_station=request.current_station,
             destination_station=request.destination_station,
             delay_minutes=request.delay_minutes,
             available_routes=request.available_routes
         )
-        return result
+        # Accepted reroutes live in this process, so check here rather than in the pool worker
+        return await _offload(get_light_pool(), check_reroute_conflicts, reroute=result)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in reroute: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/reroute/batch")
+async def reroute_batch(request: BatchRerouteRequest):
+    """
+    Coordinated reroutes for many delayed trains during one disruption.
+    
+    Paths are assigned together so detour lines are not overloaded: each
+    line section takes `segment_capacity` trains (or its override), and
+    the plan minimizes total delay within `time_budget_seconds`. Returns
+    per-train paths, extra running time, capacity holds and scores.
+    """
+    try:
+        log_request("reroute/batch", {"count": len(request.trains), "blocked": request.blocked_stations})
+        return await _offload(
+            get_heavy_pool(), plan_batch_reroute,
+            trains=[train.dict() for train in request.trains],
+            blocked_stations=request.blocked_stations,
+            capacity=request.segment_capacity,
+            capacity_overrides={(c.source, c.target): c.capacity for c in request.capacity_overrides},
+            time_budget=request.time_budget_seconds,
+            timeout=request.time_budget_seconds + REQUEST_TIMEOUT_SECONDS
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in reroute_batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/reroute/accept")
+async def accept_reroute(request: RerouteAcceptRequest):
+    """
+    Commit a dispatcher-approved reroute to the occupancy index.
+    
+    The train's run in progress is released and the new path (plus a
+    destination platform) is held, so later checks and scans see it.
+    Returns 409 with the conflicts if the path clashes, unless `force`.
+    """
+    if request.departure_time is not None:
+        depart = _parse_departure(request.departure_time, "departure_time")
+    else:
+        now = datetime.now()
+        depart = now.hour * 60 + now.minute
+    try:
+        held = await _offload(
+            get_light_pool(), get_occupancy_tracker().reserve, train_id=request.delayed_train_id,
+            path=request.reroute_path, depart=depart, platform=request.platform, force=request.force
+        )
+    except ReservationConflict as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), **e.check})
+    log_request("reroute/accept", request)
+    return {"delayed_train_id": request.delayed_train_id, "accepted": True,
+            "platform": held["platform"], "conflicts": held["conflicts"]}
+
+CONFLICT_SCAN_TIMEOUT_SECONDS = 120.0
+
+@router.get("/conflicts")
+async def get_conflicts(limit: int = Query(100, ge=1, le=10000)):
+    """
+    Scan the whole day's timetable and accepted reroutes for platform and
+    track-segment clashes, earliest first
+    """
+    try:
+        total, conflicts = await _offload(
+            get_light_pool(), get_occupancy_tracker().scan, limit=limit,
+            timeout=CONFLICT_SCAN_TIMEOUT_SECONDS
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in get_conflicts: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"total": total, "conflicts": conflicts}
+
+# The first call after a schedule reload builds the dependency graph
+PROPAGATION_TIMEOUT_SECONDS = 120.0
+
+@router.post("/propagate")
+async def propagate(request: PropagationRequest):
+    """
+    Push observed or predicted delays through the timetable's dependencies.
+    
+    Each delay updates only the trains it can reach; the response lists
+    every train whose delay changed (most delayed first, up to `limit`)
+    with the train that caused it, plus fleet-wide totals. Give
+    `delay_minutes: 0` to clear a delay; `what_if` leaves the state as it was.
+    """
+    for delay in request.delays:
+        _parse_departure(delay.scheduled_departure, "scheduled_departure")
+    try:
+        log_request("propagate", {"count": len(request.delays), "what_if": request.what_if})
+        result = await _offload(
+            get_light_pool(), propagate_delays,
+            delays=[
+                {
+                    "train_id": delay.train_id,
+                    "scheduled_departure": delay.scheduled_departure,
+                    "delay_minutes": delay.delay_minutes,
+                    "weather": delay.weather_condition,
+                    "day_of_week": delay.day_of_week
+                }
+                for delay in request.delays
+            ],
+            what_if=request.what_if, limit=request.limit, timeout=PROPAGATION_TIMEOUT_SECONDS
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in propagate: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if len(result["unknown"]) == len(request.delays):
+        raise HTTPException(status_code=404, detail=f"Trains not found: {', '.join(result['unknown'])}")
+    return result
+
+@router.get("/propagate")
+async def get_propagated_delays(limit: int = Query(100, ge=1, le=10000)):
+    """
+    Current knock-on delays fleet-wide, most delayed first
+    """
+    try:
+        return await _offload(
+            get_light_pool(), get_propagation_tracker().snapshot, limit=limit,
+            timeout=PROPAGATION_TIMEOUT_SECONDS
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in get_propagated_delays: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _encode_cursor(position: int, etag: str) -> str:
+    # Bound to the schedule version, since positions change when it is reloaded
+    version = etag.strip('"')
+    return base64.urlsafe_b64encode(f"p:{position}:{version}".encode()).decode()
+
+def _decode_cursor(cursor: str):
+    """(row position, schedule ETag) from a cursor"""
+    try:
+        kind, position, etag = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        if kind != "p":
+            raise ValueError(kind)
+        return int(position), f'"{etag}"'
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _parse_departure(value: Optional[str], name: str):
+    if value is None:
+        return None
+    minutes = int(parse_minutes([value])[0])
+    if minutes < 0:
+        raise HTTPException(status_code=422, detail=f"{name} must be HH:MM")
+    return minutes
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+def _ndjson_lines(trains, chunk_size=1000):
+    for start in range(0, len(trains), chunk_size):
+        chunk = trains[start:start + chunk_size]
+        yield "".join(json.dumps(train, default=str) + "\n" for train in chunk)
+
 @router.get("/trains")
-async def get_all_trains():
+async def get_all_trains(
+    request: Request,
+    status: Optional[List[str]] = Query(None),
+    source: Optional[List[str]] = Query(None),
+    destination: Optional[List[str]] = Query(None),
+    departure_after: Optional[str] = None,
+    departure_before: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    """
+    Get active trains, optionally filtered and paginated.
+    
+    Filters: status, source, destination (repeatable) and a departure window
+    (HH:MM). Pass `limit` to paginate and follow `next_cursor`. Use
+    `format=ndjson` to stream one train per line for large exports.
+    Responses carry an ETag; a matching If-None-Match returns 304.
+    """
+    filters = {
+        "status": status,
+        "source": source,
+        "destination": destination,
+        "departure_from": _parse_departure(departure_after, "departure_after"),
+        "departure_to": _parse_departure(departure_before, "departure_before")
+    }
+    after, etag = _decode_cursor(cursor) if cursor else (None, None)
+    store = get_schedule_store()
+    
+    try:
+        # Revalidation is answered from the snapshot's ETag before any record is built
+        current = (await _offload(get_light_pool(), store.refresh)).etag
+        if _etag_matches(request, current):
+            return Response(status_code=304, headers={"ETag": current, "Cache-Control": "no-cache"})
+        page = await _offload(get_light_pool(), store.page, after=after, limit=limit, etag=etag, **filters)
+    except StaleCursor:
+        raise HTTPException(status_code=409, detail="Schedule changed since this cursor was issued; restart paging")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    headers = {"ETag": page["etag"], "Cache-Control": "no-cache"}
+    next_cursor = _encode_cursor(page["next_position"], page["etag"]) if page["next_position"] is not None else None
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    
+    if format == "ndjson":
+        return StreamingResponse(
+            _ndjson_lines(page["trains"]), media_type="application/x-ndjson", headers=headers
+        )
+    
+    body = {"trains": page["trains"], "total": page["total"], "next_cursor": next_cursor}
+    return Response(content=json.dumps(body, default=str), media_type="application/json", headers=headers)
+
+SSE_KEEPALIVE_SECONDS = 15.0
+
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\nid: {payload['seq']}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+@router.get("/trains/stream")
+async def stream_trains():
     """
-    Get all active trains in the system
+    Live train status over Server-Sent Events.
+    
+    Sends one `snapshot` event with every train, then `delta` events
+    carrying only changed, added and removed trains. A client that falls
+    behind gets a fresh snapshot. Comment lines keep idle connections open.
     """
-    from app.utils import load_sample_data
+    feed = get_train_feed()
+    subscriber = feed.new_subscriber(asyncio.get_running_loop())
     try:
-        data = load_sample_data()
-        return {"trains": data.to_dict('records')}
+        snapshot = await _offload(get_light_pool(), feed.subscribe, subscriber=subscriber)
+    except BaseException:
+        # A subscribe that timed out may still run; closing the subscriber first makes it a no-op
+        feed.unsubscribe(subscriber)
+        raise
+    
+    async def events():
+        try:
+            yield _sse("snapshot", snapshot)
+            last_seq = snapshot["seq"]
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is RESYNC:
+                    fresh = await _offload(get_light_pool(), feed.snapshot)
+                    yield _sse("snapshot", fresh)
+                    last_seq = fresh["seq"]
+                elif event["seq"] > last_seq:
+                    yield _sse("delta", event)
+                    last_seq = event["seq"]
+        finally:
+            feed.unsubscribe(subscriber)
+    
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/trains/{train_id}/status")
+async def update_train_status(train_id: str, update: TrainStatusUpdate):
+    """
+    Set a train's live status, delay or platform and push it to stream subscribers
+    """
+    departure = _parse_departure(update.scheduled_departure, "scheduled_departure")
+    changes = await _offload(
+        get_light_pool(), get_train_feed().update, train_id=train_id, departure=departure,
+        status=update.status, delay_minutes=update.delay_minutes, platform=update.platform
+    )
+    if not changes:
+        raise HTTPException(status_code=404, detail=f"Train {train_id} not found")
+    return {"trains": changes}
+
+@router.get("/trains/{train_id}")
+async def get_train(train_id: str):
+    """
+    Get a single train by id
+    """
+    train = await _offload(get_light_pool(), get_schedule_store().get, train_id=train_id)
+    if train is None:
+        raise HTTPException(status_code=404, detail=f"Train {train_id} not found")
+    return train
+
+UPLOAD_MERGE_TIMEOUT_SECONDS = 300.0
+
+@router.post("/schedules/upload")
+async def upload_schedule(
+    request: Request,
+    upload_id: Optional[str] = None,
+    mode: str = Query("merge", pattern="^(merge|replace)$")
+):
+    """
+    Stream a schedule CSV into the live schedule.
+    
+    The body is parsed in chunks as it arrives; rows missing required
+    columns or with bad HH:MM times are dropped, and duplicates of
+    (train_id, departure) are kept once. `mode=merge` upserts into the
+    current schedule, `mode=replace` swaps it. Pass your own `upload_id` to
+    poll GET /schedules/uploads/{upload_id} while the upload runs.
+    """
+    if upload_id is not None and get_upload(upload_id) is not None:
+        raise HTTPException(status_code=409, detail=f"Upload {upload_id} already exists")
+    length = request.headers.get("content-length")
+    ingest = start_upload(upload_id, int(length) if length and length.isdigit() else None)
+    pool = get_light_pool()
+    
+    try:
+        async for data in request.stream():
+            for batch in ingest.feed(data):
+                await _offload(pool, ingest.parse_batch, lines=batch)
+        for batch in ingest.finish():
+            await _offload(pool, ingest.parse_batch, lines=batch)
+        if mode == "replace" and ingest.rows_accepted == 0:
+            raise ValueError("No valid rows to replace the schedule with")
+        
+        ingest.state = "merging"
+        snapshot = await _offload(
+            pool, get_schedule_store().merge, frame=ingest.result(),
+            replace=mode == "replace", timeout=UPLOAD_MERGE_TIMEOUT_SECONDS
+        )
+    except ValueError as e:
+        ingest.fail(e)
+        raise HTTPException(status_code=422, detail=str(e))
+    except HTTPException as e:
+        ingest.fail(e.detail)
+        raise
+    except Exception as e:
+        ingest.fail(e)
+        logger.error(f"Error in upload_schedule: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    ingest.complete()
+    log_request("schedules/upload", ingest.progress)
+    return {**ingest.progress(), "schedule_version": snapshot.version, "total_trains": len(snapshot)}
+
+@router.get("/schedules/uploads/{upload_id}")
+async def get_upload_progress(upload_id: str):
+    """
+    Progress of a running or recent schedule upload
+    """
+    ingest = get_upload(upload_id)
+    if ingest is None:
+        raise HTTPException(status_code=404, detail=f"Upload {upload_id} not found")
+    return ingest.progress()
+
+@router.get("/model")
+async def get_model_info():
+    """
+    Report the active delay model version
+    """
+    predictor = get_delay_predictor()
+    state = predictor._current_state()
+    return {
+        "is_trained": state.is_trained,
+        "version": state.version,
+        "metadata": state.metadata
+    }
+
+@router.post("/model/reload")
+async def reload_model():
+    """
+    Hot-swap to the latest published model artifact without a restart
+    """
+    predictor = get_delay_predictor()
+    swapped = predictor.reload()
+    return {"reloaded": swapped, "version": predictor.model_version}
+
+@router.post("/observations")
+async def post_observations(batch: ObservationBatch):
+    """
+    Record actual delays for online learning.
+    
+    Each observation gives `actual_delay_minutes` plus the `prediction_id`
+    returned by /predict_delay, or the prediction inputs themselves. The
+    model is refit in the background and swapped only if it scores better
+    on recent hold-out observations.
+    """
+    try:
+        log_request("observations", {"count": len(batch.observations)})
+        return await _offload(get_light_pool(), record_observations, observations=[
+            {
+                "actual_delay_minutes": obs.actual_delay_minutes,
+                "prediction_id": obs.prediction_id,
+                "current_time": obs.current_time,
+                "station": obs.station,
+                "weather": obs.weather_condition,
+                "day_of_week": obs.day_of_week
+            }
+            for obs in batch.observations
+        ])
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in post_observations: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/observations/stats")
+async def get_observation_stats():
+    """
+    Online learning window, served-prediction Brier score and last refit
+    """
+    return get_online_trainer().status()
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """
+    Prediction and route cache size and hit rate
+    """
+    return {"predictions": prediction_cache.stats(), "routes": route_cache.stats()}
+
+# Appending parses the whole body and writes one partition per day
+ARCHIVE_TIMEOUT_SECONDS = 300.0
+
+def _parse_date(value: Optional[str], name: str):
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"{name} must be YYYY-MM-DD")
+
+@router.get("/analytics")
+async def get_analytics_summary():
+    """
+    Archived date range, total runs and on-time percentage, and the
+    reports available under /analytics/{report}
+    """
+    try:
+        return await _offload(get_light_pool(), get_delay_archive().summary)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in get_analytics_summary: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/analytics/{report}")
+async def get_analytics_report(
+    report: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    station: Optional[List[str]] = Query(None),
+    min_runs: int = Query(1, ge=1),
+    limit: int = Query(100, ge=1, le=10000)
+):
+    """
+    Aggregate delay statistics over the archived history.
+    
+    Reports: `station_hour` (delay rate by departure station and hour),
+    `corridors` (worst source -> destination pairs) and `weekday` (on-time
+    percentage by day of week). `start`/`end` (YYYY-MM-DD, inclusive)
+    bound the days, `station` (repeatable) narrows station_hour and
+    corridors, and groups with fewer than `min_runs` runs are left out.
+    Answers come from per-day rollups, never the raw records.
+    """
+    if report not in REPORTS:
+        raise HTTPException(status_code=404, detail=f"Report {report} not found; one of {', '.join(REPORTS)}")
+    try:
+        return await _offload(
+            get_light_pool(), get_delay_archive().report, name=report,
+            start=_parse_date(start, "start"), end=_parse_date(end, "end"),
+            stations=station, min_runs=min_runs, limit=limit
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in get_analytics_report: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/analytics/archive")
+async def archive_history(request: Request, date: Optional[str] = None):
+    """
+    Append historical runs (CSV body) to the delay archive.
+    
+    Rows need source, destination and scheduled_departure, plus a `date`
+    column unless the `date` parameter gives the day for all of them;
+    delay_minutes and/or status mark delayed runs. Only the days in the
+    upload have their rollups updated.
+    """
+    date = _parse_date(date, "date")
+    body = await request.body()
+    try:
+        result = await _offload(
+            get_heavy_pool(), archive_csv, data=body, date=date,
+            timeout=ARCHIVE_TIMEOUT_SECONDS
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
+        logger.error(f"Error in archive_history: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    # Counted here: with a process pool the append runs in another process
+    ARCHIVED_ROWS.inc(result["rows_archived"])
+    log_request("analytics/archive", result)
+    return result
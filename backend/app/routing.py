@@ -0,0 +1,373 @@
+from collections import OrderedDict, namedtuple
+from app.metrics import record_search
+import threading
+import heapq
+import time
+import numpy as np
+
+class RouteTable:
+    """
+    Shortest-path (fewest hops) route table over the railway network.
+
+    One BFS predecessor tree is kept per source station. Queries with no
+    blocked stations just walk the tree back from the destination. Queries
+    with blocked stations reuse the base path when it avoids every blocked
+    station, and otherwise recompute only the tree for that source inside an
+    overlay keyed by the frozenset of blocked stations. Overlays are evicted
+    least-recently-used. Lookups are safe from concurrent threads; a tree
+    is built outside the lock and the first one stored wins.
+
+    The graph is held in CSR form (`offsets`, `targets`); `from_network`
+    reads a RailNetwork's arrays directly, so a memory-mapped snapshot is
+    searched in place rather than copied into every worker.
+    """
+
+    def __init__(self, graph, max_overlays=256, eager_limit=2000):
+        # Integer station IDs, in first-seen order so BFS ties break like the graph lists
+        stations = list(graph)
+        for neighbors in graph.values():
+            for neighbor in neighbors:
+                if neighbor not in graph and neighbor not in stations:
+                    stations.append(neighbor)
+        index = {station: i for i, station in enumerate(stations)}
+        lists = [[index[n] for n in graph.get(station, [])] for station in stations]
+        offsets = np.zeros(len(stations) + 1, dtype=np.int64)
+        np.cumsum([len(neighbors) for neighbors in lists], out=offsets[1:])
+        targets = np.fromiter((t for neighbors in lists for t in neighbors), dtype=np.int32, count=int(offsets[-1]))
+        self._setup(stations, index, offsets, targets, max_overlays, eager_limit)
+
+        # Small networks are fully precomputed at load; large ones fill in per source
+        self.warm_if_small()
+
+    @classmethod
+    def from_network(cls, network, max_overlays=256, eager_limit=2000):
+        """
+        Table over a RailNetwork's CSR arrays. Nothing is precomputed here;
+        call warm_if_small() once the worker is up (startup warm-up does)
+        """
+        table = cls.__new__(cls)
+        table._setup(network.stations, network.station_index, network.offsets, network.targets,
+                     max_overlays, eager_limit)
+        return table
+
+    def _setup(self, stations, station_index, offsets, targets, max_overlays, eager_limit):
+        self.stations = stations
+        self.station_index = station_index
+        self.offsets = offsets
+        self.targets = targets
+        self.degree = np.diff(offsets)
+        self.max_overlays = max_overlays
+        self.eager_limit = eager_limit
+        self._trees = {}
+        self._overlays = OrderedDict()
+        self._lock = threading.Lock()
+
+    def warm(self):
+        """Precompute the predecessor tree for every source station"""
+        for source in range(len(self.stations)):
+            self._base_tree(source)
+
+    def warm_if_small(self):
+        """warm() when the network has at most eager_limit stations; larger ones fill in per source"""
+        if len(self.stations) <= self.eager_limit:
+            self.warm()
+
+    def _bfs_tree(self, source, blocked=()):
+        """
+        BFS predecessor array from source; -1 marks unreachable, source points
+        to itself. Expands a whole frontier at a time; each station takes the
+        first frontier station (in queue order) that reaches it, so trees
+        match a one-node-at-a-time BFS.
+        """
+        pred = np.full(len(self.stations), -1, dtype=np.int32)
+        blocked = np.fromiter(blocked, dtype=np.int64)
+        # Blocked stations are never entered
+        pred[blocked] = -2
+        pred[source] = source
+
+        offsets, targets, degree = self.offsets, self.targets, self.degree
+        frontier = np.array([source])
+        expansions = 0
+        while len(frontier):
+            expansions += len(frontier)
+            counts = degree[frontier]
+            starts = np.repeat(offsets[frontier] - np.cumsum(counts) + counts, counts)
+            neighbors = targets[starts + np.arange(counts.sum())]
+            parents = np.repeat(frontier, counts)
+            fresh = pred[neighbors] == -1
+            neighbors, parents = neighbors[fresh], parents[fresh]
+            first = np.sort(np.unique(neighbors, return_index=True)[1])
+            frontier = neighbors[first]
+            pred[frontier] = parents[first]
+        record_search("bfs", expansions)
+
+        pred[pred == -2] = -1
+        return pred
+
+    def _base_tree(self, source):
+        tree = self._trees.get(source)
+        if tree is None:
+            tree = self._bfs_tree(source)
+            with self._lock:
+                tree = self._trees.setdefault(source, tree)
+        return tree
+
+    def _overlay_tree(self, source, blocked_ids):
+        key = frozenset(blocked_ids)
+        with self._lock:
+            overlay = self._overlays.get(key)
+            if overlay is None:
+                overlay = self._overlays[key] = {}
+                if len(self._overlays) > self.max_overlays:
+                    self._overlays.popitem(last=False)
+            else:
+                self._overlays.move_to_end(key)
+            tree = overlay.get(source)
+
+        if tree is None:
+            tree = self._bfs_tree(source, blocked_ids)
+            with self._lock:
+                # The overlay may have been evicted meanwhile; the tree is still valid to return
+                tree = overlay.setdefault(source, tree)
+        return tree
+
+    @staticmethod
+    def _walk(tree, source, target):
+        """Reconstruct source -> target from a predecessor tree in O(path length)"""
+        if tree[target] == -1:
+            return []
+        path = [target]
+        node = target
+        while node != source:
+            node = int(tree[node])
+            path.append(node)
+        path.reverse()
+        return path
+
+    def shortest_path(self, start, destination, blocked_stations=()):
+        """Fewest-hop path from start to destination avoiding blocked stations"""
+        if start not in self.station_index or destination not in self.station_index:
+            return []
+        if start == destination:
+            return [start]
+
+        blocked_ids = {self.station_index[s] for s in blocked_stations if s in self.station_index}
+        source = self.station_index[start]
+        target = self.station_index[destination]
+        if source in blocked_ids or target in blocked_ids:
+            return []
+
+        path = self._walk(self._base_tree(source), source, target)
+        if blocked_ids and any(node in blocked_ids for node in path):
+            # Base path is cut; only this source's tree needs recomputing
+            path = self._walk(self._overlay_tree(source, blocked_ids), source, target)
+
+        return [self.stations[i] for i in path]
+
+    def cache_info(self):
+        """Sizes of the precomputed tables and overlay cache"""
+        return {
+            "stations": len(self.stations),
+            "base_trees": len(self._trees),
+            "overlays": len(self._overlays),
+            "max_overlays": self.max_overlays
+        }
+
+Route = namedtuple("Route", ["nodes", "edges", "cost"])
+
+def dijkstra(network, source, target, blocked_nodes=(), blocked_edges=(), heuristic=None, cost=None):
+    """
+    Least-cost route between station ids on a RailNetwork.
+
+    With a heuristic (per-station lower bound on cost to target) this is A*.
+    `cost` (a list per edge) overrides the network's edge costs; it must not
+    be lower than them for the heuristic to stay admissible.
+    Returns a Route or None when the target is unreachable.
+    """
+    offsets, targets, edge_cost = network.search_arrays()
+    cost = edge_cost if cost is None else cost
+    blocked_nodes = blocked_nodes if isinstance(blocked_nodes, (set, frozenset)) else set(blocked_nodes)
+    blocked_edges = blocked_edges if isinstance(blocked_edges, (set, frozenset)) else set(blocked_edges)
+    if source in blocked_nodes or target in blocked_nodes:
+        return None
+
+    dist = {source: 0.0}
+    pred_edge = {}
+    closed = set()
+    heap = [(heuristic[source] if heuristic else 0.0, 0.0, source)]
+    while heap:
+        _, d, u = heapq.heappop(heap)
+        if u in closed:
+            continue
+        if u == target:
+            break
+        closed.add(u)
+        for e in range(offsets[u], offsets[u + 1]):
+            v = targets[e]
+            if v in closed or v in blocked_nodes or e in blocked_edges:
+                continue
+            nd = d + cost[e]
+            if nd < dist.get(v, float("inf")):
+                dist[v] = nd
+                pred_edge[v] = e
+                heapq.heappush(heap, (nd + heuristic[v] if heuristic else nd, nd, v))
+    else:
+        record_search("astar" if heuristic else "dijkstra", len(closed))
+        return None
+    record_search("astar" if heuristic else "dijkstra", len(closed) + 1)
+
+    edges = []
+    node = target
+    while node != source:
+        e = pred_edge[node]
+        edges.append(e)
+        node = int(network.sources[e])
+    edges.reverse()
+    nodes = [source] + [targets[e] for e in edges]
+    return Route(nodes, edges, dist[target])
+
+def astar(network, source, target, blocked_nodes=(), blocked_edges=()):
+    """A* search using the network's coordinate heuristic (Dijkstra if none)"""
+    return dijkstra(
+        network, source, target, blocked_nodes, blocked_edges,
+        heuristic=network.heuristic_to(target)
+    )
+
+def k_shortest_paths(network, source, target, k=3, blocked_nodes=()):
+    """Yen's algorithm: up to k loopless routes in increasing cost order"""
+    blocked_nodes = frozenset(blocked_nodes)
+    heuristic = network.heuristic_to(target)
+    first = dijkstra(network, source, target, blocked_nodes, heuristic=heuristic)
+    if first is None:
+        return []
+
+    _, _, cost = network.search_arrays()
+    routes = [first]
+    seen = {tuple(first.nodes)}
+    candidates = []
+    while len(routes) < k:
+        last = routes[-1]
+        for i in range(len(last.nodes) - 1):
+            root_nodes = last.nodes[:i + 1]
+            root_edges = last.edges[:i]
+
+            # Forbid the next edge of every accepted route sharing this root
+            removed_edges = {r.edges[i] for r in routes if r.nodes[:i + 1] == root_nodes}
+            removed_nodes = blocked_nodes.union(root_nodes[:-1])
+            spur = dijkstra(
+                network, root_nodes[-1], target, removed_nodes, removed_edges, heuristic
+            )
+            if spur is None:
+                continue
+
+            nodes = root_nodes[:-1] + spur.nodes
+            if tuple(nodes) in seen:
+                continue
+            seen.add(tuple(nodes))
+            total = sum(cost[e] for e in root_edges) + spur.cost
+            heapq.heappush(candidates, (total, len(nodes), nodes, root_edges + spur.edges))
+
+        if not candidates:
+            break
+        total, _, nodes, edges = heapq.heappop(candidates)
+        routes.append(Route(nodes, edges, total))
+
+    return routes
+
+def _queue_holds(paths, segment_of, capacity, base_cost):
+    """
+    Minutes each train waits for capacity: on a segment used by more trains
+    than it takes, the q-th train (0-based, in list order) waits q // capacity
+    passes of its running time. Waits add up along a train's path, which
+    matches the additive edge costs the router minimizes.
+    """
+    holds = [0.0] * len(paths)
+    queue_length = {}
+    for i, route in enumerate(paths):
+        if route is None:
+            continue
+        for e in route.edges:
+            s = segment_of[e]
+            position = queue_length.get(s, 0)
+            queue_length[s] = position + 1
+            holds[i] += (position // capacity[s]) * base_cost[e]
+    return holds
+
+def coordinate_routes(network, trips, capacity, blocked_nodes=(), time_budget=2.0, max_iterations=50,
+                      history_factor=0.1, patience=3):
+    """
+    Route many trains at once under per-segment capacity (negotiated congestion).
+
+    `trips` are (source id, target id, delay minutes); trains with more delay
+    route (and queue) first. `capacity` is trains per undirected segment,
+    one value per edge. An edge costs its running time times one plus the
+    passes a train would queue for it at current usage, raised further by
+    how often its segment was overused in earlier rounds. Each round
+    reroutes the trains on over-capacity segments, until none is over
+    capacity, `patience` rounds pass without a better plan, the rounds run
+    out or `time_budget` seconds pass (the first round always completes).
+    Trains still over capacity are held in queue order. Returns the best
+    plan seen as a dict with per-trip `routes`, `baseline` costs and
+    `baseline_paths` (unconstrained fastest routes), `holds`
+    and the `objective` (sum of delay + extra running time + hold), plus
+    `iterations` and `converged`.
+    """
+    deadline = time.monotonic() + time_budget
+    _, _, edge_cost = network.search_arrays()
+    base = np.asarray(edge_cost, dtype=np.float64)
+    # Both directions of a line share its capacity
+    lo = np.minimum(network.sources, network.targets).astype(np.int64)
+    hi = np.maximum(network.sources, network.targets).astype(np.int64)
+    segments, segment_of = np.unique(lo * len(network) + hi, return_inverse=True)
+    segment_capacity = np.full(len(segments), np.iinfo(np.int64).max)
+    np.minimum.at(segment_capacity, segment_of, np.maximum(np.asarray(capacity, dtype=np.int64), 1))
+    blocked_nodes = frozenset(blocked_nodes)
+
+    order = sorted(range(len(trips)), key=lambda i: -trips[i][2])
+    heuristics = {t: network.heuristic_to(t) for t in {trip[1] for trip in trips}}
+    baseline = [dijkstra(network, s, t, heuristic=heuristics[t]) for s, t, _ in trips]
+    paths = [None] * len(trips)
+    usage = np.zeros(len(segments), dtype=np.int64)
+    history = np.zeros(len(segments))
+    pending, best, iterations, timed_out, stale = order, None, 0, False, 0
+
+    for iterations in range(1, max_iterations + 1):
+        for i in pending:
+            if time.monotonic() > deadline and best is not None:
+                timed_out = True
+                break
+            if paths[i] is not None:
+                np.subtract.at(usage, segment_of[paths[i].edges], 1)
+            queued = usage // segment_capacity
+            cost = (base * (1 + queued[segment_of]) * (1 + history[segment_of])).tolist()
+            source, target, _ = trips[i]
+            paths[i] = dijkstra(network, source, target, blocked_nodes, heuristic=heuristics[target], cost=cost)
+            if paths[i] is not None:
+                np.add.at(usage, segment_of[paths[i].edges], 1)
+
+        ordered = [paths[i] for i in order]
+        holds = dict(zip(order, _queue_holds(ordered, segment_of, segment_capacity, base)))
+        objective = 0.0
+        for i, (_, _, delay) in enumerate(trips):
+            objective += delay
+            if paths[i] is not None and baseline[i] is not None:
+                objective += float(base[paths[i].edges].sum()) - baseline[i].cost + holds[i]
+        over = usage > segment_capacity
+        if best is None or objective < best["objective"] - 1e-9:
+            best = {"routes": list(paths), "holds": [holds[i] for i in range(len(trips))],
+                    "objective": objective, "overloaded": int(over.sum())}
+            stale = 0
+        else:
+            stale += 1
+        if timed_out or not over.any() or stale >= patience:
+            break
+        history += history_factor * over
+        pending = [i for i in order if paths[i] is not None and over[segment_of[paths[i].edges]].any()]
+
+    return {
+        **best,
+        "baseline": [route.cost if route else None for route in baseline],
+        "baseline_paths": [route.nodes if route else None for route in baseline],
+        "iterations": iterations,
+        "converged": best["overloaded"] == 0
+    }
@@ -0,0 +1,322 @@
+from app.connections import ConnectionIndex
+from app.schedule_table import ScheduleTable, parse_minutes
+from app.utils import load_sample_data, get_data_path
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import hashlib
+import logging
+import threading
+import fcntl
+import time
+import os
+
+INDEXED_COLUMNS = ("train_id", "source", "destination", "status")
+
+logger = logging.getLogger(__name__)
+
+def train_keys(train_ids, departure_minutes):
+    """uint64 hash of (train_id, departure minute): the identity of a scheduled run"""
+    keys = pd.DataFrame({
+        "train_id": pd.Series(train_ids, dtype="object").astype(str).to_numpy(),
+        "departure": np.asarray(departure_minutes, dtype=np.int64)
+    })
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+def _group_rows(codes, labels):
+    """label -> ascending row positions, from integer codes"""
+    order = np.argsort(codes, kind="stable")
+    bounds = np.zeros(len(labels) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes, minlength=len(labels)), out=bounds[1:])
+    return {
+        labels[code]: order[bounds[code]:bounds[code + 1]]
+        for code in np.nonzero(bounds[1:] > bounds[:-1])[0]
+    }
+
+def _graph_stations():
+    """Stations of the live routing graph, so schedule station codes are RailNetwork ids"""
+    from app.models import get_rerouting_engine
+    return get_rerouting_engine().network.stations
+
+class _ScheduleSnapshot:
+    """Immutable loaded schedule (a ScheduleTable) with its indexes; swapped whole on reload"""
+
+    def __init__(self, table, mtime, version):
+        self.table = table
+        self.mtime = mtime
+        self.version = version
+        self._keys = None
+
+        # Content hash, identical across workers loading the same file
+        digest = hashlib.sha1()
+        for values in (table.train_id, table.train_name, *table.extra.values()):
+            digest.update(pd.util.hash_array(np.asarray(values, dtype=object)).tobytes())
+        for array in (table.source, table.destination, table.departure, table.arrival, table.platform, table.status):
+            digest.update(array.tobytes())
+        digest.update("\0".join(map(str, table.stations + table.statuses)).encode())
+        self.etag = f'"{digest.hexdigest()[:20]}"'
+
+        # train_id lookups go through a pandas hash index (one entry per train)
+        self.train_index = pd.Index(table.train_id)
+
+        # Hash indexes: column value -> sorted row positions
+        self.indexes = {
+            "source": _group_rows(table.source, table.stations),
+            "destination": _group_rows(table.destination, table.stations),
+            "status": _group_rows(table.status, table.statuses)
+        }
+
+        # Sorted index on departure minute (missing times sort last)
+        self.departure_order = np.argsort(table.departure, kind="stable")
+        self.departure_sorted = table.departure[self.departure_order]
+
+        # (station, departure) index and scan order for connection search
+        self.connections = ConnectionIndex(
+            table.stations, table.source, table.destination,
+            table.departure_minutes(), table.arrival_minutes()
+        )
+
+    def __len__(self):
+        return len(self.table)
+
+    def keys(self):
+        """train_keys of every row (train_id + departure), computed once"""
+        if self._keys is None:
+            self._keys = train_keys(self.table.train_id, self.table.departure_minutes())
+        return self._keys
+
+    @property
+    def frame(self):
+        """The schedule decoded to a DataFrame of strings"""
+        return self.table.to_frame()
+
+    def record(self, position):
+        return self.table.records([position])[0]
+
+    def records(self, positions=None):
+        """Rows as dicts, built for just the requested positions"""
+        return self.table.records(positions)
+
+class StaleCursor(Exception):
+    """A page cursor from a schedule version that has since been replaced"""
+
+class ScheduleStore:
+    """
+    In-memory train schedule loaded once from CSV.
+
+    The file's mtime is checked at most every `check_interval` seconds and
+    the table is reloaded when it changes. Lookups and filters go through
+    hash indexes on train_id/source/destination/status and a sorted index
+    on scheduled_departure instead of scanning the table.
+    """
+
+    def __init__(self, path=None, check_interval=1.0, stations=None):
+        self.path = path or get_data_path()
+        self.stations = stations or _graph_stations
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        # Serializes merges in this process; _file_lock does it across workers
+        self._merge_lock = threading.Lock()
+        self._last_check = 0.0
+        self._snapshot = None
+        self._listeners = []
+        self.refresh(force=True)
+
+    def add_listener(self, callback):
+        """Call `callback(old_snapshot, new_snapshot)` after every schedule swap"""
+        self._listeners.append(callback)
+
+    def _notify(self, old, new):
+        for callback in self._listeners:
+            try:
+                callback(old, new)
+            except Exception as e:
+                logger.error(f"Schedule listener failed: {str(e)}")
+
+    def _read(self):
+        if self.path.endswith(".parquet") and os.path.exists(self.path):
+            return ScheduleTable.read_parquet(self.path, self.stations())
+        if not os.path.exists(self.path):
+            # Serve the bundled sample until the first upload writes the live file
+            return ScheduleTable.from_frame(load_sample_data(), self.stations())
+        return ScheduleTable.from_frame(pd.read_csv(self.path), self.stations())
+
+    def refresh(self, force=False):
+        """Reload the schedule if the file changed since the last load"""
+        if not force and time.monotonic() - self._last_check < self.check_interval:
+            return self._snapshot
+        return self._reload(force)
+
+    def _reload(self, force=False):
+        """Check the file's mtime now, ignoring check_interval; reload if it changed (always if `force`)"""
+        now = time.monotonic()
+        with self._lock:
+            self._last_check = now
+            mtime = os.path.getmtime(self.path) if os.path.exists(self.path) else None
+            current = self._snapshot
+            if force or current is None or mtime != current.mtime:
+                version = current.version + 1 if current else 1
+                table = self._read()
+                mtime = os.path.getmtime(self.path) if os.path.exists(self.path) else None
+                self._snapshot = _ScheduleSnapshot(table, mtime, version)
+            snapshot = self._snapshot
+        if snapshot is not current:
+            self._notify(current, snapshot)
+        return snapshot
+
+    def merge(self, frame, replace=False):
+        """
+        Upsert trains into the schedule and persist it.
+
+        Rows of `frame` replace existing rows with the same train_id and
+        departure; `replace=True` swaps the whole schedule instead. The file
+        (CSV, or Parquet for a .parquet path) is rewritten atomically so
+        other workers pick the change up on refresh.
+
+        Merges from every worker are serialized by a lock file next to the
+        schedule, and each one starts from the file as it is on disk, so a
+        merge never overwrites rows another worker just wrote. The table is
+        rebuilt and written outside the read lock; readers keep the old
+        snapshot until the new one is swapped in.
+        """
+        with self._merge_lock, self._file_lock():
+            # Another worker may have rewritten the file since this one last loaded it
+            current = self._reload()
+            if replace or current is None or len(current) == 0:
+                merged = frame.reset_index(drop=True)
+            else:
+                existing = current.table
+                incoming = train_keys(frame["train_id"], parse_minutes(frame["scheduled_departure"]))
+                keep = ~np.isin(current.keys(), incoming)
+                merged = pd.concat([existing.to_frame()[keep], frame], ignore_index=True)
+            table = ScheduleTable.from_frame(merged, self.stations())
+
+            staging = f"{self.path}.{os.getpid()}.tmp"
+            if self.path.endswith(".parquet"):
+                table.to_parquet(staging)
+            else:
+                merged.to_csv(staging, index=False)
+            os.replace(staging, self.path)
+            snapshot = _ScheduleSnapshot(table, os.path.getmtime(self.path), current.version + 1 if current else 1)
+            with self._lock:
+                previous = self._snapshot
+                if previous is not current and previous.mtime == snapshot.mtime:
+                    # A refresh in the meantime already loaded the file just written
+                    snapshot = previous
+                else:
+                    snapshot.version = previous.version + 1 if previous else 1
+                    self._snapshot = snapshot
+                self._last_check = time.monotonic()
+        if snapshot is not previous:
+            self._notify(previous, snapshot)
+        return snapshot
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock across worker processes, held on a sidecar file next to the schedule"""
+        with open(f"{self.path}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @property
+    def version(self):
+        return self.refresh().version
+
+    def frame(self):
+        """The current schedule decoded to a DataFrame"""
+        return self.refresh().frame
+
+    def table(self):
+        """The current columnar ScheduleTable (read-only by convention)"""
+        return self.refresh().table
+
+    def connections(self):
+        """ConnectionIndex over the current schedule (None if columns are missing)"""
+        return self.refresh().connections
+
+    def all(self):
+        """All trains as records"""
+        return self.refresh().records()
+
+    def get(self, train_id):
+        """Look up one train by id"""
+        snapshot = self.refresh()
+        rows = snapshot.train_index.get_indexer_for([train_id])
+        if len(rows) == 0 or rows[0] < 0:
+            return None
+        return snapshot.record(rows[0])
+
+    def positions(self, **filters):
+        """Row positions matching every given filter, in table order"""
+        return self._positions(self.refresh(), **filters)
+
+    @staticmethod
+    def _positions(snapshot, status=None, source=None, destination=None,
+                   departure_from=None, departure_to=None):
+        selected = None
+        for column, value in (("status", status), ("source", source), ("destination", destination)):
+            if value is None:
+                continue
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            index = snapshot.indexes.get(column, {})
+            rows = [index[v] for v in values if v in index]
+            rows = np.unique(np.concatenate(rows)) if rows else np.zeros(0, dtype=np.int64)
+            selected = rows if selected is None else np.intersect1d(selected, rows, assume_unique=True)
+
+        if departure_from is not None or departure_to is not None:
+            lo = np.searchsorted(snapshot.departure_sorted, departure_from if departure_from is not None else 0, side="left")
+            hi = np.searchsorted(snapshot.departure_sorted, departure_to if departure_to is not None else 24 * 60, side="right")
+            rows = np.sort(snapshot.departure_order[lo:hi])
+            selected = rows if selected is None else np.intersect1d(selected, rows, assume_unique=True)
+
+        if selected is None:
+            return np.arange(len(snapshot))
+        return selected
+
+    def page(self, after=None, limit=None, etag=None, **filters):
+        """
+        One page of matching trains, in table order.
+
+        `after` is the row position of the previous page's last train and
+        `etag` the schedule version it came from. Positions shift when the
+        schedule is reloaded, so a cursor from another version raises
+        StaleCursor instead of skipping or repeating trains. The returned
+        next_position is None on the last page.
+        """
+        snapshot = self.refresh()
+        if after is not None and etag != snapshot.etag:
+            raise StaleCursor(etag)
+        rows = self._positions(snapshot, **filters)
+        total = len(rows)
+        if after is not None:
+            rows = rows[np.searchsorted(rows, after, side="right"):]
+        next_position = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_position = int(rows[-1])
+        return {
+            "trains": snapshot.records(rows),
+            "total": total,
+            "next_position": next_position,
+            "etag": snapshot.etag
+        }
+
+    def query(self, **filters):
+        """Trains matching the filters, as records"""
+        snapshot = self.refresh()
+        return snapshot.records(self._positions(snapshot, **filters))
+
+# Global schedule store, loaded on first use
+_schedule_store = None
+_schedule_store_lock = threading.Lock()
+
+def get_schedule_store():
+    global _schedule_store
+    if _schedule_store is None:
+        with _schedule_store_lock:
+            if _schedule_store is None:
+                _schedule_store = ScheduleStore()
+    return _schedule_store
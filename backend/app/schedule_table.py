@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+
+MINUTES_PER_DAY = 24 * 60
+MISSING_MINUTE = np.uint16(0xFFFF)
+DEFAULT_STATUS = "On Time"
+CORE_COLUMNS = ("train_id", "train_name", "source", "destination",
+                "scheduled_departure", "scheduled_arrival", "platform", "status")
+
+# "HH:MM" label of every minute of the day, plus None for MISSING_MINUTE
+_MINUTE_LABELS = np.array(
+    [f"{m // 60:02d}:{m % 60:02d}" for m in range(MINUTES_PER_DAY)] + [None], dtype=object
+)
+
+def minute_labels(minutes):
+    """uint16 minutes (MISSING_MINUTE allowed) -> array of "HH:MM" strings / None"""
+    minutes = np.asarray(minutes)
+    return _MINUTE_LABELS[np.minimum(minutes, MINUTES_PER_DAY)]
+
+def parse_minutes(times):
+    """Vectorized "HH:MM" -> minutes since midnight; -1 where unparseable"""
+    # Timetables repeat the same few hundred times; parse each distinct value once
+    codes, uniques = pd.factorize(pd.Series(times, dtype="object").astype(str))
+    parts = pd.Series(uniques, dtype="object").str.split(":", n=1, expand=True)
+    if parts.shape[1] < 2:
+        return np.full(len(codes), -1, dtype=np.int32)
+    hours = pd.to_numeric(parts[0], errors="coerce")
+    minutes = pd.to_numeric(parts[1], errors="coerce")
+    total = (hours * 60 + minutes).where((hours < 24) & (minutes < 60))
+    return total.fillna(-1).to_numpy(dtype=np.int32)[codes]
+
+def encode_minutes(times):
+    """"HH:MM" strings -> uint16 minutes since midnight, MISSING_MINUTE where unparseable"""
+    minutes = parse_minutes(times)
+    return np.where(minutes >= 0, minutes, MISSING_MINUTE).astype(np.uint16)
+
+class ScheduleTable:
+    """
+    Columnar train schedule.
+
+    - source/destination are int32 codes into `stations`. The vocabulary
+      starts with the routing graph's stations in graph order, so a code
+      below `n_graph_stations` is that station's RailNetwork id; stations
+      the graph lacks are appended after them.
+    - departure/arrival are uint16 minutes since midnight (MISSING_MINUTE
+      when the source time was unparseable).
+    - status is uint8 codes into `statuses` (uint16 past 256 values);
+      platform is int16.
+    - train_id/train_name stay object arrays; any other columns are kept
+      as-is in `extra` and come back on decode.
+    """
+
+    def __init__(self, train_id, train_name, stations, source, destination, departure, arrival,
+                 platform, statuses, status, n_graph_stations=0, extra=None, columns=CORE_COLUMNS):
+        self.train_id = np.asarray(train_id, dtype=object)
+        self.train_name = np.asarray(train_name, dtype=object)
+        self.stations = list(stations)
+        self.station_index = {station: i for i, station in enumerate(self.stations)}
+        self.source = np.asarray(source, dtype=np.int32)
+        self.destination = np.asarray(destination, dtype=np.int32)
+        self.departure = np.asarray(departure, dtype=np.uint16)
+        self.arrival = np.asarray(arrival, dtype=np.uint16)
+        self.platform = np.asarray(platform, dtype=np.int16)
+        self.statuses = list(statuses)
+        self.status = np.asarray(status, dtype=np.uint8 if len(self.statuses) <= 256 else np.uint16)
+        self.n_graph_stations = n_graph_stations
+        self.extra = dict(extra or {})
+        self.columns = list(columns)
+
+    @classmethod
+    def from_frame(cls, frame, stations=()):
+        """Encode a schedule DataFrame (load_sample_data columns); `stations` is the graph vocabulary"""
+        n = len(frame)
+        train_id = frame["train_id"].astype(str).to_numpy(dtype=object)
+        names = frame["train_name"].to_numpy(dtype=object) if "train_name" in frame else train_id
+
+        graph_stations = list(stations)
+        vocabulary = pd.Index(graph_stations)
+        endpoints = [frame[c].astype(str) if c in frame else pd.Series([""] * n) for c in ("source", "destination")]
+        seen = pd.unique(pd.concat(endpoints, ignore_index=True))
+        vocabulary = vocabulary.append(pd.Index(seen[~pd.Index(seen).isin(vocabulary)]))
+        source, destination = (vocabulary.get_indexer(e.to_numpy()) for e in endpoints)
+
+        departure = encode_minutes(frame["scheduled_departure"]) if "scheduled_departure" in frame else np.full(n, MISSING_MINUTE)
+        arrival = encode_minutes(frame["scheduled_arrival"]) if "scheduled_arrival" in frame else np.full(n, MISSING_MINUTE)
+        platform = (pd.to_numeric(frame["platform"], errors="coerce").fillna(0).to_numpy(dtype=np.int16)
+                    if "platform" in frame else np.zeros(n, dtype=np.int16))
+        status_codes, statuses = pd.factorize(
+            frame["status"].fillna(DEFAULT_STATUS).astype(str) if "status" in frame else pd.Series([DEFAULT_STATUS] * n)
+        )
+
+        extra = {c: frame[c].to_numpy() for c in frame.columns if c not in CORE_COLUMNS}
+        columns = [c for c in CORE_COLUMNS] + list(extra)
+        return cls(train_id, names, vocabulary, source, destination, departure, arrival,
+                   platform, statuses, status_codes, len(graph_stations), extra, columns)
+
+    @classmethod
+    def read_parquet(cls, path, stations=()):
+        """
+        Load the on-disk columnar format written by `to_parquet`.
+
+        Station names are re-encoded against the current graph vocabulary,
+        since codes are only meaningful for the graph they were built with.
+        Needs pyarrow (or fastparquet).
+        """
+        frame = pd.read_parquet(path)
+        for column in ("scheduled_departure", "scheduled_arrival"):
+            if column in frame and pd.api.types.is_integer_dtype(frame[column]):
+                frame[column] = minute_labels(frame[column].to_numpy())
+        return cls.from_frame(frame, stations)
+
+    def to_parquet(self, path):
+        """Write stations/status as dictionary-encoded columns and times as uint16 minutes"""
+        stations = pd.Categorical.from_codes(self.source, categories=self.stations)
+        frame = pd.DataFrame({
+            "train_id": self.train_id,
+            "train_name": self.train_name,
+            "source": stations,
+            "destination": pd.Categorical.from_codes(self.destination, categories=self.stations),
+            "scheduled_departure": self.departure,
+            "scheduled_arrival": self.arrival,
+            "platform": self.platform,
+            "status": pd.Categorical.from_codes(self.status, categories=self.statuses),
+            **self.extra
+        }, columns=self.columns)
+        frame.to_parquet(path, index=False)
+
+    def __len__(self):
+        return len(self.train_id)
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the table, strings included"""
+        arrays = [self.source, self.destination, self.departure, self.arrival, self.platform, self.status]
+        total = sum(a.nbytes for a in arrays)
+        total += int(pd.Series(self.train_id).memory_usage(index=False, deep=True))
+        total += int(pd.Series(self.train_name).memory_usage(index=False, deep=True))
+        total += sum(int(pd.Series(v).memory_usage(index=False, deep=True)) for v in self.extra.values())
+        return total
+
+    def departure_minutes(self):
+        """int32 departure minutes, -1 where missing"""
+        return np.where(self.departure == MISSING_MINUTE, -1, self.departure.astype(np.int32))
+
+    def arrival_minutes(self):
+        """int32 arrival minutes, -1 where missing"""
+        return np.where(self.arrival == MISSING_MINUTE, -1, self.arrival.astype(np.int32))
+
+    def status_counts(self):
+        """{status: number of trains}"""
+        counts = np.bincount(self.status, minlength=len(self.statuses))
+        return {status: int(n) for status, n in zip(self.statuses, counts)}
+
+    def column(self, name, rows=None):
+        """Decoded values of one column, optionally for a subset of rows"""
+        take = (lambda a: a) if rows is None else (lambda a: a[rows])
+        if name in ("source", "destination"):
+            return np.asarray(self.stations, dtype=object)[take(getattr(self, name))]
+        if name == "scheduled_departure":
+            return minute_labels(take(self.departure))
+        if name == "scheduled_arrival":
+            return minute_labels(take(self.arrival))
+        if name == "status":
+            return np.asarray(self.statuses, dtype=object)[take(self.status)]
+        if name in self.extra:
+            return take(self.extra[name])
+        return take(getattr(self, name))
+
+    def records(self, rows=None):
+        """Rows as dicts (JSON-ready Python scalars), built only for the rows asked for"""
+        values = [self.column(name, rows).tolist() for name in self.columns]
+        return [dict(zip(self.columns, row)) for row in zip(*values)]
+
+    def to_frame(self):
+        """Decode back to a DataFrame of strings, in the original column order"""
+        return pd.DataFrame({name: self.column(name) for name in self.columns}, columns=self.columns)
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        print("usage: python -m app.schedule_table SCHEDULE_CSV OUTPUT_PARQUET")
+        sys.exit(1)
+    from app.models import get_rerouting_engine
+
+    table = ScheduleTable.from_frame(pd.read_csv(sys.argv[1]), get_rerouting_engine().network.stations)
+    table.to_parquet(sys.argv[2])
+    print(f"Wrote {len(table)} trains ({table.nbytes / 1e6:.1f} MB in memory) to {sys.argv[2]}")
@@ -1,6 +1,70 @@
+from app.cache import make_cache
+from app.features import encode_weather, parse_hours
+from app.metrics import register_cache, stage_timer
 from app.models import get_delay_predictor, get_rerouting_engine
+from app.occupancy import get_occupancy_tracker
+from app.propagation import get_propagation_tracker
+from app.schedule import get_schedule_store, parse_minutes
 from datetime import datetime, timedelta
-import random
+import numpy as np
+
+RISK_THRESHOLDS = [0.3, 0.6]
+RISK_LEVELS = ["LOW", "MEDIUM", "HIGH"]
+
+# Delay minutes over probability: 0-10 LOW, 10-30 MEDIUM, 30-90 HIGH
+DELAY_PROB_POINTS = [0.0, 0.3, 0.6, 1.0]
+DELAY_MINUTE_POINTS = [0, 10, 30, 90]
+
+# How far ahead to look for replacement trains, and how many to offer
+ALT_TRAIN_WINDOW_MINUTES = 180
+ALT_TRAIN_LIMIT = 3
+
+# Predictions repeat heavily within a minute of dashboard polling
+prediction_cache = make_cache("predictions", maxsize=10000, ttl=60.0)
+register_cache("predictions", prediction_cache)
+# Ranked routes, keyed by the network's fingerprint so congestion changes miss
+route_cache = make_cache("routes", maxsize=10000, ttl=600.0)
+register_cache("routes", route_cache)
+
+def _encode_features_timed(operation, state, current_time, station, weather="clear", day_of_week=1):
+    """The model pipeline's feature matrix, with the parse and encode stages timed separately"""
+    with stage_timer(operation, "parse"):
+        hour = parse_hours(current_time)
+    with stage_timer(operation, "encode"):
+        return state.pipeline.assemble(hour, day_of_week, encode_weather(weather), station)
+
+def _identify_factors(hour: int, weather_encoded: int, day_of_week: int):
+    """List the conditions contributing to delay risk"""
+    factors = []
+    if 7 <= hour <= 10 or 17 <= hour <= 20:
+        factors.append("Peak hours")
+    if weather_encoded >= 2:
+        factors.append("Adverse weather")
+    if day_of_week >= 5:
+        factors.append("Weekend traffic")
+    if not factors:
+        factors.append("Normal conditions")
+    return factors
+
+def _estimate_delay_minutes(delay_prob):
+    """Deterministic delay estimate, piecewise linear in probability across the risk tiers"""
+    return np.rint(np.interp(delay_prob, DELAY_PROB_POINTS, DELAY_MINUTE_POINTS)).astype(int)
+
+def _summarize(delay_prob, delay_minutes, hour, weather_encoded, day_of_week):
+    """Feature-dependent part of a prediction response (cacheable)"""
+    tier = int(np.digitize(delay_prob, RISK_THRESHOLDS))
+    return {
+        "delay_probability": round(float(delay_prob), 3),
+        "predicted_delay_minutes": int(delay_minutes),
+        "risk_level": RISK_LEVELS[tier],
+        "factors": _identify_factors(hour, weather_encoded, day_of_week)
+    }
+
+def _cache_keys(state, stations, X):
+    hour = state.pipeline.column(X, "hour").astype(int).tolist()
+    day_of_week = state.pipeline.column(X, "day_of_week").astype(int).tolist()
+    weather_encoded = state.pipeline.column(X, "weather_encoded").astype(int).tolist()
+    return list(zip([state.version] * len(X), stations, hour, weather_encoded, day_of_week))
 
 def predict_train_delay(train_id: str, current_time: str, station: str, 
                        weather: str = "clear", day_of_week: int = 1):
@@ -8,57 +72,102 @@ def predict_train_delay(train_id: str, current_time: str, station: str,
     Predict delay probability for a train
     """
     predictor = get_delay_predictor()
+    state = predictor._current_state()
     
-    # Parse time
-    try:
-        time_obj = datetime.strptime(current_time, "%H:%M")
-        hour = time_obj.hour
-    except:
-        hour = 12
+    # Create feature vector
+    X = _encode_features_timed("predict_delay", state, current_time, station, weather, day_of_week)
+    key = _cache_keys(state, [station], X)[0]
+    _, _, hour, weather_encoded, day_of_week = key
     
-    # Encode weather
-    weather_map = {"clear": 0, "cloudy": 1, "rain": 2, "storm": 3, "fog": 2}
-    weather_encoded = weather_map.get(weather.lower(), 0)
+    # Identical inputs give identical outputs, so repeat queries hit the cache
+    def score():
+        with stage_timer("predict_delay", "infer"):
+            delay_prob = predictor.predict_delay_probabilities(X, state)[0]
+        with stage_timer("predict_delay", "post_process"):
+            delay_minutes = _estimate_delay_minutes(delay_prob)
+            return _summarize(delay_prob, delay_minutes, hour, weather_encoded, day_of_week)
     
-    # Encode station (simplified hash)
-    station_encoded = hash(station) % 10
+    scored = prediction_cache.get_or_compute(key, score)
+    return {"train_id": train_id, **scored}
+
+def predict_train_delays_batch(rows: list):
+    """
+    Predict delay probabilities for many trains with a single model call.
     
-    # Create feature vector
-    features = [hour, day_of_week, weather_encoded, station_encoded]
-    
-    # Get prediction
-    delay_prob = predictor.predict_delay_probability(features)
-    
-    # Calculate predicted delay minutes
-    if delay_prob < 0.3:
-        delay_minutes = random.randint(0, 10)
-        risk_level = "LOW"
-    elif delay_prob < 0.6:
-        delay_minutes = random.randint(10, 30)
-        risk_level = "MEDIUM"
-    else:
-        delay_minutes = random.randint(30, 90)
-        risk_level = "HIGH"
+    `rows` is a list of dicts with the predict_train_delay keyword arguments;
+    results are returned in the same order. Cached rows skip the model.
+    """
+    if not rows:
+        return []
     
-    # Identify factors
-    factors = []
-    if 7 <= hour <= 10 or 17 <= hour <= 20:
-        factors.append("Peak hours")
-    if weather_encoded >= 2:
-        factors.append("Adverse weather")
-    if day_of_week >= 5:
-        factors.append("Weekend traffic")
-    if not factors:
-        factors.append("Normal conditions")
+    predictor = get_delay_predictor()
+    state = predictor._current_state()
+    
+    # One pipeline pass encodes every row
+    stations = [row["station"] for row in rows]
+    with stage_timer("predict_delay_batch", "encode"):
+        X = state.pipeline.transform(
+            [row["current_time"] for row in rows], stations,
+            [row.get("weather") for row in rows], [row.get("day_of_week", 1) for row in rows]
+        )
+    keys = _cache_keys(state, stations, X)
+    # One round trip for the whole batch on a shared cache
+    scored = prediction_cache.get_many(keys)
     
+    # Score the cache misses' rows of the matrix in one model call
+    misses = [i for i, s in enumerate(scored) if s is None]
+    if misses:
+        with stage_timer("predict_delay_batch", "infer"):
+            delay_probs = predictor.predict_delay_probabilities(X[misses], state)
+        with stage_timer("predict_delay_batch", "post_process"):
+            delay_minutes = _estimate_delay_minutes(delay_probs)
+            for i, prob, minutes in zip(misses, delay_probs, delay_minutes):
+                _, _, hour, weather_encoded, day_of_week = keys[i]
+                scored[i] = _summarize(prob, minutes, hour, weather_encoded, day_of_week)
+        prediction_cache.set_many([(keys[i], scored[i]) for i in misses])
+    
+    return [{"train_id": row["train_id"], **s} for row, s in zip(rows, scored)]
+
+def _format_minutes(minutes: int) -> str:
+    minutes = int(minutes) % (24 * 60)
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def _describe_journey(index, table, legs):
+    """Response entry for a journey of one or more scheduled trains"""
+    first, last = legs[0], legs[-1]
+    stations = [index.stations[index.src[first]]] + [index.stations[index.dst[c]] for c in legs]
+    seats = table.extra.get("available_seats")
+    row = index.row[first]
     return {
-        "train_id": train_id,
-        "delay_probability": round(delay_prob, 3),
-        "predicted_delay_minutes": delay_minutes,
-        "risk_level": risk_level,
-        "factors": factors
+        "train_id": " + ".join(table.train_id[index.row[c]] for c in legs),
+        "departure_time": _format_minutes(index.dep[first]),
+        "arrival_time": _format_minutes(index.arr[last]),
+        "available_seats": seats[row:row + 1].tolist()[0] if seats is not None else None,
+        "route": " → ".join(stations),
+        "transfers": len(legs) - 1
     }
 
+def find_alternative_trains(path: list, destination_station: str, now_minutes: int,
+                            window: int = ALT_TRAIN_WINDOW_MINUTES, limit: int = ALT_TRAIN_LIMIT):
+    """
+    Scheduled trains a delayed passenger can switch to.
+    
+    Direct options are trains leaving a station on `path` within `window`
+    minutes and running to a later station on it. A connection scan adds
+    the earliest-arriving journey to the destination, transfers included.
+    """
+    snapshot = get_schedule_store().refresh()
+    index = snapshot.connections
+    if index is None or not path:
+        return []
+    
+    options = [[c] for c in index.departures_along(path, now_minutes, now_minutes + window)]
+    journey = index.earliest_arrival(path[0], destination_station, now_minutes)
+    if journey and journey not in options:
+        options.insert(0, journey)
+    
+    return [_describe_journey(index, snapshot.table, legs) for legs in options[:limit]]
+
 def suggest_reroute(delayed_train_id: str, current_station: str, 
                    destination_station: str, delay_minutes: int, 
                    available_routes: list = []):
@@ -67,8 +176,25 @@ def suggest_reroute(delayed_train_id: str, current_station: str,
     """
     engine = get_rerouting_engine()
     
-    # Find alternative route
-    alt_route = engine.find_alternative_route(current_station, destination_station)
+    with stage_timer("reroute", "graph_search"):
+        # Find alternative route
+        alt_route = engine.find_alternative_route(current_station, destination_station)
+        
+        # Rank weighted alternatives by running time; a burst of requests for
+        # the same pair after a disruption computes it once
+        ranked_routes = route_cache.get_or_compute(
+            (engine.network.fingerprint(), current_station, destination_station, 3),
+            lambda: engine.find_ranked_routes(current_station, destination_station, k=3)
+        )
+    now = datetime.now()
+    alternative_routes = [
+        {
+            "rank": rank,
+            **route,
+            "eta": (now + timedelta(minutes=route["travel_time_minutes"])).strftime("%H:%M")
+        }
+        for rank, route in enumerate(ranked_routes, start=1)
+    ]
     
     # Determine action based on delay severity
     if delay_minutes < 15:
@@ -81,17 +207,16 @@ def suggest_reroute(delayed_train_id: str, current_station: str,
         action = "HOLD - Wait for track clearance"
         recovery_time = delay_minutes // 4
     
-    # Generate alternative trains
-    alternative_trains = []
-    for i in range(1, 4):
-        alt_train_id = f"ALT{random.randint(1000, 9999)}"
-        departure_time = datetime.now() + timedelta(minutes=random.randint(15, 60))
-        alternative_trains.append({
-            "train_id": alt_train_id,
-            "departure_time": departure_time.strftime("%H:%M"),
-            "available_seats": random.randint(50, 200),
-            "route": " → ".join(alt_route[:3]) if len(alt_route) >= 3 else "Direct"
-        })
+    # Suggest the fastest weighted route; its running time and ETA stay on alternative_routes
+    if ranked_routes:
+        alt_route = ranked_routes[0]["path"]
+    
+    # Look up real alternative trains in the schedule
+    with stage_timer("reroute", "alternative_trains"):
+        path = alt_route if alt_route else [current_station, destination_station]
+        alternative_trains = find_alternative_trains(
+            path, destination_station, now.hour * 60 + now.minute
+        )
     
     # Calculate confidence score
     confidence = 0.85 if alt_route else 0.60
@@ -103,6 +228,78 @@ def suggest_reroute(delayed_train_id: str, current_station: str,
         "recommended_action": action,
         "alternative_trains": alternative_trains,
         "reroute_path": alt_route if alt_route else [current_station, destination_station],
+        "alternative_routes": alternative_routes,
         "estimated_recovery_time": recovery_time,
         "confidence_score": round(confidence, 2)
     }
+
+def plan_batch_reroute(trains: list, blocked_stations: list = [], capacity: int = None,
+                       capacity_overrides: dict = None, time_budget: float = 2.0):
+    """
+    Coordinated rerouting plan for a set of delayed trains, scored per train
+    """
+    engine = get_rerouting_engine()
+    options = {} if capacity is None else {"capacity": capacity}
+    with stage_timer("reroute_batch", "graph_search"):
+        return engine.plan_reroutes(trains, blocked_stations, capacity_overrides=capacity_overrides,
+                                    time_budget=time_budget, **options)
+
+def check_reroute_conflicts(reroute: dict, depart_minutes: int = None):
+    """
+    Add platform and track conflicts to a suggest_reroute result.
+    
+    `conflicts` details the recommended reroute_path; each ranked
+    alternative gets a count of its segment conflicts. Run this in the API
+    process, where accepted reroutes are held.
+    """
+    if depart_minutes is None:
+        now = datetime.now()
+        depart_minutes = now.hour * 60 + now.minute
+    tracker = get_occupancy_tracker()
+    train_id = reroute["delayed_train_id"]
+    alternative_routes = [
+        {**route, "conflicts": len(tracker.check_path(route["path"], depart_minutes, train_id)["segments"])}
+        for route in reroute["alternative_routes"]
+    ]
+    return {
+        **reroute,
+        "alternative_routes": alternative_routes,
+        "conflicts": tracker.check_path(reroute["reroute_path"], depart_minutes, train_id)
+    }
+
+def propagate_delays(delays: list, what_if: bool = False, limit: int = None):
+    """
+    Push train delays through the dependency graph and return the knock-on.
+    
+    `delays` are dicts with train_id, optional scheduled_departure (HH:MM,
+    else every run of the train) and delay_minutes. Without delay_minutes
+    the delay is predicted from the run's departure time and source station
+    (with the given weather and day_of_week).
+    """
+    tracker = get_propagation_tracker()
+    resolved, applied = [], []
+    for delay in delays:
+        departure = delay.get("scheduled_departure")
+        departure = int(parse_minutes([departure])[0]) if departure else None
+        if delay.get("delay_minutes") is not None:
+            resolved.append((delay["train_id"], departure, delay["delay_minutes"]))
+            applied.append({"train_id": delay["train_id"], "scheduled_departure": delay.get("scheduled_departure"),
+                            "delay_minutes": delay["delay_minutes"], "basis": "observed"})
+            continue
+        runs = tracker.runs(delay["train_id"], departure)
+        if not runs:
+            # Reported back as unknown
+            resolved.append((delay["train_id"], departure, 0))
+        for run in runs:
+            minutes = predict_train_delay(
+                delay["train_id"], run["scheduled_departure"], run["source"],
+                delay.get("weather") or "clear", delay.get("day_of_week", 1)
+            )["predicted_delay_minutes"]
+            resolved.append((delay["train_id"], int(parse_minutes([run["scheduled_departure"]])[0]), minutes))
+            applied.append({"train_id": delay["train_id"], "scheduled_departure": run["scheduled_departure"],
+                            "delay_minutes": minutes, "basis": "predicted"})
+    
+    with stage_timer("propagate", "propagate"):
+        result = tracker.propagate(resolved, what_if=what_if, limit=limit)
+    known = set(delay["train_id"] for delay in delays) - set(result["unknown"])
+    return {"applied": [a for a in applied if a["train_id"] in known], "what_if": what_if, **result}
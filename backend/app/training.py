@@ -0,0 +1,68 @@
+from app.artifacts import ModelArtifactStore
+from app.compiled_forest import CompiledForest
+from app.features import FEATURES, FeaturePipeline, StationFeatures
+from app.models import get_rerouting_engine
+from app.schedule import get_schedule_store
+import numpy as np
+import pandas as pd
+
+# A train counts as delayed when it runs more than this late
+DELAYED_AFTER_MINUTES = 5
+
+def build_training_set(frame: pd.DataFrame, network=None):
+    """
+    Turn historical schedule records into (X, y, label_encoders).
+
+    Features are FEATURES, built by the same FeaturePipeline that serves
+    predictions. Optional columns `date`/`day_of_week`, `weather` and
+    `delay_minutes` are used when present; otherwise the label is
+    `status == "Delayed"`. Station degree and centrality come from
+    `network` (the routing graph by default), the delay rate from `frame`.
+    """
+    if "day_of_week" in frame:
+        day_of_week = frame["day_of_week"].to_numpy(dtype=float)
+    elif "date" in frame:
+        day_of_week = pd.to_datetime(frame["date"], errors="coerce").dt.dayofweek.to_numpy(dtype=float)
+    else:
+        day_of_week = np.ones(len(frame))
+    weather = frame["weather"].to_numpy(dtype=object) if "weather" in frame else "clear"
+    source = frame["source"].astype(str).to_numpy()
+
+    if "delay_minutes" in frame:
+        y = (frame["delay_minutes"].fillna(0).to_numpy() > DELAYED_AFTER_MINUTES).astype(int)
+    else:
+        y = (frame["status"] == "Delayed").to_numpy(dtype=int)
+
+    from sklearn.preprocessing import LabelEncoder
+
+    station_encoder = LabelEncoder().fit(source)
+    station_features = StationFeatures.build(network or get_rerouting_engine().network, source, y)
+    pipeline = FeaturePipeline(
+        {station: i for i, station in enumerate(station_encoder.classes_)}, station_features, FEATURES
+    )
+    X = pipeline.transform(frame["scheduled_departure"].to_numpy(dtype=object), source, weather, day_of_week)
+    return X, y, {"station": station_encoder, "station_features": station_features}
+
+def train_delay_model(frame: pd.DataFrame = None, store: ModelArtifactStore = None, publish=True):
+    """Fit a delay model on historical records and save it as a new artifact version"""
+    frame = frame if frame is not None else get_schedule_store().frame()
+    store = store or ModelArtifactStore()
+
+    from sklearn.ensemble import RandomForestClassifier
+
+    X, y, label_encoders = build_training_set(frame)
+    model = RandomForestClassifier(n_estimators=100, random_state=42)
+    model.fit(X, y)
+
+    return store.save(model, label_encoders, {
+        "rows": int(len(X)),
+        "delay_rate": round(float(y.mean()), 4) if len(y) else 0.0,
+        "features": FEATURES
+    }, publish=publish, compiled=CompiledForest.from_sklearn(model))
+
+if __name__ == "__main__":
+    import sys
+
+    frame = pd.read_csv(sys.argv[1]) if len(sys.argv) > 1 else None
+    version = train_delay_model(frame)
+    print(f"Published delay model version {version}")
@@ -1,7 +1,12 @@
-import pandas as pd
+from typing import TYPE_CHECKING
 import logging
 from datetime import datetime
+import json
 import os
+import random
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 # Configure logging
 logging.basicConfig(
@@ -10,13 +15,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def log_request(endpoint: str, data: dict):
-    """Log incoming API requests"""
-    logger.info(f"Endpoint: {endpoint} | Data: {data}")
+# Fraction of requests logged; formatting every request is too costly at high QPS
+REQUEST_LOG_SAMPLE_RATE = float(os.environ.get("REQUEST_LOG_SAMPLE_RATE", "0.01"))
+
+def log_request(endpoint: str, data):
+    """Log a sampled, structured record of an API request.
+    
+    `data` may be a dict, a pydantic model or a zero-argument callable; it is
+    only materialized when the request is sampled.
+    """
+    if random.random() >= REQUEST_LOG_SAMPLE_RATE or not logger.isEnabledFor(logging.INFO):
+        return
+    if callable(data):
+        data = data()
+    elif hasattr(data, "dict"):
+        data = data.dict()
+    logger.info("%s", json.dumps({"event": "request", "endpoint": endpoint, "data": data}, default=str))
+
+SAMPLE_DATA_PATH = os.path.join(os.path.dirname(__file__), "sample_data.csv")
+LIVE_SCHEDULE_PATH = os.path.join(os.path.dirname(__file__), "live_schedule.csv")
+
+def get_data_path():
+    """
+    Path of the live train schedule, which uploads rewrite (TRAIN_SCHEDULE_PATH,
+    else an untracked file seeded from the bundled sample on the first upload)
+    """
+    return os.environ.get("TRAIN_SCHEDULE_PATH") or LIVE_SCHEDULE_PATH
 
 def load_sample_data():
-    """Load sample train schedule data"""
-    data_path = os.path.join(os.path.dirname(__file__), "sample_data.csv")
+    """Load the bundled sample train schedule (never rewritten by uploads)"""
+    import pandas as pd
+
+    data_path = SAMPLE_DATA_PATH
     
     if os.path.exists(data_path):
         return pd.read_csv(data_path)
@@ -36,7 +66,7 @@ def load_sample_data():
     sample_data.to_csv(data_path, index=False)
     return sample_data
 
-def clean_data(df: pd.DataFrame) -> pd.DataFrame:
+def clean_data(df: "pd.DataFrame") -> "pd.DataFrame":
     """Clean and preprocess train data"""
     df = df.dropna()
     df = df.drop_duplicates()
@@ -0,0 +1,66 @@
+from app.metrics import registry
+from app.models import get_delay_predictor, get_rerouting_engine
+from app.schedule import get_schedule_store
+import logging
+import threading
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Load the graph, schedule and model in the background as soon as a worker starts
+WARM_ON_STARTUP = os.environ.get("WARM_ON_STARTUP", "1") != "0"
+
+# Load order: the schedule is encoded against the graph's station ids
+COMPONENTS = ("graph", "schedule", "model")
+
+# component -> seconds it took to load, once loaded
+_warm_seconds = {}
+_warm_lock = threading.Lock()
+_warm_thread = None
+
+def _load(component):
+    if component == "graph":
+        # Small networks get every BFS route tree precomputed here, off the request path
+        get_rerouting_engine().route_table.warm_if_small()
+    elif component == "schedule":
+        get_schedule_store()
+    elif component == "model":
+        # Reads the latest artifact (and imports sklearn) if one is published
+        get_delay_predictor()._current_state()
+
+registry.register_collector(
+    "component_warm_seconds", "gauge", "Time taken to load each component on startup",
+    ("component",), lambda: {(c,): round(s, 4) for c, s in _warm_seconds.items()}
+)
+
+def warm_up():
+    """Load every component now; safe to call more than once"""
+    for component in COMPONENTS:
+        if component in _warm_seconds:
+            continue
+        start = time.perf_counter()
+        try:
+            _load(component)
+        except Exception as e:
+            logger.error(f"Warm-up of {component} failed: {str(e)}")
+            return
+        _warm_seconds[component] = time.perf_counter() - start
+    logger.info("Warm-up finished: " + ", ".join(f"{c} {s:.2f}s" for c, s in _warm_seconds.items()))
+
+def start_warm_up():
+    """Run warm_up on a daemon thread so the worker accepts connections meanwhile"""
+    global _warm_thread
+    with _warm_lock:
+        if _warm_thread is None or not _warm_thread.is_alive():
+            _warm_thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+            _warm_thread.start()
+
+def readiness():
+    """Which components are loaded; ready once all of them are"""
+    components = {c: c in _warm_seconds for c in COMPONENTS}
+    return {
+        "ready": all(components.values()),
+        "components": components,
+        "warm_seconds": {c: round(s, 3) for c, s in _warm_seconds.items()}
+    }
@@ -0,0 +1,43 @@
+"""
+Single-row and batch latency: sklearn predict_proba vs CompiledForest.
+
+Run from backend/:  python -m bench.bench_inference
+"""
+from sklearn.ensemble import RandomForestClassifier
+from app.compiled_forest import CompiledForest
+import numpy as np
+import time
+
+def _random_features(rng, n):
+    return np.column_stack([
+        rng.integers(0, 24, n), rng.integers(0, 7, n),
+        rng.integers(0, 4, n), rng.integers(0, 30, n)
+    ]).astype(float)
+
+def _time_per_call(fn, X, repeats):
+    fn(X)  # warm up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(X)
+    return (time.perf_counter() - start) / repeats
+
+def run(n_train=5000, repeats=200, seed=0):
+    rng = np.random.default_rng(seed)
+    X = _random_features(rng, n_train)
+    y = (rng.random(n_train) < 0.2 + 0.3 * (X[:, 2] > 1)).astype(int)
+    model = RandomForestClassifier(n_estimators=100, random_state=42).fit(X, y)
+    compiled = CompiledForest.from_sklearn(model)
+
+    results = {}
+    for label, rows in (("single", 1), ("batch_1000", 1000)):
+        Xq = _random_features(rng, rows)
+        assert np.array_equal(model.predict_proba(Xq), compiled.predict_proba(Xq))
+        n = repeats if rows == 1 else max(repeats // 20, 5)
+        sk = _time_per_call(model.predict_proba, Xq, n)
+        cf = _time_per_call(compiled.predict_proba, Xq, n)
+        results[label] = {"sklearn_ms": sk * 1000, "compiled_ms": cf * 1000, "speedup": sk / cf}
+    return results
+
+if __name__ == "__main__":
+    for label, r in run().items():
+        print(f"{label:>10}: sklearn {r['sklearn_ms']:.3f} ms | compiled {r['compiled_ms']:.3f} ms | {r['speedup']:.1f}x")
@@ -0,0 +1,86 @@
+"""
+Cold-start cost of a backend worker: importing app.main, then warming up.
+
+Each run is a fresh interpreter, as a new uvicorn worker would be. Reports
+the import time, the warm-up time per component, and which heavy modules
+were already loaded after import (none of them should be sklearn/scipy).
+
+Run from backend/:
+    python -m bench.bench_startup --runs 5
+    python -m bench.bench_startup --compare bench/results/startup-<commit>.json
+"""
+from bench.simulator import BACKEND_DIR, RESULTS_DIR, _git_commit
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ("pandas", "sklearn", "scipy", "joblib")
+
+# Runs in the child interpreter; prints one JSON line
+_PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter() - start
+loaded = [m for m in {HEAVY_MODULES!r} if m in sys.modules]
+from app.warmup import _warm_seconds, warm_up
+warm_up()
+print(json.dumps({{"import_seconds": imported, "loaded_after_import": loaded,
+                  "warm_seconds": dict(_warm_seconds)}}))
+"""
+
+def measure_once():
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR, WARM_ON_STARTUP="0")
+    out = subprocess.run([sys.executable, "-c", _PROBE], cwd=BACKEND_DIR, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def run(runs=5):
+    samples = [measure_once() for _ in range(runs)]
+    imports = [s["import_seconds"] for s in samples]
+    components = samples[0]["warm_seconds"].keys()
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "runs": runs,
+        "import_seconds": {"median": statistics.median(imports), "min": min(imports), "max": max(imports)},
+        "warm_seconds": {c: statistics.median(s["warm_seconds"].get(c, 0.0) for s in samples) for c in components},
+        "loaded_after_import": samples[0]["loaded_after_import"]
+    }
+
+def save(result, path=None):
+    path = path or os.path.join(RESULTS_DIR, f"startup-{result['commit']}.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    return path
+
+def report(result, baseline=None):
+    line = f"import app.main: {result['import_seconds']['median'] * 1000:.0f} ms median"
+    if baseline:
+        before = baseline["import_seconds"]["median"]
+        line += (f" (was {before * 1000:.0f} ms at {baseline['commit']}, "
+                 f"{(result['import_seconds']['median'] - before) / before:+.0%})")
+    print(line)
+    for component, seconds in result["warm_seconds"].items():
+        print(f"  warm {component:>8}: {seconds * 1000:.0f} ms")
+    print(f"  heavy modules after import: {', '.join(result['loaded_after_import']) or 'none'}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="result JSON path (default bench/results/startup-<commit>.json)")
+    parser.add_argument("--compare", help="earlier result JSON to diff against")
+    args = parser.parse_args()
+
+    result = run(args.runs)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(result, baseline)
+    print(f"Saved {save(result, args.output)}")
@@ -0,0 +1,368 @@
+"""
+Disruption simulator and load harness for /predict_delay and /reroute.
+
+Builds a synthetic network and schedule, replays a disruption scenario as a
+stream of requests at a target rate, and reports latency percentiles,
+throughput and peak memory. Results are written as JSON so runs on different
+commits can be compared.
+
+Run from backend/:
+    python -m bench.simulator --stations 500 --trains 5000 --rate 200 --duration 10
+    python -m bench.simulator --target http --serve             # spawns a local uvicorn
+    python -m bench.simulator --target http --url http://127.0.0.1:8000
+    python -m bench.simulator --compare bench/results/simulator-<commit>.json
+"""
+from concurrent.futures import ThreadPoolExecutor
+from app.network import AVERAGE_SPEED_KMPM, ROUTE_FACTOR, RailNetwork, haversine_km
+import urllib.error
+import urllib.request
+import subprocess
+import tempfile
+import argparse
+import datetime
+import resource
+import json
+import time
+import sys
+import os
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "bench", "results")
+
+# Weather seen around a disruption, skewed towards bad conditions
+DISRUPTION_WEATHER = (["clear", "cloudy", "rain", "storm", "fog"], [0.15, 0.15, 0.3, 0.25, 0.15])
+
+def synthetic_network(n_stations=200, neighbors=3, chords=0.05, seed=0):
+    """
+    Connected RailNetwork of `n_stations` random stations spread over India.
+
+    Stations are linked to their next `neighbors` stations in west-to-east
+    order (a connected band), plus random long-distance chords. Every link
+    runs both ways, weighted like RailNetwork.from_adjacency.
+    """
+    rng = np.random.default_rng(seed)
+    stations = [f"ST{i:05d}" for i in range(n_stations)]
+    lat = rng.uniform(8.0, 32.0, n_stations)
+    lon = np.sort(rng.uniform(68.0, 92.0, n_stations))
+
+    src = np.concatenate([np.arange(n_stations - k) for k in range(1, neighbors + 1)])
+    dst = np.concatenate([np.arange(k, n_stations) for k in range(1, neighbors + 1)])
+    n_chords = int(n_stations * chords)
+    chord_src = rng.integers(0, n_stations, n_chords)
+    chord_dst = rng.integers(0, n_stations, n_chords)
+    keep = chord_src != chord_dst
+    src = np.concatenate([src, chord_src[keep]])
+    dst = np.concatenate([dst, chord_dst[keep]])
+
+    km = haversine_km(lat[src], lon[src], lat[dst], lon[dst]) * ROUTE_FACTOR
+    return RailNetwork.from_arrays(
+        stations, np.concatenate([src, dst]), np.concatenate([dst, src]),
+        np.tile(km / AVERAGE_SPEED_KMPM, 2), np.tile(km, 2), lat, lon
+    )
+
+def _format_minutes(minutes):
+    minutes = np.asarray(minutes) % (24 * 60)
+    return [f"{h:02d}:{m:02d}" for h, m in zip(minutes // 60, minutes % 60)]
+
+def synthetic_schedule(network, n_trains=1000, delayed_share=0.15, seed=0):
+    """Schedule in load_sample_data's columns, one train per random network link"""
+    rng = np.random.default_rng(seed)
+    edges = rng.integers(0, network.edge_count, n_trains)
+    departure = rng.integers(0, 24 * 60, n_trains)
+    arrival = departure + np.maximum(1, np.round(network.running_time[edges])).astype(np.int64)
+    stations = np.asarray(network.stations)
+    return pd.DataFrame({
+        "train_id": [f"TR{i:05d}" for i in range(1, n_trains + 1)],
+        "train_name": [f"Express {i}" for i in range(1, n_trains + 1)],
+        "source": stations[network.sources[edges]],
+        "destination": stations[network.targets[edges]],
+        "scheduled_departure": _format_minutes(departure),
+        "scheduled_arrival": _format_minutes(arrival),
+        "platform": rng.integers(1, 11, n_trains),
+        "status": np.where(rng.random(n_trains) < delayed_share, "Delayed", "On Time")
+    })
+
+def disruption_scenario(network, schedule, n_requests, reroute_share=0.3, seed=0):
+    """
+    Requests triggered by a disruption at one station.
+
+    Trains touching the epicentre or its neighbours are re-scored with
+    /predict_delay; a share of them ask /reroute for a way from a station
+    near the epicentre to a random destination.
+    """
+    rng = np.random.default_rng(seed)
+    epicentre = int(rng.integers(0, len(network)))
+    nearby = {epicentre} | set(network.targets[network.offsets[epicentre]:network.offsets[epicentre + 1]].tolist())
+    nearby_names = np.asarray([network.stations[i] for i in sorted(nearby)])
+
+    affected = schedule[schedule["source"].isin(nearby_names) | schedule["destination"].isin(nearby_names)]
+    if affected.empty:
+        affected = schedule
+    rows = affected.iloc[rng.integers(0, len(affected), n_requests)]
+    is_reroute = rng.random(n_requests) < reroute_share
+    weather = rng.choice(DISRUPTION_WEATHER[0], n_requests, p=DISRUPTION_WEATHER[1])
+    origins = rng.choice(nearby_names, n_requests)
+    destinations = np.asarray(network.stations)[rng.integers(0, len(network), n_requests)]
+    delays = rng.integers(5, 120, n_requests)
+    days = rng.integers(0, 7, n_requests)
+
+    requests = []
+    for i, row in enumerate(rows.itertuples(index=False)):
+        if is_reroute[i]:
+            requests.append(("/reroute", {
+                "delayed_train_id": row.train_id,
+                "current_station": str(origins[i]),
+                "destination_station": str(destinations[i]),
+                "delay_minutes": int(delays[i])
+            }))
+        else:
+            requests.append(("/predict_delay", {
+                "train_id": row.train_id,
+                "current_time": row.scheduled_departure,
+                "station": row.source,
+                "weather_condition": str(weather[i]),
+                "day_of_week": int(days[i])
+            }))
+    return {"epicentre": network.stations[epicentre], "requests": requests}
+
+class InProcessTarget:
+    """Calls the service layer directly with the synthetic network and schedule installed"""
+
+    name = "inprocess"
+
+    def __init__(self, network, schedule_path):
+        import app.schedule
+        from app.models import get_rerouting_engine
+        from app.services import predict_train_delay, suggest_reroute
+
+        get_rerouting_engine().load_network(network)
+        app.schedule._schedule_store = app.schedule.ScheduleStore(schedule_path)
+        self._predict = predict_train_delay
+        self._reroute = suggest_reroute
+
+    def send(self, endpoint, payload):
+        if endpoint == "/predict_delay":
+            self._predict(
+                train_id=payload["train_id"], current_time=payload["current_time"],
+                station=payload["station"], weather=payload["weather_condition"],
+                day_of_week=payload["day_of_week"]
+            )
+        else:
+            self._reroute(**payload)
+        return 200
+
+    def peak_memory_mb(self):
+        # ru_maxrss is in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def close(self):
+        pass
+
+class HttpTarget:
+    """POSTs to a running API; optionally owns the uvicorn process it measures"""
+
+    name = "http"
+
+    def __init__(self, url, process=None, timeout=30.0):
+        self.url = url.rstrip("/")
+        self.process = process
+        self.timeout = timeout
+
+    def send(self, endpoint, payload):
+        request = urllib.request.Request(
+            self.url + endpoint, data=json.dumps(payload).encode(),
+            headers={"Content-Type": "application/json"}, method="POST"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def peak_memory_mb(self):
+        """Server high-water RSS, when the server is a local child process"""
+        if self.process is None:
+            return None
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            return None
+        return None
+
+    def close(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait(timeout=10)
+
+def serve_uvicorn(network, schedule_path, workdir, port=8765, startup_timeout=60.0):
+    """Start uvicorn on the synthetic network snapshot and schedule; returns an HttpTarget"""
+    snapshot = os.path.join(workdir, "network")
+    network.save_snapshot(snapshot)
+    env = dict(os.environ, RAIL_NETWORK_SNAPSHOT=snapshot, TRAIN_SCHEDULE_PATH=schedule_path)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(url + "/health", timeout=1.0):
+                return HttpTarget(url, process)
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("uvicorn did not become healthy in time")
+
+def replay(target, requests, rate, concurrency=32):
+    """
+    Open-loop replay: request i is due at start + i / rate regardless of how
+    earlier ones fared. Latency is measured from the due time, so queueing
+    behind a slow server is counted instead of hidden.
+    """
+    records = [None] * len(requests)
+
+    def call(i, due):
+        endpoint, payload = requests[i]
+        try:
+            status = target.send(endpoint, payload)
+        except Exception:
+            status = 0
+        records[i] = (endpoint, status, time.perf_counter() - due)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(len(requests)):
+            due = start + i / rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(call, i, due)
+    return records, time.perf_counter() - start
+
+def summarize(records, elapsed):
+    """Latency percentiles (ms), error counts and throughput, overall and per endpoint"""
+    def stats(subset):
+        latency = np.array([r[2] for r in subset]) * 1000
+        statuses = pd.Series([r[1] for r in subset]).value_counts()
+        return {
+            "requests": len(subset),
+            "errors": int(sum(n for status, n in statuses.items() if status != 200)),
+            "status_counts": {str(status): int(n) for status, n in statuses.items()},
+            "p50_ms": float(np.percentile(latency, 50)),
+            "p95_ms": float(np.percentile(latency, 95)),
+            "p99_ms": float(np.percentile(latency, 99)),
+            "mean_ms": float(latency.mean()),
+            "throughput_rps": len(subset) / elapsed
+        }
+
+    summary = {"overall": stats(records)}
+    for endpoint in sorted({r[0] for r in records}):
+        summary[endpoint] = stats([r for r in records if r[0] == endpoint])
+    return summary
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def run(stations=200, trains=1000, rate=100.0, duration=10.0, reroute_share=0.3,
+        target="inprocess", url=None, serve=False, concurrency=32, seed=0):
+    network = synthetic_network(stations, seed=seed)
+    schedule = synthetic_schedule(network, trains, seed=seed)
+    scenario = disruption_scenario(network, schedule, int(rate * duration), reroute_share, seed=seed)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        schedule_path = os.path.join(workdir, "schedule.csv")
+        schedule.to_csv(schedule_path, index=False)
+        if target == "inprocess":
+            client = InProcessTarget(network, schedule_path)
+        elif serve:
+            client = serve_uvicorn(network, schedule_path, workdir)
+        else:
+            client = HttpTarget(url or "http://127.0.0.1:8000")
+        try:
+            records, elapsed = replay(client, scenario["requests"], rate, concurrency)
+            peak_memory = client.peak_memory_mb()
+        finally:
+            client.close()
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "target": target if target == "inprocess" or not serve else "uvicorn",
+            "stations": stations, "edges": network.edge_count, "trains": trains,
+            "rate": rate, "duration": duration, "reroute_share": reroute_share,
+            "concurrency": concurrency, "seed": seed, "epicentre": scenario["epicentre"]
+        },
+        "elapsed_seconds": elapsed,
+        "peak_memory_mb": peak_memory,
+        "results": summarize(records, elapsed)
+    }
+
+def compare(current, baseline):
+    """Print p95 and throughput changes against an earlier result file"""
+    print(f"vs {baseline['commit']} ({baseline['timestamp']}):")
+    for name, now in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        print(
+            f"{name:>15}: p95 {before['p95_ms']:.2f} -> {now['p95_ms']:.2f} ms "
+            f"({(now['p95_ms'] / before['p95_ms'] - 1) * 100:+.1f}%) | "
+            f"throughput {before['throughput_rps']:.1f} -> {now['throughput_rps']:.1f} rps"
+        )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=200)
+    parser.add_argument("--trains", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=100.0, help="requests per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of traffic")
+    parser.add_argument("--reroute-share", type=float, default=0.3)
+    parser.add_argument("--target", choices=("inprocess", "http"), default="inprocess")
+    parser.add_argument("--url", help="API base URL for --target http")
+    parser.add_argument("--serve", action="store_true", help="start a local uvicorn for --target http")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="result JSON path (default bench/results/simulator-<commit>.json)")
+    parser.add_argument("--compare", help="earlier result JSON to diff against")
+    args = parser.parse_args(argv)
+
+    result = run(
+        args.stations, args.trains, args.rate, args.duration, args.reroute_share,
+        args.target, args.url, args.serve, args.concurrency, args.seed
+    )
+    for name, r in result["results"].items():
+        print(
+            f"{name:>15}: {r['requests']} req, {r['errors']} errors | p50 {r['p50_ms']:.2f} "
+            f"p95 {r['p95_ms']:.2f} p99 {r['p99_ms']:.2f} ms | {r['throughput_rps']:.1f} rps"
+        )
+    if result["peak_memory_mb"] is not None:
+        print(f"peak memory: {result['peak_memory_mb']:.1f} MB")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"simulator-{result['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"saved {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+
+if __name__ == "__main__":
+    main()
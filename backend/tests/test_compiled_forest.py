@@ -0,0 +1,63 @@
+from sklearn.ensemble import RandomForestClassifier
+from app.compiled_forest import CompiledForest
+import numpy as np
+import pytest
+
+def _features(rng, n):
+    """Hour, weekday, weather and station codes like the delay model's, plus a continuous column"""
+    return np.column_stack([
+        rng.integers(0, 24, n), rng.integers(0, 7, n),
+        rng.integers(0, 4, n), rng.integers(0, 30, n), rng.normal(0, 50, n)
+    ]).astype(float)
+
+@pytest.fixture(scope="module", params=[
+    {"n_estimators": 50, "random_state": 42},
+    {"n_estimators": 20, "max_depth": 6, "class_weight": "balanced", "random_state": 1},
+    {"n_estimators": 30, "bootstrap": False, "min_samples_leaf": 3, "random_state": 2},
+], ids=["default", "shallow-weighted", "no-bootstrap"])
+def model(request):
+    rng = np.random.default_rng(0)
+    X = _features(rng, 3000)
+    score = 0.2 + 0.3 * (X[:, 2] > 1) + 0.2 * (X[:, 4] > 20)
+    # Three classes when the weighted forest is used, to cover multi-class leaves
+    classes = 3 if "class_weight" in request.param else 2
+    y = np.minimum((rng.random(len(X)) < score).astype(int) + (rng.random(len(X)) < 0.1), classes - 1)
+    return RandomForestClassifier(**request.param).fit(X, y)
+
+def _on_thresholds(model, rng, n):
+    """Rows whose values sit exactly on, or one float step either side of, split thresholds"""
+    tree = model.estimators_[0].tree_
+    internal = np.nonzero(tree.children_left != -1)[0]
+    rows = _features(rng, n)
+    nodes = rng.choice(internal, n)
+    values = tree.threshold[nodes]
+    values = np.where(rng.random(n) < 0.5, values, np.nextafter(values.astype(np.float32), rng.choice([-np.inf, np.inf], n)))
+    rows[np.arange(n), tree.feature[nodes]] = values
+    return rows
+
+def test_predict_proba_is_bit_exact(model):
+    compiled = CompiledForest.from_sklearn(model)
+    rng = np.random.default_rng(5)
+    for X in (_features(rng, 1), _features(rng, 1000), _on_thresholds(model, rng, 500)):
+        assert np.array_equal(compiled.predict_proba(X), model.predict_proba(X))
+    assert np.array_equal(compiled.classes_, model.classes_)
+
+def test_single_row_vector(model):
+    compiled = CompiledForest.from_sklearn(model)
+    X = _features(np.random.default_rng(6), 1)
+    assert np.array_equal(compiled.predict_proba(X[0]), model.predict_proba(X))
+
+def test_apply_reaches_sklearn_leaves(model):
+    compiled = CompiledForest.from_sklearn(model)
+    X = _on_thresholds(model, np.random.default_rng(7), 300)
+    leaves = compiled.apply(X) - compiled.roots[:, np.newaxis]
+    assert np.array_equal(leaves, model.apply(X).T)
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_saved_forest_predicts_the_same(model, tmp_path, mmap):
+    compiled = CompiledForest.from_sklearn(model)
+    compiled.save(str(tmp_path))
+    loaded = CompiledForest.load(str(tmp_path), mmap=mmap)
+    X = _features(np.random.default_rng(8), 200)
+    assert loaded.max_depth == compiled.max_depth
+    assert np.array_equal(loaded.predict_proba(X), model.predict_proba(X))
@@ -0,0 +1,60 @@
+from app.occupancy import IntervalIndex
+from app.schedule_table import MINUTES_PER_DAY
+import numpy as np
+import pytest
+
+@pytest.fixture(scope="module", params=[3, 11])
+def index(request):
+    """Random intervals, many overlapping, some running past midnight"""
+    rng = np.random.default_rng(request.param)
+    n = 400
+    start = rng.integers(0, MINUTES_PER_DAY, n)
+    # Repeated starts exercise ties in the sort order
+    start[::9] = start[1::9][:len(start[::9])]
+    end = start + rng.integers(1, 240, n)
+    return IntervalIndex(rng.integers(0, 6, n), start, end, np.arange(n), rng.integers(0, 2, n))
+
+def _queries(rng, count):
+    # Resource 9 holds nothing; minutes reach into the next-day copies
+    for _ in range(count):
+        start = int(rng.integers(0, MINUTES_PER_DAY + 300))
+        yield int(rng.choice([0, 1, 2, 3, 4, 5, 9])), start, start + int(rng.integers(1, 240))
+
+def test_overlapping_matches_scan(index):
+    rng = np.random.default_rng(0)
+    for resource, start, end in _queries(rng, 500):
+        expected = np.nonzero((index.resource == resource) & (index.start < end) & (index.end > start))[0]
+        assert np.array_equal(np.sort(index.overlapping(resource, start, end)), expected)
+
+def test_within_headway_matches_scan(index):
+    rng = np.random.default_rng(1)
+    for resource, entry, exit in _queries(rng, 500):
+        headway = int(rng.integers(1, 30))
+        before = index.start <= entry
+        close = np.where(
+            before,
+            (entry - index.start < headway) | (index.end > exit - headway),
+            (index.start - entry < headway) | (index.end < exit + headway)
+        )
+        expected = np.nonzero((index.resource == resource) & close)[0]
+        assert np.array_equal(index.within_headway(resource, entry, exit, headway), expected)
+
+@pytest.mark.parametrize("pad", [0, 5])
+@pytest.mark.parametrize("chunk", [1, 37, 100000])
+def test_pairs_match_scan(index, pad, chunk):
+    n = len(index.owner)
+    i, j = np.triu_indices(n, k=1)
+    keep = ((index.resource[i] == index.resource[j]) & (index.start[j] < index.end[i] + pad)
+            & ~(index.shadow[i] & index.shadow[j]))
+    expected = set(zip(i[keep].tolist(), j[keep].tolist()))
+    found = [pair for first, second in index.pairs(pad=pad, chunk=chunk) for pair in zip(first.tolist(), second.tolist())]
+    assert len(found) == len(set(found))
+    assert set(found) == expected
+
+def test_every_interval_has_a_next_day_copy(index):
+    assert len(index) * 2 == len(index.owner)
+    resource, start, end, owner, _ = index.raw
+    for shadow, offset in ((False, 0), (True, MINUTES_PER_DAY)):
+        rows = index.shadow == shadow
+        copies = sorted(zip(index.resource[rows], index.start[rows] - offset, index.end[rows] - offset, index.owner[rows]))
+        assert copies == sorted(zip(resource, start, end, owner))
@@ -0,0 +1,107 @@
+from app.models import get_rerouting_engine
+from app.occupancy import OccupancyIndex
+from app.propagation import (
+    DelayPropagator, MAX_CONNECTION_HOLD_MINUTES, MAX_PROPAGATED_DELAY_MINUTES, _CONNECTION
+)
+from app.schedule import ScheduleStore
+import numpy as np
+import pandas as pd
+import pytest
+
+def _labels(minutes):
+    return [f"{m // 60 % 24:02d}:{m % 60:02d}" for m in minutes]
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    """Occupancy index of a dense random timetable over the demo network"""
+    network = get_rerouting_engine().network
+    stations = list(network.stations)
+    rng = np.random.default_rng(7)
+    n = 600
+    source = rng.integers(0, len(stations), n)
+    destination = (source + rng.integers(1, len(stations), n)) % len(stations)
+    departure = rng.integers(0, 1440, n)
+    frame = pd.DataFrame({
+        "train_id": [f"TR{i:04d}" for i in range(n)],
+        "train_name": [f"Express {i}" for i in range(n)],
+        "source": [stations[i] for i in source],
+        "destination": [stations[i] for i in destination],
+        "scheduled_departure": _labels(departure),
+        "scheduled_arrival": _labels(departure + rng.integers(60, 400, n)),
+        "platform": rng.integers(1, 4, n),
+        "status": "On Time"
+    })
+    path = tmp_path_factory.mktemp("schedule") / "schedule.csv"
+    frame.to_csv(path, index=False)
+    snapshot = ScheduleStore(path=str(path)).refresh()
+    return OccupancyIndex(snapshot, network)
+
+def _propagator(index):
+    return DelayPropagator(index.snapshot, index.segments)
+
+def _naive(propagator, primary):
+    """Least fixed point of delay(v) = max(primary(v), pushed over each edge u -> v), by relaxation"""
+    delay = list(primary)
+    changed = True
+    while changed:
+        changed = False
+        for u, v, slack, kind in zip(propagator.source.tolist(), propagator.target.tolist(),
+                                     propagator.slack.tolist(), propagator.kind.tolist()):
+            pushed = delay[u] - slack
+            if kind == _CONNECTION:
+                pushed = min(pushed, MAX_CONNECTION_HOLD_MINUTES)
+            pushed = min(pushed, MAX_PROPAGATED_DELAY_MINUTES)
+            if pushed > delay[v]:
+                delay[v] = pushed
+                changed = True
+    return delay
+
+def _assert_causes(propagator):
+    """Every train's recorded cause is the edge (or own delay) that sets it"""
+    for v, e in enumerate(propagator.cause):
+        if e < 0:
+            assert propagator.delay[v] == propagator.primary[v]
+        else:
+            assert propagator.target[e] == v
+            assert propagator._push(propagator.delay[propagator.source[e]], e) == propagator.delay[v]
+
+def test_graph_has_every_dependency_kind(index):
+    counts = _propagator(index).dependency_counts()
+    assert all(counts.values())
+
+def test_incremental_apply_matches_full_propagation(index):
+    propagator = _propagator(index)
+    rng = np.random.default_rng(11)
+    # Updates hit a small pool of trains so delays are raised, lowered and cleared again
+    pool = rng.choice(propagator.n, 40, replace=False)
+    for step in range(150):
+        rows = rng.choice(pool, rng.integers(1, 4), replace=False)
+        minutes = rng.choice([0, 0, 5, 15, 30, 60, 120, 240], len(rows))
+        before = list(propagator.delay)
+        changed = propagator.apply({int(r): int(m) for r, m in zip(rows, minutes)})
+
+        assert propagator.delay == _naive(propagator, propagator.primary), f"step {step}"
+        fresh = _propagator(index)
+        fresh.apply({row: m for row, m in enumerate(propagator.primary) if m})
+        assert propagator.delay == fresh.delay, f"step {step}"
+        assert changed == {row: before[row] for row in range(propagator.n) if propagator.delay[row] != before[row]}
+        _assert_causes(propagator)
+
+def test_clearing_every_delay_resets_the_fleet(index):
+    propagator = _propagator(index)
+    rows = list(range(0, propagator.n, 7))
+    propagator.apply({row: 90 for row in rows})
+    assert propagator.summary()["knock_on_trains"] > 0
+    propagator.apply({row: 0 for row in rows})
+    assert propagator.delay == [0] * propagator.n
+    assert propagator.cause == [-1] * propagator.n
+
+def test_restore_undoes_a_what_if(index):
+    propagator = _propagator(index)
+    propagator.apply({3: 45, 10: 20})
+    saved, delay = propagator.state(), list(propagator.delay)
+    propagator.apply({3: 0, 50: 180})
+    propagator.restore(saved)
+    assert propagator.delay == delay
+    propagator.apply({10: 0})
+    assert propagator.delay == _naive(propagator, propagator.primary)
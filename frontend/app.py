@@ -1,8 +1,9 @@
 import streamlit as st
-import requests
 import pandas as pd
+import numpy as np
 from datetime import datetime
-import time
+from backend_client import BackendClient
+from live_feed import LiveTrainFeed
 
 # Configuration
 BACKEND_URL = "http://backend:8000"
@@ -29,18 +30,6 @@ st.markdown("""
         border-radius: 0.5rem;
         margin: 0.5rem 0;
     }
-    .delayed-train {
-        background-color: #ffebee;
-        padding: 1rem;
-        border-left: 5px solid #f44336;
-        margin: 0.5rem 0;
-    }
-    .on-time-train {
-        background-color: #e8f5e9;
-        padding: 1rem;
-        border-left: 5px solid #4caf50;
-        margin: 0.5rem 0;
-    }
     .rerouted-train {
         background-color: #fff3e0;
         padding: 1rem;
@@ -58,38 +47,87 @@ st.markdown("**Railway Automation System** | Delay Prediction & Intelligent Rero
 st.sidebar.title("⚙️ Control Panel")
 mode = st.sidebar.radio("Select Mode", ["Dashboard", "Delay Predictor", "Rerouting Engine", "Upload Schedule"])
 
-# Check backend health
-try:
-    health_response = requests.get(f"{BACKEND_URL}/health", timeout=5)
-    if health_response.status_code == 200:
-        st.sidebar.success("✅ Backend: Online")
-    else:
-        st.sidebar.error("❌ Backend: Error")
-except:
+# Columns of the train table, in display order (the live feed adds delay_minutes)
+TRAIN_COLUMNS = ["train_id", "train_name", "source", "destination", "scheduled_departure",
+                 "platform", "status", "delay_minutes"]
+
+@st.cache_resource
+def get_backend_client():
+    """One pooled, caching backend client per frontend process"""
+    return BackendClient(BACKEND_URL)
+
+@st.cache_resource
+def get_live_feed():
+    """One /trains/stream connection per frontend process, shared by every dashboard"""
+    return LiveTrainFeed(BACKEND_URL)
+
+client = get_backend_client()
+
+# Check backend health, readiness and model together (each cached for a few seconds)
+status = client.fetch_all(health=client.health, ready=client.readiness, model=client.model_info)
+if status["health"] == 200:
+    st.sidebar.success("✅ Backend: Online")
+elif status["health"] is not None:
+    st.sidebar.error("❌ Backend: Error")
+else:
     st.sidebar.error("❌ Backend: Offline")
+if status["ready"] is not None and not status["ready"]["ready"]:
+    st.sidebar.warning("⏳ Backend: Loading models")
+if status["model"] is not None:
+    st.sidebar.caption(f"🧠 Delay model: v{status['model']['version']}" if status["model"]["is_trained"]
+                       else "🧠 Delay model: rule-based")
+
+def train_table(df):
+    """Train list as one virtualized table, with a status icon column built for all rows at once"""
+    view = df[[c for c in TRAIN_COLUMNS if c in df.columns]].copy()
+    view.insert(0, "", np.where(view["status"] == "Delayed", "🔴", "🟢"))
+    st.dataframe(
+        view, use_container_width=True, hide_index=True,
+        column_config={
+            "train_id": "Train",
+            "train_name": "Name",
+            "source": "From",
+            "destination": "To",
+            "scheduled_departure": "Departure",
+            "platform": st.column_config.NumberColumn("Platform", format="%d"),
+            "status": "Status",
+            "delay_minutes": st.column_config.NumberColumn("Delay (min)", format="%d")
+        }
+    )
 
 # Mode 1: Dashboard
 if mode == "Dashboard":
     st.header("📊 Live Train Dashboard")
     
+    feed = get_live_feed()
+    metrics = feed.metrics()
+    # Card deltas are relative to this session's previous render
+    previous = st.session_state.get("dashboard_metrics", metrics)
+    st.session_state["dashboard_metrics"] = metrics
+    
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        st.metric("Total Trains", "50", "+5")
+        st.metric("Total Trains", metrics["total"], metrics["total"] - previous["total"])
     with col2:
-        st.metric("On Time", "40", "-2")
+        st.metric("On Time", metrics["on_time"], metrics["on_time"] - previous["on_time"])
     with col3:
-        st.metric("Delayed", "10", "+7")
+        st.metric("Delayed", metrics["delayed"], metrics["delayed"] - previous["delayed"])
     with col4:
-        st.metric("Avg Delay", "25 min", "+5 min")
+        st.metric("Avg Delay", f"{metrics['average_delay']} min",
+                  f"{metrics['average_delay'] - previous['average_delay']} min")
     
-    # Fetch trains
+    # Any interaction reruns the script and re-reads the feed
+    st.button("🔄 Refresh")
+    
+    # Trains from the live feed; the cached schedule stands in until it connects
     try:
-        response = requests.get(f"{BACKEND_URL}/trains")
-        if response.status_code == 200:
-            trains_data = response.json()["trains"]
-            df = pd.DataFrame(trains_data)
-            
+        df = feed.frame()
+        if df.empty and not feed.connected and status["health"] == 200:
+            df = pd.DataFrame(client.trains())
+        if df.empty:
+            st.info("Waiting for the live train feed..." if feed.connected else "Connecting to the live train feed...")
+        else:
             # Filter controls
             col1, col2 = st.columns(2)
             with col1:
@@ -102,30 +140,9 @@ if mode == "Dashboard":
             
             # Display trains
             st.subheader(f"🚆 Active Trains ({len(filtered_df)})")
-            
-            for idx, row in filtered_df.iterrows():
-                if row["status"] == "Delayed":
-                    css_class = "delayed-train"
-                    icon = "🔴"
-                else:
-                    css_class = "on-time-train"
-                    icon = "🟢"
-                
-                st.markdown(f"""
-                <div class="{css_class}">
-                    {icon} <strong>{row['train_id']}</strong> - {row['train_name']}<br>
-                    📍 {row['source']} → {row['destination']}<br>
-                    ⏰ Departure: {row['scheduled_departure']} | Platform: {row['platform']}
-                </div>
-                """, unsafe_allow_html=True)
-            
-            # Show dataframe
-            with st.expander("📋 View Full Schedule"):
-                st.dataframe(filtered_df, use_container_width=True)
-        else:
-            st.error("Failed to fetch train data")
+            train_table(filtered_df)
     except Exception as e:
-        st.error(f"Error connecting to backend: {str(e)}")
+        st.error(f"Error reading live train feed: {str(e)}")
 
 # Mode 2: Delay Predictor
 elif mode == "Delay Predictor":
@@ -144,8 +161,6 @@ elif mode == "Delay Predictor":
     
     if st.button("🔍 Predict Delay", type="primary"):
         with st.spinner("Analyzing train conditions..."):
-            time.sleep(1)
-            
             try:
                 payload = {
                     "train_id": train_id,
@@ -155,7 +170,7 @@ elif mode == "Delay Predictor":
                     "day_of_week": day_of_week
                 }
                 
-                response = requests.post(f"{BACKEND_URL}/predict_delay", json=payload)
+                response = client.post("/predict_delay", json=payload)
                 
                 if response.status_code == 200:
                     result = response.json()
@@ -196,8 +211,6 @@ elif mode == "Rerouting Engine":
     
     if st.button("🚀 Generate Rerouting Plan", type="primary"):
         with st.spinner("Computing optimal reroute..."):
-            time.sleep(1)
-            
             try:
                 payload = {
                     "delayed_train_id": delayed_train,
@@ -207,56 +220,107 @@ elif mode == "Rerouting Engine":
                     "available_routes": [r.strip() for r in available_routes.split(",")]
                 }
                 
-                response = requests.post(f"{BACKEND_URL}/reroute", json=payload)
+                response = client.post("/reroute", json=payload)
                 
                 if response.status_code == 200:
-                    result = response.json()
-                    
-                    st.success("✅ Rerouting Plan Generated!")
-                    
-                    # Recommended action
-                    st.markdown(f"### 🎯 Recommended Action")
-                    st.info(result['recommended_action'])
-                    
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.metric("Recovery Time", f"{result['estimated_recovery_time']} min")
-                    with col2:
-                        st.metric("Confidence Score", f"{result['confidence_score']*100:.0f}%")
-                    
-                    # Reroute path
-                    st.markdown("### 🗺️ Suggested Route")
-                    route_path = " → ".join(result['reroute_path'])
-                    st.success(route_path)
-                    
-                    # Alternative trains
-                    st.markdown("### 🚂 Alternative Trains")
-                    for train in result['alternative_trains']:
-                        st.markdown(f"""
-                        <div class="rerouted-train">
-                            🚆 <strong>{train['train_id']}</strong><br>
-                            ⏰ Departure: {train['departure_time']}<br>
-                            💺 Available Seats: {train['available_seats']}<br>
-                            🛤️ Route: {train['route']}
-                        </div>
-                        """, unsafe_allow_html=True)
-                    
-                    # Decision buttons
-                    st.markdown("### ✅ Dispatcher Decision")
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        if st.button("✅ Accept Reroute", key="accept"):
-                            st.success("Rerouting plan accepted!")
-                    with col2:
-                        if st.button("❌ Reject Reroute", key="reject"):
-                            st.warning("Rerouting plan rejected!")
-                    with col3:
-                        if st.button("⏸️ Hold for Review", key="hold"):
-                            st.info("Plan on hold for review")
+                    # Kept across reruns so the decision buttons below can act on it
+                    st.session_state["reroute_plan"] = response.json()
+                    st.session_state.pop("reroute_conflicts", None)
                 else:
+                    st.session_state.pop("reroute_plan", None)
                     st.error("Rerouting failed")
             except Exception as e:
                 st.error(f"Error: {str(e)}")
+    
+    result = st.session_state.get("reroute_plan")
+    if result is not None:
+        st.success("✅ Rerouting Plan Generated!")
+        
+        # Recommended action
+        st.markdown(f"### 🎯 Recommended Action")
+        st.info(result['recommended_action'])
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Recovery Time", f"{result['estimated_recovery_time']} min")
+        with col2:
+            st.metric("Confidence Score", f"{result['confidence_score']*100:.0f}%")
+        
+        # Reroute path
+        st.markdown("### 🗺️ Suggested Route")
+        route_path = " → ".join(result['reroute_path'])
+        st.success(route_path)
+        for route in result.get('alternative_routes', []):
+            st.markdown(f"**{route['rank']}.** {' → '.join(route['path'])} — "
+                        f"⏱️ {route['travel_time_minutes']} min running, ETA {route['eta']}")
+        
+        # Platform and track conflicts on the suggested route
+        conflicts = result.get('conflicts') or {}
+        for clash in conflicts.get('segments', []):
+            st.warning(f"⚠️ {clash['segment']} ({clash['entry']}-{clash['exit']}): "
+                       f"{clash['reason']} {clash['train']['train_id']}")
+        platform = conflicts.get('platform') or {}
+        if platform.get('platform') is not None:
+            st.info(f"🚉 Platform {platform['platform']} free at {platform['station']} on arrival ({conflicts['arrival_time']})")
+        elif platform.get('known_platforms'):
+            st.warning(f"⚠️ No free platform at {platform['station']} on arrival")
+        
+        # Alternative trains
+        st.markdown("### 🚂 Alternative Trains")
+        if not result['alternative_trains']:
+            st.info("No scheduled trains found in the next few hours")
+        for train in result['alternative_trains']:
+            seats = train.get('available_seats')
+            seats_line = f"💺 Available Seats: {seats}<br>" if seats is not None else ""
+            transfers = train.get('transfers', 0)
+            transfers_line = f"🔁 Transfers: {transfers}<br>" if transfers else ""
+            st.markdown(f"""
+            <div class="rerouted-train">
+                🚆 <strong>{train['train_id']}</strong><br>
+                ⏰ Departure: {train['departure_time']} | Arrival: {train.get('arrival_time', '-')}<br>
+                {seats_line}{transfers_line}
+                🛤️ Route: {train['route']}
+            </div>
+            """, unsafe_allow_html=True)
+        
+        # Decision buttons
+        st.markdown("### ✅ Dispatcher Decision")
+        pending = st.session_state.get("reroute_conflicts")
+        if pending is not None:
+            clashes = [f"{c['segment']}: {c['reason']} {c['train']['train_id']}" for c in pending.get('segments', [])]
+            platform = pending.get('platform') or {}
+            if platform.get('occupied_by'):
+                clashes.append(f"Platform at {platform['station']} held by "
+                               + ", ".join(t['train_id'] for t in platform['occupied_by']))
+            st.error("Reroute conflicts with scheduled traffic:\n\n" + "\n".join(f"- {c}" for c in clashes or ["No free platform"]))
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            # Forced only once the dispatcher has seen the conflicts and confirmed
+            confirming = st.session_state.get("reroute_conflicts") is not None
+            label = "⚠️ Accept Despite Conflicts" if confirming else "✅ Accept Reroute"
+            if st.button(label, key="accept"):
+                response = client.post("/reroute/accept", json={
+                    "delayed_train_id": result['delayed_train_id'],
+                    "reroute_path": result['reroute_path'],
+                    "force": confirming
+                })
+                if response.status_code == 200:
+                    st.session_state.pop("reroute_conflicts", None)
+                    client.invalidate("trains")
+                    st.success("Rerouting plan accepted!")
+                elif response.status_code == 409:
+                    st.session_state["reroute_conflicts"] = response.json()["detail"]
+                    st.rerun()
+                else:
+                    st.error(f"Error: {response.json().get('detail', response.text)}")
+        with col2:
+            if st.button("❌ Reject Reroute", key="reject"):
+                st.session_state.pop("reroute_plan", None)
+                st.session_state.pop("reroute_conflicts", None)
+                st.warning("Rerouting plan rejected!")
+        with col3:
+            if st.button("⏸️ Hold for Review", key="hold"):
+                st.info("Plan on hold for review")
 
 # Mode 4: Upload Schedule
 elif mode == "Upload Schedule":
@@ -265,13 +329,95 @@ elif mode == "Upload Schedule":
     uploaded_file = st.file_uploader("Upload CSV file", type=['csv'])
     
     if uploaded_file is not None:
-        df = pd.read_csv(uploaded_file)
-        st.success(f"✅ Uploaded {len(df)} train records")
-        
-        st.dataframe(df.head(10), use_container_width=True)
-        
-        if st.button("📊 Analyze Schedule"):
-            st.info("Schedule analysis coming soon...")
+        # Preview only; the backend parses the full file in chunks
+        preview = pd.read_csv(uploaded_file, nrows=10)
+        uploaded_file.seek(0)
+        st.dataframe(preview, use_container_width=True)
+
+        replace = st.checkbox("Replace the current schedule instead of merging")
+
+        if st.button("📥 Load Schedule"):
+            with st.spinner("Uploading and validating schedule..."):
+                try:
+                    # Large files take a while to validate; allow minutes, not seconds
+                    response = client.post(
+                        "/schedules/upload",
+                        params={"mode": "replace" if replace else "merge"},
+                        data=uploaded_file,
+                        headers={"Content-Type": "text/csv"},
+                        timeout=(3.05, 600)
+                    )
+
+                    if response.status_code == 200:
+                        client.invalidate("trains")
+                        result = response.json()
+                        st.success(f"✅ Loaded {result['rows_accepted']} trains "
+                                   f"(schedule now has {result['total_trains']})")
+
+                        col1, col2, col3 = st.columns(3)
+                        with col1:
+                            st.metric("Rows Read", result["rows_read"])
+                        with col2:
+                            st.metric("Invalid Rows", result["rows_invalid"])
+                        with col3:
+                            st.metric("Duplicates", result["rows_duplicate"])
+                    else:
+                        st.error(f"Error: {response.json().get('detail', response.text)}")
+                except Exception as e:
+                    st.error(f"Connection error: {str(e)}")
+
+        service_day = st.date_input("Service day (for files without a date column)", datetime.now().date())
+
+        if st.button("🗄️ Add to Delay History"):
+            with st.spinner("Archiving historical runs..."):
+                try:
+                    response = client.post(
+                        "/analytics/archive",
+                        params={"date": service_day.strftime("%Y-%m-%d")},
+                        data=uploaded_file,
+                        headers={"Content-Type": "text/csv"},
+                        timeout=(3.05, 600)
+                    )
+                    if response.status_code == 200:
+                        client.invalidate()
+                        result = response.json()
+                        st.success(f"✅ Archived {result['rows_archived']} runs over {len(result['days'])} days "
+                                   f"({result['rows_invalid']} invalid rows skipped)")
+                    else:
+                        st.error(f"Error: {response.json().get('detail', response.text)}")
+                except Exception as e:
+                    st.error(f"Connection error: {str(e)}")
+
+    # Aggregates over the archived delay history, from the backend's rollups
+    st.markdown("---")
+    if st.button("📊 Analyze Schedule"):
+        reports = client.fetch_all(
+            summary=client.analytics,
+            station_hour=lambda: client.analytics("station_hour", limit=20),
+            corridors=lambda: client.analytics("corridors", limit=10),
+            weekday=lambda: client.analytics("weekday")
+        )
+        summary = reports["summary"]
+        if None in reports.values():
+            st.error("Delay analytics unavailable")
+        elif not summary["days"]:
+            st.info("No delay history archived yet")
+        else:
+            st.subheader(f"📊 Delay History ({summary['start']} to {summary['end']})")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Days", summary["days"])
+            with col2:
+                st.metric("Runs", f"{summary['runs']:,}")
+            with col3:
+                st.metric("On Time", f"{summary['on_time_pct']}%")
+            
+            st.markdown("#### 📅 On-time by Weekday")
+            st.dataframe(pd.DataFrame(reports["weekday"]["rows"]), use_container_width=True, hide_index=True)
+            st.markdown("#### 🛤️ Worst Corridors")
+            st.dataframe(pd.DataFrame(reports["corridors"]["rows"]), use_container_width=True, hide_index=True)
+            st.markdown("#### 🕐 Delay Rate by Station and Hour")
+            st.dataframe(pd.DataFrame(reports["station_hour"]["rows"]), use_container_width=True, hide_index=True)
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,125 @@
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+import requests
+import threading
+import time
+
+# (connect, read) seconds; long-running calls pass their own
+DEFAULT_TIMEOUT = (3.05, 30)
+POOL_SIZE = 10
+
+HEALTH_TTL_SECONDS = 10.0
+TRAINS_TTL_SECONDS = 10.0
+MODEL_TTL_SECONDS = 30.0
+ANALYTICS_TTL_SECONDS = 60.0
+
+class BackendClient:
+    """
+    HTTP client for the backend, shared by every session of a frontend process.
+
+    Streamlit reruns the whole script on each click, so the client keeps one
+    pooled keep-alive session, puts a timeout on every call and caches the
+    read-mostly data (health, readiness, model info, the schedule) for a
+    few seconds. The schedule is revalidated with its ETag, so an unchanged
+    schedule costs a 304. `fetch_all` runs independent calls concurrently.
+    """
+
+    def __init__(self, base_url, pool_size=POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="backend-client")
+        # key -> (expires_at, value)
+        self._cache = {}
+        self._etags = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, f"{self.base_url}{path}", **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def _cached(self, key, ttl, fetch):
+        now = time.monotonic()
+        with self._lock:
+            hit = self._cache.get(key)
+        if hit is not None and hit[0] > now:
+            return hit[1]
+        value = fetch()
+        with self._lock:
+            self._cache[key] = (now + ttl, value)
+        return value
+
+    def invalidate(self, *keys):
+        """Drop cached entries (all of them if no keys are given)"""
+        with self._lock:
+            for key in keys or list(self._cache):
+                self._cache.pop(key, None)
+
+    def health(self):
+        """Health probe status code, None if the backend is unreachable"""
+        def fetch():
+            try:
+                return self.get("/health", timeout=5).status_code
+            except requests.RequestException:
+                return None
+        return self._cached("health", HEALTH_TTL_SECONDS, fetch)
+
+    def readiness(self):
+        """/ready body (its 503 still carries the component status), None if unreachable"""
+        def fetch():
+            try:
+                return self.get("/ready", timeout=5).json()
+            except (requests.RequestException, ValueError):
+                return None
+        return self._cached("ready", HEALTH_TTL_SECONDS, fetch)
+
+    def model_info(self):
+        """Active delay model version and metadata, None if unavailable"""
+        def fetch():
+            try:
+                response = self.get("/model", timeout=5)
+                return response.json() if response.status_code == 200 else None
+            except (requests.RequestException, ValueError):
+                return None
+        return self._cached("model", MODEL_TTL_SECONDS, fetch)
+
+    def trains(self):
+        """Active trains from GET /trains; unchanged schedules are revalidated with If-None-Match"""
+        def fetch():
+            with self._lock:
+                etag, trains = self._etags.get("trains", (None, []))
+            headers = {"If-None-Match": etag} if etag else {}
+            response = self.get("/trains", headers=headers)
+            if response.status_code == 304:
+                return trains
+            response.raise_for_status()
+            trains = response.json()["trains"]
+            with self._lock:
+                self._etags["trains"] = (response.headers.get("ETag"), trains)
+            return trains
+        return self._cached("trains", TRAINS_TTL_SECONDS, fetch)
+
+    def analytics(self, report=None, **params):
+        """/analytics summary, or one /analytics/{report}; None if unavailable"""
+        def fetch():
+            try:
+                response = self.get(f"/analytics/{report}" if report else "/analytics", params=params)
+                return response.json() if response.status_code == 200 else None
+            except (requests.RequestException, ValueError):
+                return None
+        key = ("analytics", report, tuple(sorted(params.items())))
+        return self._cached(key, ANALYTICS_TTL_SECONDS, fetch)
+
+    def fetch_all(self, **calls):
+        """Run independent zero-argument calls concurrently; returns {name: result}"""
+        futures = {name: self._executor.submit(call) for name, call in calls.items()}
+        return {name: future.result() for name, future in futures.items()}
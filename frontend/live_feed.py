@@ -0,0 +1,109 @@
+from collections import Counter
+import pandas as pd
+import requests
+import threading
+import json
+
+class LiveTrainFeed:
+    """
+    Background consumer of the backend's /trains/stream Server-Sent Events.
+
+    Holds the current trains by schedule key plus the dashboard counters
+    (total, per status, delay sum); each delta adjusts the counters for the
+    trains it touches instead of recomputing them over the whole table.
+    Reconnects (and receives a fresh snapshot) if the stream drops.
+    """
+
+    def __init__(self, backend_url, reconnect_delay=2.0):
+        self.url = f"{backend_url}/trains/stream"
+        self.reconnect_delay = reconnect_delay
+        self.connected = False
+        self.seq = None
+        self._trains = {}
+        self._by_status = Counter()
+        self._delay_total = 0
+        self._delayed = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="live-train-feed", daemon=True)
+        self._thread.start()
+
+    def _add(self, train):
+        self._trains[train["key"]] = train
+        self._by_status[train["status"]] += 1
+        if train["delay_minutes"] > 0:
+            self._delay_total += train["delay_minutes"]
+            self._delayed += 1
+
+    def _remove(self, key):
+        train = self._trains.pop(key, None)
+        if train is None:
+            return
+        self._by_status[train["status"]] -= 1
+        if train["delay_minutes"] > 0:
+            self._delay_total -= train["delay_minutes"]
+            self._delayed -= 1
+
+    def _apply(self, event, payload):
+        with self._lock:
+            if event == "snapshot":
+                self._trains.clear()
+                self._by_status.clear()
+                self._delay_total = 0
+                self._delayed = 0
+                for train in payload["trains"]:
+                    self._add(train)
+            elif event == "delta":
+                for key in payload["removed"]:
+                    self._remove(key)
+                for train in payload["changes"] + payload["added"]:
+                    self._remove(train["key"])
+                    self._add(train)
+            self.seq = payload["seq"]
+
+    def _consume(self, lines):
+        event, data = None, []
+        for line in lines:
+            if line == "":
+                if event and data:
+                    self._apply(event, json.loads("\n".join(data)))
+                event, data = None, []
+            elif line.startswith(":"):
+                continue
+            elif line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data.append(line[len("data:"):].strip())
+            if self._stop.is_set():
+                return
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                # Read timeout well above the server's keep-alive interval
+                with requests.get(self.url, stream=True, timeout=(5, 60)) as response:
+                    response.raise_for_status()
+                    self.connected = True
+                    self._consume(response.iter_lines(decode_unicode=True))
+            except (requests.RequestException, ValueError):
+                pass
+            self.connected = False
+            self._stop.wait(self.reconnect_delay)
+
+    def stop(self):
+        self._stop.set()
+
+    def metrics(self):
+        """Current dashboard counters"""
+        with self._lock:
+            return {
+                "total": len(self._trains),
+                "on_time": self._by_status.get("On Time", 0),
+                "delayed": self._by_status.get("Delayed", 0),
+                "average_delay": round(self._delay_total / self._delayed) if self._delayed else 0
+            }
+
+    def frame(self):
+        """Current trains as a DataFrame"""
+        with self._lock:
+            return pd.DataFrame(list(self._trains.values()))